@@ -0,0 +1,117 @@
+"""
+Archiving of old transactions.
+
+Transactions are moved out of the database into gzipped JSON lines files, one
+transaction per line in the same format as Django's JSON serializer.  Rows are
+processed in small batches ordered by primary key: each batch is written and
+synced to the archive file before it is deleted, so no batch holds locks for
+long and nothing is deleted until it has been archived.
+
+Each run writes a new archive file.  It is written as ``<path>.part`` and
+only renamed into place once every batch has been archived, so an archive
+file under its final name is always complete.  If a run is interrupted the
+``.part`` file holds the transactions that were deleted before it stopped:
+it is a valid gzip file up to the last synced batch and must not be removed.
+"""
+import datetime
+import errno
+import gzip
+import os
+import time
+
+from django.core import serializers
+from django.db.models import Q
+from django.utils.timezone import now
+
+from . import config, gateway, models, wrappers
+
+# Transactions that a later request may need to look up
+FOLLOW_UP_TX_TYPES = (gateway.TXTYPE_AUTHENTICATE, gateway.TXTYPE_AUTHORISE)
+FOLLOW_UP_STATUSES = (wrappers.Response.OK, wrappers.Response.OK_REPEATED,
+                      wrappers.Response.REGISTERED)
+
+
+def archivable(days=None, follow_up_days=None):
+    """
+    Return a queryset of the transactions that can be archived.
+
+    Transactions are archivable once they are ``days`` old, except for
+    successful AUTHENTICATE and AUTHORISE transactions which are kept until
+    they are ``follow_up_days`` old (or forever if that is None).
+    """
+    if days is None:
+        days = config.ARCHIVE_AFTER_DAYS
+    if follow_up_days is None:
+        follow_up_days = config.ARCHIVE_FOLLOW_UP_DAYS
+    current = now()
+    qs = models.RequestResponse.objects.filter(
+        request_datetime__lt=current - datetime.timedelta(days=days))
+    follow_ups = Q(tx_type__in=FOLLOW_UP_TX_TYPES,
+                   status__in=FOLLOW_UP_STATUSES)
+    if follow_up_days is not None:
+        follow_ups &= Q(request_datetime__gte=(
+            current - datetime.timedelta(days=follow_up_days)))
+    return qs.exclude(follow_ups)
+
+
+def archive(qs, fileobj, batch_size=None, progress=None):
+    """
+    Write the transactions of the passed queryset to ``fileobj`` and delete
+    them, returning the number archived.
+
+    ``progress`` is called after each batch with the number of transactions
+    archived so far and the number of seconds elapsed.
+    """
+    batch_size = batch_size or config.ARCHIVE_BATCH_SIZE
+    start = time.time()
+    num_archived = 0
+    last_pk = 0
+    while True:
+        batch = list(qs.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+        if not batch:
+            break
+        for txn in batch:
+            fileobj.write(serializers.serialize('json', [txn]))
+            fileobj.write('\n')
+        _sync(fileobj)
+        pks = [txn.pk for txn in batch]
+        models.RequestResponse.objects.filter(pk__in=pks).delete()
+        num_archived += len(batch)
+        last_pk = pks[-1]
+        if progress is not None:
+            progress(num_archived, time.time() - start)
+    return num_archived
+
+
+def archive_to_file(path, qs, batch_size=None, progress=None):
+    """
+    Archive the transactions of the passed queryset to a new gzipped JSON
+    lines file.
+
+    Raises IOError if the file, or the ``.part`` file of an interrupted run,
+    already exists.
+    """
+    part_path = path + '.part'
+    for existing in (path, part_path):
+        if os.path.exists(existing):
+            raise IOError(errno.EEXIST, "Archive file already exists",
+                          existing)
+    # O_EXCL so that two concurrent runs can't write to the same file
+    fd = os.open(part_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    with os.fdopen(fd, 'wb') as f:
+        with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+            num_archived = archive(qs, gz, batch_size, progress)
+        _sync(f)
+    if os.path.exists(path):
+        raise IOError(errno.EEXIST, "Archive file already exists", path)
+    os.rename(part_path, path)
+    return num_archived
+
+
+def _sync(fileobj):
+    fileobj.flush()
+    if isinstance(fileobj, gzip.GzipFile):
+        fileobj = fileobj.fileobj
+        fileobj.flush()
+    if hasattr(fileobj, 'fileno'):
+        os.fsync(fileobj.fileno())
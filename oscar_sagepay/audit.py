@@ -0,0 +1,322 @@
+"""
+Backends for recording the audit trail of requests made to Sagepay.
+
+The backend is selected with the ``OSCAR_SAGEPAY_AUDIT_BACKEND`` setting:
+
+- ``oscar_sagepay.audit.DatabaseBackend`` (the default) writes each request
+  to the database before it is sent and updates it with the response.
+
+- ``oscar_sagepay.audit.BufferedBackend`` hands completed records to a
+  background thread which writes them to the database in batches.  Records
+  are appended to a local spill file (one per process) before being queued
+  so they survive the process crashing before they reach the database.
+
+Spill files are named by the process token (see ``oscar_sagepay.processes``)
+of the process that owns them.  A process recovering the file of a dead one
+first claims it by renaming it to a name that it owns, so that no two
+processes replay the same file.  Recovery is done by the writer thread when
+it starts, so no request waits for it.
+
+A batch that can't be written is retried one record at a time, so that a
+single bad record doesn't stop the rest of the batch being written.
+"""
+import atexit
+import glob
+import importlib
+import logging
+import os
+import threading
+import time
+import uuid
+
+from django.core import serializers
+from django.db import connection
+from six.moves import queue
+
+from . import config, models, processes
+
+logger = logging.getLogger('oscar.sagepay')
+
+_backend = None
+
+
+def get_backend():
+    """
+    Return the configured audit backend
+    """
+    global _backend
+    if _backend is None:
+        module_path, class_name = config.AUDIT_BACKEND.rsplit('.', 1)
+        module = importlib.import_module(module_path)
+        _backend = getattr(module, class_name)()
+    return _backend
+
+
+class DatabaseBackend(object):
+    """
+    Write audit records directly to the database
+    """
+
+    def record_request(self, reference, params):
+        """
+        Record a request that is about to be sent and return the audit
+        instance
+        """
+        return models.RequestResponse.new(reference, params)
+
+    def record_response(self, rr, response, timeout=None):
+        """
+        Record the response to a request.
+
+        ``timeout`` is the number of seconds left before the deadline of the
+        request, if it has one.  Backends should avoid waiting longer than
+        that where they can, but must still record the response.
+        """
+        rr.record_response(response)
+        rr.save_response()
+
+    def record_error(self, rr, timeout=None):
+        """
+        Record that no response was received for a request
+        """
+        # Keep the details of any retried attempts
+        rr.save_response()
+
+
+class BufferedBackend(DatabaseBackend):
+    """
+    Write audit records to the database from a background thread.
+
+    Records are written with ``bulk_create`` once ``batch_size`` records are
+    waiting or ``flush_interval`` seconds have passed.  At most
+    ``max_size`` records are held in memory: when the buffer is full,
+    callers wait up to ``put_timeout`` seconds for space before writing the
+    record to the database themselves.
+    """
+
+    def __init__(self, spill_path=None, max_size=None, batch_size=None,
+                 flush_interval=None, put_timeout=None):
+        self.spill_path = spill_path or config.AUDIT_SPILL_PATH
+        self.max_size = max_size or config.AUDIT_BUFFER_SIZE
+        self.batch_size = batch_size or config.AUDIT_BATCH_SIZE
+        self.flush_interval = flush_interval or config.AUDIT_FLUSH_INTERVAL
+        self.put_timeout = put_timeout or config.AUDIT_PUT_TIMEOUT
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._pid = None
+        self._spill_file = None
+        self._queue = None
+        self._thread = None
+        self._stopping = False
+        # Number of spilled records that haven't been written to the database
+        # yet
+        self._pending = 0
+        # Whether there are spill files of batches that failed to be written
+        self._failed = False
+        atexit.register(self.stop)
+
+    def record_request(self, reference, params):
+        rr = models.RequestResponse(reference=reference)
+        rr.record_request(params)
+        return rr
+
+    def record_response(self, rr, response, timeout=None):
+        rr.record_response(response)
+        self.put(rr, timeout)
+
+    def record_error(self, rr, timeout=None):
+        self.put(rr, timeout)
+
+    def put(self, rr, timeout=None):
+        self._ensure_started()
+        with self._spill_lock:
+            self._spill([rr])
+            self._pending += 1
+        if timeout is None:
+            timeout = self.put_timeout
+        try:
+            self._queue.put(rr, timeout=min(timeout, self.put_timeout))
+        except queue.Full:
+            # The database isn't keeping up so write this record ourselves.
+            logger.warning("Audit buffer full, writing %s directly",
+                           rr.vendor_tx_code)
+            rr.save()
+            self._written(1)
+
+    def flush(self):
+        """
+        Block until all queued records have been written
+        """
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def stop(self):
+        """
+        Write any queued records and stop the writer thread
+        """
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stopping = True
+        self._thread.join()
+        self._thread = None
+
+    def recover(self):
+        """
+        Write any records left in spill files by processes that have died to
+        the database.
+        """
+        prefix = '%s.' % self.spill_path
+        for path in glob.glob('%s*' % prefix):
+            owner = path[len(prefix):].split('.', 1)[0]
+            if processes.parse(owner) is None or processes.is_alive(owner):
+                continue
+            claimed = self._new_spill_file('recover')
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                # Claimed by another process
+                continue
+            try:
+                self._recover_file(claimed)
+            except Exception:
+                logger.exception("Unable to recover audit records from %s",
+                                 claimed)
+                # Replay it along with this process's own failed records
+                os.rename(claimed, self._new_spill_file('failed'))
+                self._failed = True
+
+    def _new_spill_file(self, kind):
+        return '%s.%s.%s-%s' % (self.spill_path, processes.token(), kind,
+                                uuid.uuid4().hex)
+
+    def _recover_file(self, path):
+        with open(path) as f:
+            records = [obj.object for line in f if line.strip()
+                       for obj in serializers.deserialize('json', line)]
+        # Some records may have been written before the crash
+        existing = set(models.RequestResponse.objects.filter(
+            vendor_tx_code__in=[r.vendor_tx_code for r in records]
+        ).values_list('vendor_tx_code', 'tx_type'))
+        records = [r for r in records
+                   if (r.vendor_tx_code, r.tx_type) not in existing]
+        if records:
+            logger.info("Recovering %d audit records from %s",
+                        len(records), path)
+            failed = self._save(records)
+            if len(failed) == len(records):
+                raise IOError("No audit records from %s could be written" %
+                              path)
+            if failed:
+                # Keep the records that couldn't be written, to be replayed
+                # after the next batch that fails
+                self._spill_to(self._new_spill_file('failed'), failed)
+        os.remove(path)
+
+    def _save(self, records):
+        """
+        Write records to the database, returning those that couldn't be
+        written.  If they can't be written in one batch they are written one
+        at a time.
+        """
+        try:
+            models.RequestResponse.objects.bulk_create(records)
+            return []
+        except Exception:
+            logger.exception("Unable to write %d audit records",
+                             len(records))
+        if len(records) == 1:
+            return records
+        failed = []
+        for rr in records:
+            try:
+                rr.save()
+            except Exception:
+                logger.exception("Unable to write audit record %s",
+                                 rr.vendor_tx_code)
+                failed.append(rr)
+        return failed
+
+    def _ensure_started(self):
+        # The writer thread doesn't survive a fork so each process needs its
+        # own, along with its own spill file.
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid != pid or self._thread is None:
+                self._spill_file = '%s.%s' % (
+                    self.spill_path, processes.token(pid))
+                self._pending = 0
+                self._failed = False
+                self._queue = queue.Queue(self.max_size)
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+                self._pid = pid
+
+    def _spill(self, records):
+        self._spill_to(self._spill_file, records)
+
+    def _spill_to(self, path, records):
+        with open(path, 'a') as f:
+            for rr in records:
+                f.write(serializers.serialize('json', [rr]))
+                f.write('\n')
+
+    def _run(self):
+        try:
+            self.recover()
+        except Exception:
+            logger.exception("Unable to recover audit records")
+        finally:
+            connection.close()
+        while not (self._stopping and self._queue.empty()):
+            batch = []
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        try:
+            if self._save(batch):
+                # Keep the spill file, which holds the failed records, to be
+                # replayed once the database is back, and start a new one.
+                with self._spill_lock:
+                    if os.path.exists(self._spill_file):
+                        os.rename(self._spill_file,
+                                  self._new_spill_file('failed'))
+                    self._failed = True
+            elif self._failed:
+                self._replay_failed()
+        finally:
+            self._written(len(batch))
+            for __ in batch:
+                self._queue.task_done()
+            connection.close()
+
+    def _replay_failed(self):
+        self._failed = False
+        pattern = '%s.%s.failed-*' % (self.spill_path, processes.token())
+        for path in glob.glob(pattern):
+            try:
+                self._recover_file(path)
+            except Exception:
+                logger.exception("Unable to replay audit records from %s",
+                                 path)
+                self._failed = True
+
+    def _written(self, num_records):
+        with self._spill_lock:
+            self._pending -= num_records
+            # Everything in this process's own spill file has been written
+            if self._pending == 0 and os.path.exists(self._spill_file):
+                open(self._spill_file, 'w').close()
@@ -1,4 +1,14 @@
+import re
+
+import six
 from six.moves import map
+
+# NumPy is optional - it is used to speed up batch validation if installed
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 VISA, VISA_ELECTRON, MASTERCARD, AMEX, MAESTRO, DISCOVER = (
     'Visa', 'Visa Electron', 'Mastercard', 'American Express',
     'Maestro', 'Discover')
@@ -19,7 +29,7 @@ CARD_TYPES = [
     (DISCOVER, (16,),
      list(map(str, list(range(622126, 622926)))) +
      list(map(str, list(range(644, 650)))) + ['6011', '65']),
-    (JCB, (16,), map(str, list(range(3528, 3590)))),
+    (JCB, (16,), list(map(str, list(range(3528, 3590))))),
     (LASER, list(range(16, 20)), ('6304', '6706', '6771', '6709')),
     (MAESTRO, list(range(12, 20)), ('5018', '5020', '5038', '5893', '6304',
                                     '6759', '6761', '6762', '6763', '0604')),
@@ -40,22 +50,54 @@ def is_amex(number):
     return bankcard_type(number) == AMEX
 
 
+class BankcardIndex(object):
+    """
+    Index of card type rules for fast lookup of a card number's type.
+
+    Rules are keyed by (prefix, card number length) so a lookup only needs
+    one dictionary access per distinct prefix length rather than a scan of
+    every prefix.  Where several rules match, the one listed first in the
+    passed rules wins, as with a linear scan.
+    """
+
+    def __init__(self, card_types):
+        self._rules = {}
+        prefix_lengths = set()
+        for priority, (card_type, lengths, prefixes) in enumerate(card_types):
+            for prefix in prefixes:
+                prefix_lengths.add(len(prefix))
+                for length in lengths:
+                    key = (prefix, length)
+                    if key not in self._rules:
+                        self._rules[key] = (priority, card_type)
+        self._prefix_lengths = sorted(prefix_lengths)
+
+    def lookup(self, card_number):
+        """
+        Return the type of the passed card number, or None if not recognised
+        """
+        length = len(card_number)
+        match = None
+        for prefix_length in self._prefix_lengths:
+            if prefix_length > length:
+                break
+            rule = self._rules.get((card_number[:prefix_length], length))
+            if rule is not None and (match is None or rule < match):
+                match = rule
+        if match is not None:
+            return match[1]
+
+
+_INDEX = BankcardIndex(CARD_TYPES)
+
+
 def bankcard_type(card_number):
     """
     Return the type of a bankcard based on its card_number.
 
     Returns None is the card_number is not recognised.
     """
-    def matches(card_number, lengths, prefixes):
-        if len(card_number) not in lengths:
-            return False
-        for prefix in prefixes:
-            if card_number.startswith(prefix):
-                return True
-        return False
-    for card_type, lengths, prefixes in CARD_TYPES:
-        if matches(card_number, lengths, prefixes):
-            return card_type
+    return _INDEX.lookup(card_number)
 
 
 def luhn(card_number):
@@ -76,3 +118,65 @@ def luhn(card_number):
         sum = sum + digit
 
     return (sum % 10) == 0
+
+
+# Sum of the digits of 2 * n for each digit n
+_DOUBLED_DIGIT_SUMS = (0, 2, 4, 6, 8, 1, 3, 5, 7, 9)
+
+# ASCII digits only, as isdigit() also accepts other Unicode digits
+_DIGITS = re.compile(r'[0-9]*\Z')
+
+
+def luhn_many(card_numbers):
+    """
+    Test whether each of a sequence of bankcard numbers passes the Luhn
+    algorithm, returning a list of booleans.
+
+    Numbers that contain anything other than the ASCII digits are not valid,
+    and an empty number is valid, as for ``luhn``.  If NumPy is installed,
+    numbers of the same length are checked together as a single array
+    operation.
+    """
+    card_numbers = [
+        number if isinstance(number, six.string_types) else str(number)
+        for number in card_numbers]
+    if numpy is None:
+        return [_luhn(number) for number in card_numbers]
+
+    results = [False] * len(card_numbers)
+    by_length = {}
+    for i, number in enumerate(card_numbers):
+        if not number:
+            results[i] = True
+        elif _DIGITS.match(number):
+            by_length.setdefault(len(number), []).append(i)
+    for length, indexes in by_length.items():
+        digits = numpy.frombuffer(
+            ''.join(card_numbers[i] for i in indexes).encode('ascii'),
+            dtype=numpy.uint8).reshape(-1, length) - ord('0')
+        # Every second digit, counting from the right-most, is doubled
+        doubled = numpy.arange(length)[::-1] % 2 == 1
+        digits = digits.astype(numpy.int64)
+        digits[:, doubled] = numpy.take(_DOUBLED_DIGIT_SUMS, digits[:, doubled])
+        valid = digits.sum(axis=1) % 10 == 0
+        for i, is_valid in zip(indexes, valid.tolist()):
+            results[i] = is_valid
+    return results
+
+
+def _luhn(card_number):
+    if not _DIGITS.match(card_number):
+        return False
+    total = 0
+    for i, digit in enumerate(reversed(card_number)):
+        digit = ord(digit) - 48
+        total += _DOUBLED_DIGIT_SUMS[digit] if i & 1 else digit
+    return total % 10 == 0
+
+
+def bankcard_types(card_numbers):
+    """
+    Return the type of each of a sequence of bankcard numbers
+    """
+    lookup = _INDEX.lookup
+    return [lookup(str(number)) for number in card_numbers]
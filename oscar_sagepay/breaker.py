@@ -0,0 +1,116 @@
+"""
+A circuit breaker for requests to Sagepay.
+
+Each endpoint URL has its own breaker.  Failures (connection errors, HTTP
+errors and responses slower than the slow threshold) are counted, and once
+there have been ``failure_threshold`` failures within ``failure_window``
+seconds the breaker opens: requests fail immediately with ``CircuitOpen``
+for ``reset_timeout`` seconds.  After that the breaker is half-open and a
+single probe request is let through at a time; a successful probe closes the
+breaker while a failed one opens it again.
+
+State is kept in the Django cache so that it is shared by every process that
+uses the same cache.  Counters are updated with ``add`` and ``incr``, which
+are atomic with memcached and redis.
+"""
+import hashlib
+
+from . import config
+
+try:
+    from django.core.cache import caches
+except ImportError:
+    # Django < 1.7
+    from django.core.cache import get_cache
+else:
+    def get_cache(alias):
+        return caches[alias]
+
+# How long a half-open breaker lets a single probe run before allowing
+# another
+PROBE_TIMEOUT = 60
+
+# How long a breaker stays half-open (rather than closed) after it has opened
+# if no request is made
+TRIPPED_TIMEOUT = 24 * 60 * 60
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, url, cache=None, failure_threshold=None,
+                 failure_window=None, slow_threshold=None,
+                 reset_timeout=None):
+        self.url = url
+        self.cache = cache or get_cache(config.BREAKER_CACHE)
+        self.failure_threshold = (
+            failure_threshold or config.BREAKER_FAILURE_THRESHOLD)
+        self.failure_window = failure_window or config.BREAKER_FAILURE_WINDOW
+        self.slow_threshold = slow_threshold or config.BREAKER_SLOW_THRESHOLD
+        self.reset_timeout = reset_timeout or config.BREAKER_RESET_TIMEOUT
+        prefix = 'oscar_sagepay:breaker:%s:' % hashlib.md5(url).hexdigest()
+        self._failures_key = prefix + 'failures'
+        self._open_key = prefix + 'open'
+        self._tripped_key = prefix + 'tripped'
+        self._probe_key = prefix + 'probe'
+
+    @property
+    def is_open(self):
+        return bool(self.cache.get(self._open_key))
+
+    def allow(self):
+        """
+        Return whether a request may be sent
+        """
+        is_open, tripped = self._get(self._open_key, self._tripped_key)
+        if is_open:
+            return False
+        if tripped:
+            # Half-open: only the first caller gets to send a probe
+            return self.cache.add(self._probe_key, True, PROBE_TIMEOUT)
+        return True
+
+    def record(self, duration):
+        """
+        Record a request that received a response after ``duration`` seconds
+        """
+        if duration > self.slow_threshold:
+            self.failure()
+        else:
+            self.success()
+
+    def success(self):
+        failures, tripped = self._get(self._failures_key, self._tripped_key)
+        # Avoid writing to the cache for every request
+        if failures or tripped:
+            self.cache.delete_many([
+                self._failures_key, self._tripped_key, self._probe_key])
+
+    def failure(self):
+        self.cache.add(self._failures_key, 0, self.failure_window)
+        try:
+            failures = self.cache.incr(self._failures_key)
+        except ValueError:
+            # The key expired in the meantime
+            self.cache.add(self._failures_key, 1, self.failure_window)
+            failures = 1
+        tripped = self.cache.get(self._tripped_key)
+        if failures >= self.failure_threshold or tripped:
+            self.cache.set(self._open_key, True, self.reset_timeout)
+            self.cache.set(self._tripped_key, True, TRIPPED_TIMEOUT)
+            self.cache.delete(self._probe_key)
+
+    def _get(self, *keys):
+        values = self.cache.get_many(keys)
+        return [values.get(key) for key in keys]
+
+
+_breakers = {}
+
+
+def get_breaker(url):
+    """
+    Return the circuit breaker for an endpoint URL
+    """
+    if url not in _breakers:
+        _breakers[url] = CircuitBreaker(url)
+    return _breakers[url]
@@ -0,0 +1,524 @@
+"""
+APIs for running large numbers of follow-up transactions, such as releasing
+AUTHENTICATEd orders at dispatch time or refunding orders after a recall.
+
+Transactions are sent concurrently by a bounded pool of worker threads.
+Progress can be recorded in a checkpoint file so that an interrupted run can
+be resumed without sending any transaction twice.
+
+Items are marked as in flight in the checkpoint before they are sent.  When
+a run is resumed, items that were in flight when it was interrupted are
+looked up in the transactions recorded by the gateway; those that can't be
+found are reported as needing reconciliation rather than being sent again.
+
+When the caller stops iterating over the results, workers finish the
+request they are sending but don't start any more.
+"""
+import collections
+import csv
+import datetime
+import logging
+import os
+import threading
+import time
+from decimal import Decimal as D
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from oscar.apps.payment import exceptions as oscar_exceptions
+
+from . import config, facade, gateway, models, wrappers
+
+logger = logging.getLogger('oscar.sagepay')
+
+# The outcome of a single item of a bulk run.  On success, ``value`` is the TX
+# ID of the new transaction; on failure, ``error`` is the error message.
+Result = collections.namedtuple(
+    'Result', ('tx_id', 'success', 'value', 'error'))
+
+# Number of TX IDs to look up in a single query
+LOOKUP_CHUNK_SIZE = 500
+
+
+# Error for items that may have been sent by an interrupted run
+IN_FLIGHT_ERROR = ("Interrupted while in flight and no transaction was "
+                   "recorded; reconcile with Sagepay before retrying")
+
+# Error for items with an unexpected error, which may have been sent
+UNEXPECTED_ERROR = ("Unexpected error (%s); reconcile with Sagepay before "
+                    "retrying")
+
+# Error for REFUNDs that are already recorded but weren't sent by this run
+ALREADY_REFUNDED_ERROR = ("Already refunded by REFUND %s, which wasn't sent "
+                          "by this run; not sent")
+
+# Allowance for databases that don't store the microseconds of a
+# transaction's request_datetime
+CLOCK_SLACK = datetime.timedelta(seconds=1)
+
+# States of the items in a checkpoint
+STARTED, DONE = 'started', 'done'
+
+
+class Checkpoint(object):
+    """
+    A file-backed log of the items of a bulk run that have been started and
+    completed.
+
+    Each item is appended (and flushed to disk) before it is sent, with the
+    time it was started, and again once it finishes, so the log survives the
+    process being killed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._done = {}
+        self._started = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    line = line.rstrip('\n')
+                    if not line:
+                        continue
+                    fields = line.split('\t')
+                    if len(fields) == 2:
+                        # Written before items were marked as started
+                        fields.insert(1, DONE)
+                    key, state, value = fields
+                    if state == STARTED:
+                        self._started[key] = value
+                    else:
+                        self._done[key] = value
+
+    def __contains__(self, key):
+        return key in self._done
+
+    def __len__(self):
+        return len(self._done)
+
+    def get(self, key):
+        return self._done.get(key)
+
+    def values(self):
+        """
+        Return the values of the completed items
+        """
+        return self._done.values()
+
+    def in_flight(self, key):
+        """
+        Return whether an item was started but not completed
+        """
+        return key in self._started and key not in self._done
+
+    def started(self, key):
+        """
+        Return the datetime at which an item was last started, or None if it
+        wasn't started or was started before start times were recorded
+        """
+        value = self._started.get(key)
+        if not value:
+            return None
+        if settings.USE_TZ:
+            return datetime.datetime.fromtimestamp(float(value), timezone.utc)
+        return datetime.datetime.fromtimestamp(float(value))
+
+    def start(self, key):
+        value = '%.6f' % time.time()
+        self._write(key, STARTED, value)
+        self._started[key] = value
+
+    def mark(self, key, value):
+        self._write(key, DONE, value)
+        self._done[key] = value
+
+    def _write(self, key, state, value):
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write('%s\t%s\t%s\n' % (key, state, value))
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def read_csv(fileobj):
+    """
+    Read (tx_id, amount) pairs from a CSV file.  The amount column is
+    optional.
+    """
+    for row in csv.reader(fileobj):
+        if not row or not row[0].strip() or row[0].startswith('#'):
+            continue
+        amount = None
+        if len(row) > 1 and row[1].strip():
+            amount = D(row[1].strip())
+        yield row[0].strip(), amount
+
+
+def _normalise(items):
+    """
+    Convert the passed items into a list of (tx_id, amount) pairs, and a dict
+    of any RequestResponse instances that were passed directly (eg from a
+    queryset).
+    """
+    pairs, txns = [], {}
+    for item in items:
+        if isinstance(item, models.RequestResponse):
+            pairs.append((item.tx_id, None))
+            txns[item.tx_id] = item
+        elif isinstance(item, (tuple, list)):
+            pairs.append((item[0], item[1]))
+        else:
+            pairs.append((item, None))
+    return pairs, txns
+
+
+def _existing(tx_ids, tx_type):
+    """
+    Return a dict mapping TX ID to a list of (amount, TX ID, request
+    datetime) tuples of the successful transactions of ``tx_type`` recorded
+    against it, oldest first
+    """
+    existing = collections.defaultdict(list)
+    tx_ids = list(tx_ids)
+    for i in range(0, len(tx_ids), LOOKUP_CHUNK_SIZE):
+        rows = models.RequestResponse.objects.filter(
+            related_tx_id__in=tx_ids[i:i + LOOKUP_CHUNK_SIZE],
+            tx_type=tx_type, status__in=wrappers.Response.OK_STATUSES,
+        ).order_by('request_datetime', 'pk').values_list(
+            'related_tx_id', 'amount', 'tx_id', 'request_datetime')
+        for related_tx_id, amount, tx_id, request_datetime in rows:
+            existing[related_tx_id].append((amount, tx_id, request_datetime))
+    return existing
+
+
+def _load_txns(tx_ids, **filters):
+    """
+    Return a dict mapping TX ID to RequestResponse for the passed TX IDs,
+    fetched in as few queries as possible.
+    """
+    txns = {}
+    tx_ids = list(tx_ids)
+    for i in range(0, len(tx_ids), LOOKUP_CHUNK_SIZE):
+        qs = models.RequestResponse.objects.filter(
+            tx_id__in=tx_ids[i:i + LOOKUP_CHUNK_SIZE], **filters)
+        for txn in qs:
+            # Results are ordered most recent first
+            txns.setdefault(txn.tx_id, txn)
+    return txns
+
+
+class _VendorLimiter(object):
+    """
+    Caps the number of requests in flight for each vendor
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def __call__(self, vendor):
+        with self._lock:
+            if vendor not in self._semaphores:
+                self._semaphores[vendor] = threading.BoundedSemaphore(
+                    self.limit)
+            return self._semaphores[vendor]
+
+
+class RateLimiter(object):
+    """
+    Spaces out calls to ``wait`` so that no more than ``rate`` calls are
+    allowed per second, across all threads.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next = time.time()
+
+    def wait(self):
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# An item of a bulk run.  ``key`` identifies it in the checkpoint,
+# ``previous`` is the TX ID of a transaction already recorded for it (if
+# any) and ``error`` is set for items that shouldn't be sent.
+Job = collections.namedtuple(
+    'Job', ('key', 'tx_id', 'amount', 'previous', 'error'))
+
+
+def _run(jobs, txns, fn, workers, vendor_limit, checkpoint,
+         rate_limiter=None, missing="No transaction found with ID %s"):
+    limiter = _VendorLimiter(vendor_limit)
+    cancelled = threading.Event()
+
+    def process(job):
+        tx_id = job.tx_id
+        if job.error:
+            return Result(tx_id, False, None, job.error)
+        if checkpoint is not None and job.key in checkpoint:
+            return Result(tx_id, True, checkpoint.get(job.key), None)
+        if job.previous:
+            # Sent before, by this run or another
+            if checkpoint is not None:
+                checkpoint.mark(job.key, job.previous)
+            return Result(tx_id, True, job.previous, None)
+        if checkpoint is not None and checkpoint.in_flight(job.key):
+            return Result(tx_id, False, None, IN_FLIGHT_ERROR)
+        txn = txns.get(tx_id)
+        if txn is None:
+            return Result(tx_id, False, None, missing % tx_id)
+        with limiter(txn.vendor):
+            if rate_limiter is not None:
+                rate_limiter.wait()
+            if cancelled.is_set():
+                # The caller has stopped iterating, so the result is unused
+                return None
+            if checkpoint is not None:
+                checkpoint.start(job.key)
+            try:
+                value = fn(txn, job.amount)
+            except oscar_exceptions.PaymentError as e:
+                logger.error("Bulk %s for TX ID %s failed: %s",
+                             fn.__name__, tx_id, e)
+                return Result(tx_id, False, None, unicode(e))
+            except Exception as e:
+                logger.exception("Bulk %s for TX ID %s failed",
+                                 fn.__name__, tx_id)
+                return Result(tx_id, False, None, UNEXPECTED_ERROR % e)
+        if checkpoint is not None:
+            checkpoint.mark(job.key, value)
+        return Result(tx_id, True, value, None)
+
+    return _imap(process, jobs, workers, cancelled)
+
+
+def _imap(fn, items, workers, cancelled=None):
+    """
+    Call ``fn`` on each item from a pool of worker threads, yielding the
+    results in input order.  Each worker closes its database connection when
+    it finishes.
+
+    ``cancelled`` is set when the caller stops iterating (or an item raises),
+    after which workers don't start any more items.  ``fn`` can also check it
+    before doing anything that can't be undone.
+    """
+    items = list(items)
+    results = {}
+    errors = {}
+    next_index = iter(range(len(items)))
+    lock = threading.Lock()
+    finished = threading.Condition(lock)
+    if cancelled is None:
+        cancelled = threading.Event()
+
+    def work():
+        try:
+            while True:
+                with lock:
+                    index = next(next_index, None)
+                if index is None or cancelled.is_set():
+                    return
+                try:
+                    result = fn(items[index])
+                except Exception as e:
+                    with lock:
+                        errors[index] = e
+                        finished.notify_all()
+                else:
+                    with lock:
+                        results[index] = result
+                        finished.notify_all()
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=work)
+               for __ in range(min(workers, len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        for index in range(len(items)):
+            with lock:
+                while index not in results and index not in errors:
+                    finished.wait()
+                if index in errors:
+                    raise errors.pop(index)
+                result = results.pop(index)
+            yield result
+    finally:
+        cancelled.set()
+        for thread in threads:
+            thread.join()
+
+
+def _prepare(items, checkpoint, **filters):
+    pairs, txns = _normalise(items)
+    if checkpoint is not None and not isinstance(checkpoint, Checkpoint):
+        checkpoint = Checkpoint(checkpoint)
+    pending = [tx_id for tx_id, __ in pairs
+               if tx_id not in txns and
+               (checkpoint is None or tx_id not in checkpoint)]
+    txns.update(_load_txns(pending, **filters))
+    return pairs, txns, checkpoint
+
+
+def _authorise_jobs(pairs):
+    """
+    Return the jobs for AUTHORISEing the passed (TX ID, amount) pairs.  Each
+    transaction is AUTHORISEd at most once.
+    """
+    existing = _existing(set(tx_id for tx_id, __ in pairs),
+                         gateway.TXTYPE_AUTHORISE)
+    jobs, seen = [], set()
+    for tx_id, amount in pairs:
+        error = None
+        if tx_id in seen:
+            error = "Duplicate TX ID %s" % tx_id
+        seen.add(tx_id)
+        previous = existing[tx_id][0][1] if existing.get(tx_id) else None
+        jobs.append(Job(tx_id, tx_id, amount, previous, error))
+    return jobs
+
+
+def _refund_jobs(pairs, txns, checkpoint):
+    """
+    Return the jobs for REFUNDing the passed (TX ID, amount) pairs.
+
+    An AUTHORISE may be refunded in several parts, so items are identified
+    by TX ID, amount and position.  Only REFUNDs sent by this run count as
+    done: those completed in the checkpoint, and those recorded for an item
+    that was in flight after the item was started.  Any other successful
+    REFUND of the same amount (eg one made by hand) is reported as an error
+    for the first item refunding that amount, so it isn't refunded twice.
+    """
+    existing = _existing(set(tx_id for tx_id, __ in pairs),
+                         gateway.TXTYPE_REFUND)
+    items = []
+    for index, (tx_id, amount) in enumerate(pairs):
+        txn = txns.get(tx_id)
+        if amount is None and txn is not None:
+            amount = txn.amount
+        items.append(('%s|%s|%d' % (tx_id, amount, index), tx_id, amount))
+
+    # REFUND TX IDs that are accounted for, starting with the completed
+    # items of the checkpoint
+    claimed = set(checkpoint.values()) if checkpoint is not None else set()
+    previous = {}
+    if checkpoint is not None:
+        for key, tx_id, amount in items:
+            started = checkpoint.started(key)
+            if not checkpoint.in_flight(key) or started is None:
+                continue
+            for refund_amount, refund_tx_id, request_datetime in existing.get(
+                    tx_id, ()):
+                if (refund_amount == amount and refund_tx_id not in claimed
+                        and request_datetime is not None
+                        and request_datetime >= started - CLOCK_SLACK):
+                    previous[key] = refund_tx_id
+                    claimed.add(refund_tx_id)
+                    break
+
+    jobs = []
+    for key, tx_id, amount in items:
+        error = None
+        if (key not in previous and amount is not None and
+                (checkpoint is None or key not in checkpoint)):
+            for refund_amount, refund_tx_id, __ in existing.get(tx_id, ()):
+                if refund_amount == amount and refund_tx_id not in claimed:
+                    error = ALREADY_REFUNDED_ERROR % refund_tx_id
+                    claimed.add(refund_tx_id)
+                    break
+        jobs.append(Job(key, tx_id, amount, previous.get(key), error))
+    return jobs
+
+
+def _is_authorise_ok(txn):
+    return (txn.tx_type == gateway.TXTYPE_AUTHORISE and
+            txn.status in wrappers.Response.OK_STATUSES)
+
+
+def authorise(items, workers=None, vendor_limit=None, checkpoint=None):
+    """
+    AUTHORISE a batch of previously AUTHENTICATEd transactions.
+
+    ``items`` is an iterable of TX IDs, (TX ID, amount) pairs or
+    RequestResponse instances; where no amount is given, the full amount of
+    the original transaction is used.
+
+    Transactions that already have a successful AUTHORISE recorded against
+    them are not AUTHORISEd again, and TX IDs repeated in ``items`` are
+    reported as errors.
+
+    Returns an iterator of Result instances in the same order as the
+    passed items.
+    """
+    pairs, txns, checkpoint = _prepare(items, checkpoint)
+
+    def authorise(txn, amount):
+        return facade.authorise_txn(txn, amount)
+
+    return _run(_authorise_jobs(pairs), txns, authorise,
+                workers or config.BULK_WORKERS,
+                vendor_limit or config.BULK_VENDOR_CONCURRENCY,
+                checkpoint)
+
+
+def refund(items, workers=None, vendor_limit=None, rate=None,
+           checkpoint=None):
+    """
+    REFUND a batch of successful AUTHORISE transactions.
+
+    ``items`` is an iterable of AUTHORISE TX IDs, (TX ID, amount) pairs or
+    RequestResponse instances; where no amount is given, the full amount of
+    the AUTHORISE transaction is refunded.  ``rate`` is the maximum number
+    of refunds to send per second.
+
+    Items whose REFUND is already recorded are not sent again (see
+    ``_refund_jobs``), and RequestResponse instances that aren't successful
+    AUTHORISEs are reported as errors.  An item that raises an unexpected
+    exception is reported as an error without stopping the run.
+
+    Returns an iterator of Result instances in the same order as the
+    passed items.
+    """
+    pairs, txns, checkpoint = _prepare(
+        items, checkpoint, tx_type=gateway.TXTYPE_AUTHORISE,
+        status__in=wrappers.Response.OK_STATUSES)
+    txns = dict((tx_id, txn) for tx_id, txn in txns.items()
+                if _is_authorise_ok(txn))
+
+    def refund(txn, amount):
+        return facade.refund_txn(txn, amount)
+
+    rate = rate or config.BULK_REFUND_RATE
+    return _run(_refund_jobs(pairs, txns, checkpoint), txns, refund,
+                workers or config.BULK_WORKERS,
+                vendor_limit or config.BULK_VENDOR_CONCURRENCY,
+                checkpoint,
+                RateLimiter(rate) if rate else None,
+                "No successful AUTHORISE transaction found with ID %s")
+
+
+def write_results(results, fileobj):
+    """
+    Stream results to a CSV file as they complete, returning the number of
+    errors.
+    """
+    writer = csv.writer(fileobj)
+    num_errors = 0
+    for result in results:
+        if not result.success:
+            num_errors += 1
+        writer.writerow([
+            result.tx_id, 'OK' if result.success else 'ERROR',
+            result.value or '', (result.error or '').encode('utf8')])
+        fileobj.flush()
+    return num_errors
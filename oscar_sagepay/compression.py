@@ -0,0 +1,88 @@
+"""
+Compression of the raw request and response payloads stored for each
+transaction.
+
+Compressed payloads are zlib-compressed UTF-8, base64-encoded and prefixed
+with a marker so they can be kept in the existing text columns alongside
+uncompressed payloads.  Payloads without the marker are returned as they
+are, so compression can be turned on (or off) without rewriting old rows.
+"""
+import base64
+import time
+import zlib
+
+import six
+
+from . import config
+
+PREFIX = 'zlib:'
+
+# The payload fields of RequestResponse
+FIELDS = ('raw_request_json', 'raw_response')
+
+
+def compress(text):
+    """
+    Return the compressed form of a payload, or the payload itself if
+    compressing doesn't make it any smaller (as is the case for very short
+    payloads, given the overhead of base64 encoding).
+    """
+    if not text or text.startswith(PREFIX):
+        return text
+    data = text.encode('utf8') if isinstance(text, six.text_type) else text
+    value = PREFIX + base64.b64encode(
+        zlib.compress(data, config.COMPRESSION_LEVEL))
+    if len(value) >= len(text):
+        return text
+    return value
+
+
+def decompress(value):
+    if not value or not value.startswith(PREFIX):
+        return value
+    return zlib.decompress(
+        base64.b64decode(value[len(PREFIX):])).decode('utf8')
+
+
+def store(text):
+    """
+    Return the value to store for a payload, compressing it if enabled
+    """
+    if config.COMPRESS_PAYLOADS:
+        return compress(text)
+    return text
+
+
+def convert(qs, fn, batch_size=500, progress=None):
+    """
+    Apply ``fn`` (``compress`` or ``decompress``) to the payloads of the
+    transactions of the passed queryset, in batches ordered by primary key.
+
+    Returns the number of transactions changed and the total size of their
+    payloads before and after.  ``progress`` is called after each batch with
+    the number of transactions processed so far and the number of seconds
+    elapsed.
+    """
+    start = time.time()
+    num_processed = num_changed = size_before = size_after = 0
+    last_pk = 0
+    while True:
+        rows = list(qs.filter(pk__gt=last_pk).order_by('pk').values_list(
+            'pk', *FIELDS)[:batch_size])
+        if not rows:
+            break
+        for row in rows:
+            values = dict(zip(FIELDS, row[1:]))
+            converted = dict((field, fn(value))
+                             for field, value in values.items())
+            if converted != values:
+                qs.model._default_manager.filter(pk=row[0]).update(
+                    **converted)
+                num_changed += 1
+                size_before += sum(len(v) for v in values.values())
+                size_after += sum(len(v) for v in converted.values())
+        num_processed += len(rows)
+        last_pk = rows[-1][0]
+        if progress is not None:
+            progress(num_processed, time.time() - start)
+    return num_changed, size_before, size_after
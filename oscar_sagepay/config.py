@@ -1,3 +1,6 @@
+import os
+import tempfile
+
 from django.conf import settings
 
 
@@ -16,7 +19,111 @@ else:
     VPS_REFUND_URL = 'https://live.sagepay.com/gateway/service/refund.vsp'
     VPS_VOID_URL = 'https://live.sagepay.com/gateway/service/void.vsp'
 
+# Send requests to a local simulator instead (see oscar_sagepay.simulator),
+# eg 'http://127.0.0.1:8001'.  Ignored unless in test mode, so that a
+# leftover setting can't divert live transactions.
+SIMULATOR_URL = getattr(settings, "OSCAR_SAGEPAY_SIMULATOR_URL", None)
+if SIMULATOR_URL and TEST_MODE:
+    VPS_REGISTER_URL = SIMULATOR_URL.rstrip('/') + '/register'
+    VPS_AUTHORISE_URL = SIMULATOR_URL.rstrip('/') + '/authorise'
+    VPS_REFUND_URL = SIMULATOR_URL.rstrip('/') + '/refund'
+    VPS_VOID_URL = SIMULATOR_URL.rstrip('/') + '/void'
+
 VENDOR_TX_CODE_PREFIX = getattr(settings, "OSCAR_SAGEPAY_TX_CODE_PREFIX",
                                 "oscar")
+# Class used to generate VendorTxCodes.  See oscar_sagepay.txcodes.
+TX_CODE_GENERATOR = getattr(settings, "OSCAR_SAGEPAY_TX_CODE_GENERATOR",
+                            "oscar_sagepay.txcodes.SequenceGenerator")
 
 AVSCV2 = getattr(settings, "OSCAR_SAGEPAY_AVSCV2", "2")
+
+# HTTP connection pooling.  Connections to Sagepay are kept alive and reused
+# between requests unless pooling is disabled.
+HTTP_POOL = getattr(settings, "OSCAR_SAGEPAY_HTTP_POOL", True)
+HTTP_POOL_CONNECTIONS = getattr(
+    settings, "OSCAR_SAGEPAY_HTTP_POOL_CONNECTIONS", 4)
+HTTP_POOL_MAXSIZE = getattr(settings, "OSCAR_SAGEPAY_HTTP_POOL_MAXSIZE", 10)
+HTTP_KEEP_ALIVE = getattr(settings, "OSCAR_SAGEPAY_HTTP_KEEP_ALIVE", True)
+# Seconds to wait to connect to Sagepay and for each read of the response,
+# overridable per TxType with eg {'AUTHORISE': {'connect': 3, 'read': 20}}
+HTTP_CONNECT_TIMEOUT = getattr(
+    settings, "OSCAR_SAGEPAY_HTTP_CONNECT_TIMEOUT", 5.0)
+HTTP_READ_TIMEOUT = getattr(settings, "OSCAR_SAGEPAY_HTTP_READ_TIMEOUT", 30.0)
+HTTP_TIMEOUTS = getattr(settings, "OSCAR_SAGEPAY_HTTP_TIMEOUTS", {})
+# Class used to send requests.  See oscar_sagepay.transport.
+TRANSPORT = getattr(settings, "OSCAR_SAGEPAY_TRANSPORT",
+                    "oscar_sagepay.transport.RequestsTransport")
+
+# Bulk operations
+BULK_WORKERS = getattr(settings, "OSCAR_SAGEPAY_BULK_WORKERS", 8)
+BULK_VENDOR_CONCURRENCY = getattr(
+    settings, "OSCAR_SAGEPAY_BULK_VENDOR_CONCURRENCY", 4)
+# Maximum number of refunds sent per second by bulk refunds (None for no
+# limit)
+BULK_REFUND_RATE = getattr(settings, "OSCAR_SAGEPAY_BULK_REFUND_RATE", None)
+
+# Audit trail
+AUDIT_BACKEND = getattr(settings, "OSCAR_SAGEPAY_AUDIT_BACKEND",
+                        "oscar_sagepay.audit.DatabaseBackend")
+# Settings for the buffered audit backend
+AUDIT_SPILL_PATH = getattr(
+    settings, "OSCAR_SAGEPAY_AUDIT_SPILL_PATH",
+    os.path.join(tempfile.gettempdir(), "oscar_sagepay_audit.spill"))
+AUDIT_BUFFER_SIZE = getattr(settings, "OSCAR_SAGEPAY_AUDIT_BUFFER_SIZE", 10000)
+AUDIT_BATCH_SIZE = getattr(settings, "OSCAR_SAGEPAY_AUDIT_BATCH_SIZE", 100)
+AUDIT_FLUSH_INTERVAL = getattr(
+    settings, "OSCAR_SAGEPAY_AUDIT_FLUSH_INTERVAL", 1.0)
+AUDIT_PUT_TIMEOUT = getattr(settings, "OSCAR_SAGEPAY_AUDIT_PUT_TIMEOUT", 0.1)
+
+# Dashboard
+DASHBOARD_SUBSTRING_SEARCH = getattr(
+    settings, "OSCAR_SAGEPAY_DASHBOARD_SUBSTRING_SEARCH", False)
+
+# Archiving.  Transactions older than this many days are moved out of the
+# database by the sagepay_archive command.
+ARCHIVE_AFTER_DAYS = getattr(settings, "OSCAR_SAGEPAY_ARCHIVE_AFTER_DAYS", 365)
+# Successful AUTHENTICATE and AUTHORISE transactions can still be followed up
+# (by an AUTHORISE, REFUND or VOID) so are only archived once they are this
+# many days old.  None means they are never archived.
+ARCHIVE_FOLLOW_UP_DAYS = getattr(
+    settings, "OSCAR_SAGEPAY_ARCHIVE_FOLLOW_UP_DAYS", None)
+ARCHIVE_BATCH_SIZE = getattr(settings, "OSCAR_SAGEPAY_ARCHIVE_BATCH_SIZE", 500)
+
+# Whether to compress the raw request and response payloads stored for each
+# transaction
+COMPRESS_PAYLOADS = getattr(settings, "OSCAR_SAGEPAY_COMPRESS_PAYLOADS", False)
+COMPRESSION_LEVEL = getattr(settings, "OSCAR_SAGEPAY_COMPRESSION_LEVEL", 6)
+
+# Whether to store the time taken by each phase of a request on its
+# RequestResponse
+STORE_TIMINGS = getattr(settings, "OSCAR_SAGEPAY_STORE_TIMINGS", False)
+
+# Directory that each process writes its metrics to, so that metrics can be
+# exported for all the processes of a multi-process server.  If None, only
+# the metrics of the current process are exported.
+METRICS_DIR = getattr(settings, "OSCAR_SAGEPAY_METRICS_DIR", None)
+# How often (in seconds) each process writes its metrics to METRICS_DIR
+METRICS_FLUSH_INTERVAL = getattr(
+    settings, "OSCAR_SAGEPAY_METRICS_FLUSH_INTERVAL", 1.0)
+
+# Circuit breaker.  When enabled, requests to a Sagepay endpoint fail
+# immediately after repeated failures (errors or responses slower than the
+# slow threshold), until a probe request succeeds.  State is shared between
+# processes through the configured cache.
+BREAKER_ENABLED = getattr(settings, "OSCAR_SAGEPAY_BREAKER_ENABLED", False)
+BREAKER_CACHE = getattr(settings, "OSCAR_SAGEPAY_BREAKER_CACHE", "default")
+BREAKER_FAILURE_THRESHOLD = getattr(
+    settings, "OSCAR_SAGEPAY_BREAKER_FAILURE_THRESHOLD", 5)
+# Window (in seconds) that failures are counted over
+BREAKER_FAILURE_WINDOW = getattr(
+    settings, "OSCAR_SAGEPAY_BREAKER_FAILURE_WINDOW", 60)
+BREAKER_SLOW_THRESHOLD = getattr(
+    settings, "OSCAR_SAGEPAY_BREAKER_SLOW_THRESHOLD", 10.0)
+# Seconds to fail fast for before letting a probe request through
+BREAKER_RESET_TIMEOUT = getattr(
+    settings, "OSCAR_SAGEPAY_BREAKER_RESET_TIMEOUT", 30)
+
+# Retries of transient failures, by TxType.  See oscar_sagepay.retries.
+RETRY_POLICIES = getattr(settings, "OSCAR_SAGEPAY_RETRY_POLICIES", {})
+RETRY_BACKOFF = getattr(settings, "OSCAR_SAGEPAY_RETRY_BACKOFF", 0.5)
+RETRY_MAX_BACKOFF = getattr(settings, "OSCAR_SAGEPAY_RETRY_MAX_BACKOFF", 5.0)
@@ -18,6 +18,8 @@ class SagepayDashboard(Application):
     name = None
     list_view = views.Transactions
     detail_view = views.Transaction
+    report_view = views.Report
+    metrics_view = views.Metrics
 
     def get_urls(self):
         urlpatterns = patterns('',
@@ -25,6 +27,10 @@ class SagepayDashboard(Application):
                 name='sagepay-transaction-list'),
             url(r'^transactions/(?P<pk>\d+)/$', self.detail_view.as_view(),
                 name='sagepay-transaction-detail'),
+            url(r'^report/$', self.report_view.as_view(),
+                name='sagepay-report'),
+            url(r'^metrics/$', self.metrics_view.as_view(),
+                name='sagepay-metrics'),
         )
         return self.post_process_urls(urlpatterns)
 
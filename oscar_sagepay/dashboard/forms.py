@@ -1,6 +1,56 @@
 from django import forms
 from django.utils.translation import ugettext_lazy as _
 
+from oscar_sagepay import gateway, models, wrappers
+
+# The stored outcome for transactions without a response is blank, so the
+# form needs a distinct value for it.
+NO_RESPONSE = 'none'
+
+
+TX_TYPE_CHOICES = (('', _("Any")),) + tuple(
+    (tx_type, tx_type) for tx_type in (
+        gateway.TXTYPE_AUTHENTICATE, gateway.TXTYPE_AUTHORISE,
+        gateway.TXTYPE_REFUND, gateway.TXTYPE_VOID))
+
+STATUS_CHOICES = (('', _("Any")),) + tuple(
+    (status, status) for status in (
+        wrappers.Response.OK, wrappers.Response.OK_REPEATED,
+        wrappers.Response.REGISTERED, wrappers.Response.MALFORMED,
+        wrappers.Response.INVALID, wrappers.Response.ERROR))
+
 
 class TransactionSearch(forms.Form):
     q = forms.CharField(label=_("Search for"), required=False)
+    tx_type = forms.ChoiceField(
+        label=_("TX type"), required=False, choices=TX_TYPE_CHOICES)
+    status = forms.ChoiceField(
+        label=_("Status"), required=False, choices=STATUS_CHOICES)
+    date_from = forms.DateField(label=_("From"), required=False)
+    date_to = forms.DateField(label=_("To"), required=False)
+    outcome = forms.ChoiceField(
+        label=_("Outcome"), required=False, choices=(
+            ('', _("Any")),
+            (models.OUTCOME_SUCCESS, _("Success")),
+            (models.OUTCOME_ERROR, _("Error")),
+            (models.OUTCOME_UNKNOWN, _("Timed out")),
+            (NO_RESPONSE, _("No response"))))
+
+    def clean_outcome(self):
+        outcome = self.cleaned_data['outcome']
+        if outcome == NO_RESPONSE:
+            return models.OUTCOME_NONE
+        return outcome or None
+
+
+# Number of days covered by the report by default
+DEFAULT_REPORT_DAYS = 30
+
+
+class ReportForm(forms.Form):
+    period = forms.ChoiceField(
+        label=_("Per"), required=False,
+        choices=models.RequestRollup.PERIOD_CHOICES)
+    days = forms.IntegerField(
+        label=_("Days"), required=False, min_value=1,
+        initial=DEFAULT_REPORT_DAYS)
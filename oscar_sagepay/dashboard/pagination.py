@@ -0,0 +1,181 @@
+"""
+Keyset pagination for the transaction list.
+
+Rather than using OFFSET (which gets slower the deeper the page) each page
+is fetched by seeking past the (request_datetime, id) of the last row of the
+previous page, which is served by the index on those columns.  Transactions
+without a request datetime are listed after all the others.  No exact
+count is made; where available, the table size estimate from the database
+statistics is used instead.
+"""
+from django.db import connection
+from django.db.models import Q
+from django.utils import dateparse
+
+
+def encode_cursor(txn):
+    # Transactions without a request datetime have an empty one
+    value = txn.request_datetime
+    return '%s_%d' % (value.isoformat() if value else '', txn.pk)
+
+
+def decode_cursor(cursor):
+    """
+    Return the (request_datetime, id) pair of a cursor, or None if it isn't
+    valid.  The request datetime is None for cursors of transactions without
+    one.
+    """
+    try:
+        value, pk = cursor.rsplit('_', 1)
+        pk = int(pk)
+    except (AttributeError, ValueError):
+        return None
+    if not value:
+        return None, pk
+    try:
+        value = dateparse.parse_datetime(value)
+    except ValueError:
+        return None
+    if value is None:
+        return None
+    return value, pk
+
+
+def estimated_count(model):
+    """
+    Return an estimate of the number of rows in the model's table, or None if
+    the database doesn't provide one
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    cursor = connection.cursor()
+    cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s",
+                   [model._meta.db_table])
+    row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class Page(object):
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginator(object):
+    """
+    Paginate a queryset of transactions, most recent first.
+
+    Transactions without a request datetime (which is normally set when the
+    request is recorded) are listed last, by ID.  Cursors on those
+    transactions seek by ID alone.
+    """
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def page(self, after=None, before=None):
+        """
+        Return the page of transactions following the ``after`` cursor, or
+        preceding the ``before`` cursor.  Invalid cursors return the first
+        page.
+        """
+        after = decode_cursor(after) if after else None
+        before = decode_cursor(before) if before else None
+        if before is not None:
+            return self._previous_page(*before)
+        if after is not None:
+            return self._next_page(*after)
+        return self._next_page()
+
+    def _fetch(self, qs, limit=None):
+        if limit is None:
+            limit = self.per_page + 1
+        return list(qs[:limit])
+
+    def _fetch_more(self, rows, qs):
+        """
+        Add rows from ``qs`` to ``rows`` until there is one more than a page
+        """
+        if len(rows) <= self.per_page:
+            rows.extend(self._fetch(qs, self.per_page + 1 - len(rows)))
+        return rows
+
+    def _dated(self, reverse=False):
+        """
+        Return the transactions with a request datetime, most recent first
+        (or least recent first if ``reverse``)
+        """
+        ordering = ('request_datetime', 'pk') if reverse else (
+            '-request_datetime', '-pk')
+        return self.queryset.filter(
+            request_datetime__isnull=False).order_by(*ordering)
+
+    def _undated(self):
+        return self.queryset.filter(request_datetime__isnull=True)
+
+    def _after(self, value, pk):
+        """
+        Return the transactions following a cursor, most recent first
+        """
+        if value is None:
+            return self._undated().filter(pk__lt=pk).order_by('-pk')
+        # The redundant range filter lets the database bound its index scan
+        return self.queryset.filter(
+            Q(request_datetime__lt=value) |
+            Q(request_datetime=value, pk__lt=pk),
+            request_datetime__lte=value).order_by('-request_datetime', '-pk')
+
+    def _before(self, value, pk):
+        """
+        Return the transactions preceding a cursor, least recent first
+        """
+        if value is None:
+            return self._undated().filter(pk__gt=pk).order_by('pk')
+        return self.queryset.filter(
+            Q(request_datetime__gt=value) |
+            Q(request_datetime=value, pk__gt=pk),
+            request_datetime__gte=value).order_by('request_datetime', 'pk')
+
+    def _next_page(self, value=None, pk=None):
+        if pk is None:
+            rows = self._fetch(self._dated())
+        else:
+            rows = self._fetch(self._after(value, pk))
+        if pk is None or value is not None:
+            # The undated transactions follow the least recent dated one
+            rows = self._fetch_more(rows, self._undated().order_by('-pk'))
+        txns = rows[:self.per_page]
+        next_cursor = previous_cursor = None
+        if len(rows) > self.per_page:
+            next_cursor = encode_cursor(txns[-1])
+        if pk is not None and txns:
+            previous_cursor = encode_cursor(txns[0])
+        return Page(txns, next_cursor, previous_cursor)
+
+    def _previous_page(self, value, pk):
+        rows = self._fetch(self._before(value, pk))
+        if value is None:
+            # The least recent dated transaction precedes the undated ones
+            rows = self._fetch_more(rows, self._dated(reverse=True))
+        if len(rows) <= self.per_page:
+            # We've reached the most recent transactions
+            return self._next_page()
+        txns = rows[:self.per_page][::-1]
+        return Page(txns, encode_cursor(txns[-1]), encode_cursor(txns[0]))
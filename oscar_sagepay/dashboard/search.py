@@ -0,0 +1,61 @@
+"""
+Search for transactions in the dashboard.
+
+By default, queries are matched exactly or as a prefix against the vendor TX
+code, TX ID and reference so that the indexes on those columns can be used.
+On PostgreSQL, substring matching can be enabled with the
+``OSCAR_SAGEPAY_DASHBOARD_SUBSTRING_SEARCH`` setting; this relies on trigram
+indexes, which the migrations create if the setting is enabled when they are
+run, and which can be created later with the ``sagepay_search_indexes``
+command.
+"""
+from django.db import connection
+from django.db.models import Q
+
+from oscar_sagepay import config, models
+
+SEARCH_FIELDS = ('vendor_tx_code', 'tx_id', 'reference')
+
+
+def create_trigram_indexes():
+    """
+    Create the trigram indexes used by substring search, returning the names
+    of those that didn't already exist.  PostgreSQL only; creating the
+    pg_trgm extension may need a superuser.
+    """
+    table = models.RequestResponse._meta.db_table
+    cursor = connection.cursor()
+    cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    created = []
+    for field in SEARCH_FIELDS:
+        name = '%s_%s_trgm' % (table, field)
+        cursor.execute("SELECT 1 FROM pg_class WHERE relname = %s", [name])
+        if cursor.fetchone():
+            continue
+        cursor.execute('CREATE INDEX %s ON %s USING gin (%s gin_trgm_ops)' % (
+            name, table, field))
+        created.append(name)
+    return created
+
+
+def substring_search_enabled():
+    return (config.DASHBOARD_SUBSTRING_SEARCH and
+            connection.vendor == 'postgresql')
+
+
+def search(qs, query):
+    """
+    Filter the passed queryset of transactions to those matching the query
+    """
+    query = query.strip()
+    if not query:
+        return qs
+    lookup = 'contains' if substring_search_enabled() else 'startswith'
+    filters = Q()
+    for field in SEARCH_FIELDS:
+        filters |= Q(**{'%s__%s' % (field, lookup): query})
+    # Sagepay TX IDs are wrapped in braces, which are often left off when
+    # copied from elsewhere.
+    if lookup == 'startswith' and not query.startswith('{'):
+        filters |= Q(tx_id__startswith='{%s' % query.upper())
+    return qs.filter(filters)
@@ -1,41 +1,162 @@
-from django.views.generic import ListView, DetailView
-from django.db.models import Q
+import datetime
 
-from oscar_sagepay import models
-from . import forms
+from django.conf import settings
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.timezone import now
+from django.views.generic import ListView, DetailView, View
+
+from oscar_sagepay import metrics, models, wrappers
+from . import forms, pagination, search
+
+
+def _start_of_day(date):
+    value = datetime.datetime.combine(date, datetime.time.min)
+    if settings.USE_TZ:
+        value = timezone.make_aware(value, timezone.get_current_timezone())
+    return value
 
 
 class Transactions(ListView):
     model = models.RequestResponse
     context_object_name = 'transactions'
     template_name = 'sagepay/dashboard/request_list.html'
-    paginate_by = 20
+    # Pages are fetched by seeking from a cursor rather than by OFFSET, see
+    # the pagination module.
+    per_page = 20
+    paginator_class = pagination.KeysetPaginator
     form_class = forms.TransactionSearch
     query = None
+    is_filtered = False
 
     def get(self, request, *args, **kwargs):
         self.form = self.form_class(request.GET)
         return super(Transactions, self).get(request, *args, **kwargs)
 
     def get_queryset(self):
-        # Allow txns to be filtered by matching against the vendor code and the
-        # Sagepay TX ID.
+        # Allow txns to be filtered by matching against the vendor code, the
+        # Sagepay TX ID and the reference, and by the structured filters of the
+        # search form.  Each filter maps onto an indexed column.
         qs = super(Transactions, self).get_queryset()
         if self.form.is_valid():
-            self.query = self.form.cleaned_data['q']
-            filters = (Q(vendor_tx_code__contains=self.query) |
-                       Q(tx_id__contains=self.query))
-            qs = qs.filter(filters)
+            data = self.form.cleaned_data
+            self.query = data['q']
+            # An outcome of '' means "No response" so it is a filter too
+            self.is_filtered = data['outcome'] is not None or any(
+                value not in (None, '') for name, value in data.items()
+                if name != 'outcome')
+            qs = search.search(qs, self.query)
+            if data['tx_type']:
+                qs = qs.filter(tx_type=data['tx_type'])
+            if data['status']:
+                qs = qs.filter(status=data['status'])
+            # Outcomes are stored when the response is recorded so this
+            # doesn't need the responses to be parsed.
+            if data['outcome'] is not None:
+                qs = qs.filter(outcome=data['outcome'])
+            if data['date_from']:
+                qs = qs.filter(
+                    request_datetime__gte=_start_of_day(data['date_from']))
+            if data['date_to']:
+                qs = qs.filter(request_datetime__lt=_start_of_day(
+                    data['date_to'] + datetime.timedelta(days=1)))
         return qs
 
     def get_context_data(self, **kwargs):
         ctx = super(Transactions, self).get_context_data(**kwargs)
+        paginator = self.paginator_class(self.object_list, self.per_page)
+        page = paginator.page(after=self.request.GET.get('after'),
+                              before=self.request.GET.get('before'))
+        ctx['page'] = page
+        ctx['transactions'] = page.object_list
+        ctx['next_url'] = self._page_url('after', page.next_cursor)
+        ctx['previous_url'] = self._page_url('before', page.previous_cursor)
+        # Counting every row is slow on large tables so only an estimate of
+        # the total is shown, and only when the list isn't filtered.
+        if not self.is_filtered:
+            ctx['estimated_count'] = pagination.estimated_count(self.model)
         ctx['form'] = self.form
         ctx['query'] = self.query
         return ctx
 
+    def _page_url(self, direction, cursor):
+        if cursor is None:
+            return None
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params[direction] = cursor
+        return '?%s' % params.urlencode()
+
 
 class Transaction(DetailView):
     model = models.RequestResponse
     context_object_name = 'txn'
     template_name = 'sagepay/dashboard/request_detail.html'
+
+
+class Report(ListView):
+    """
+    Report on transaction volumes and response times.  Only the rollups are
+    read, so this stays fast however many transactions there are.
+    """
+    model = models.RequestRollup
+    context_object_name = 'rollups'
+    template_name = 'sagepay/dashboard/report.html'
+    form_class = forms.ReportForm
+    # There are 24 hourly rollups per day for each TX type and status
+    paginate_by = 100
+
+    def get(self, request, *args, **kwargs):
+        self.form = self.form_class(request.GET)
+        return super(Report, self).get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        period, days = models.RequestRollup.DAY, forms.DEFAULT_REPORT_DAYS
+        if self.form.is_valid():
+            period = self.form.cleaned_data['period'] or period
+            days = self.form.cleaned_data['days'] or days
+        return super(Report, self).get_queryset().filter(
+            period=period,
+            period_start__gte=now() - datetime.timedelta(days=days))
+
+    def get_context_data(self, **kwargs):
+        ctx = super(Report, self).get_context_data(**kwargs)
+        ctx['form'] = self.form
+        ctx['summary'] = _summarise(self.object_list)
+        return ctx
+
+
+def _summarise(rollups):
+    """
+    Return the number of requests, successful requests and the success rate
+    for each TX type of a queryset of rollups.  The totals are summed by the
+    database so that all the rollups (not just the current page) are
+    counted without fetching them.
+    """
+    totals = {}
+    rows = rollups.order_by().values('tx_type', 'status').annotate(
+        total=Sum('num_requests'))
+    for row in rows:
+        tx_type = row['tx_type']
+        total = totals.setdefault(
+            tx_type, {'tx_type': tx_type, 'num_requests': 0,
+                      'num_successful': 0})
+        total['num_requests'] += row['total']
+        if row['status'] in wrappers.Response.SUCCESS_STATUSES:
+            total['num_successful'] += row['total']
+    for total in totals.values():
+        total['success_rate'] = (
+            100.0 * total['num_successful'] / total['num_requests'])
+    return sorted(totals.values(), key=lambda total: total['tx_type'])
+
+
+class Metrics(View):
+    """
+    Export gateway metrics in the Prometheus text format
+    """
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(metrics.registry.export(),
+                            content_type='text/plain; version=0.0.4')
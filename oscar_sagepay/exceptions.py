@@ -1,4 +1,41 @@
+from oscar.apps.payment import exceptions as oscar_exceptions
+
+
 class GatewayError(Exception):
     """
     An error that occurs when trying to talk to the Sagepay gateway
     """
+    status = 'ERROR'
+
+
+class GatewayTimeout(GatewayError):
+    """
+    Raised when a request times out or its deadline passes before a response
+    is received.  Sagepay may or may not have processed the transaction, so
+    it should be reconciled (eg by looking up its VendorTxCode) rather than
+    assumed to have failed.
+    """
+    status = 'TIMEOUT'
+
+    # The RequestResponse recorded for the request, once it is known
+    request_response = None
+
+
+class PaymentTimeout(oscar_exceptions.PaymentError):
+    """
+    Raised by the facade functions when a GatewayTimeout occurs, so that
+    callers catching PaymentError can tell that the transaction needs to be
+    reconciled.  ``request_response`` is the RequestResponse recorded for it.
+    """
+    status = GatewayTimeout.status
+
+    def __init__(self, message, request_response=None):
+        super(PaymentTimeout, self).__init__(message)
+        self.request_response = request_response
+
+
+class CircuitOpen(GatewayError):
+    """
+    Raised without contacting Sagepay when recent requests to the same
+    endpoint have failed
+    """
@@ -2,10 +2,26 @@
 This module provides simple APIs that accept Oscar objects as parameters. It
 decomposes these into dictionaries of data that are passed to the fine-grained
 APIs of the gateway module.
+
+Each function accepts an optional ``deadline``: a ``time.time()`` timestamp
+by which it must return, including any retries.  If no response has been
+received from Sagepay by then, the transaction is recorded with an outcome
+of ``models.OUTCOME_UNKNOWN`` for reconciliation and a PaymentTimeout (a
+PaymentError carrying the recorded transaction) is raised.
 """
 from oscar.apps.payment import exceptions as oscar_exceptions
 
-from . import gateway, exceptions, models
+from . import gateway, exceptions, models, wrappers
+
+
+def _payment_error(error):
+    """
+    Return the PaymentError to raise for the passed GatewayError
+    """
+    if isinstance(error, exceptions.GatewayTimeout):
+        return exceptions.PaymentTimeout(error.message,
+                                         error.request_response)
+    return oscar_exceptions.PaymentError(error.message)
 
 
 def _get_bankcard_params(bankcard):
@@ -49,7 +65,7 @@ def _get_country_code(country):
 
 
 def authenticate(amount, currency, bankcard, shipping_address, billing_address,
-                 description=None, order_number=None):
+                 description=None, order_number=None, deadline=None):
     """
     Perform an AUTHENTICATE request and return the TX ID if successful.
     """
@@ -62,6 +78,7 @@ def authenticate(amount, currency, bankcard, shipping_address, billing_address,
         'amount': amount,
         'currency': currency,
         'description': description,
+        'deadline': deadline,
     }
 
     params.update(_get_bankcard_params(bankcard))
@@ -96,7 +113,7 @@ def authenticate(amount, currency, bankcard, shipping_address, billing_address,
         response = gateway.authenticate(**params)
     except exceptions.GatewayError as e:
         # Translate Sagepay gateway exceptions into Oscar checkout ones
-        raise oscar_exceptions.PaymentError(e.message)
+        raise _payment_error(e)
 
     # Check if the transaction was successful (need to distinguish between
     # customer errors and system errors).
@@ -107,7 +124,8 @@ def authenticate(amount, currency, bankcard, shipping_address, billing_address,
     return response.tx_id
 
 
-def authorise(tx_id, amount=None, description=None, order_number=None):
+def authorise(tx_id, amount=None, description=None, order_number=None,
+              deadline=None):
     """
     Perform an AUTHORISE request against a previous transaction
     """
@@ -117,7 +135,14 @@ def authorise(tx_id, amount=None, description=None, order_number=None):
     except models.RequestResponse.DoesNotExist:
         raise oscar_exceptions.PaymentError(
             "No historic transaction found with ID %s" % tx_id)
+    return authorise_txn(txn, amount, description, order_number, deadline)
+
 
+def authorise_txn(txn, amount=None, description=None, order_number=None,
+                  deadline=None):
+    """
+    Perform an AUTHORISE request against a previously loaded transaction
+    """
     # Marshall data for passing to gateway
     previous_txn = gateway.PreviousTxn(
         vendor_tx_code=txn.vendor_tx_code,
@@ -127,39 +152,50 @@ def authorise(tx_id, amount=None, description=None, order_number=None):
     if amount is None:
         amount = txn.amount
     if description is None:
-        description = "Authorise TX ID %s" % tx_id
+        description = "Authorise TX ID %s" % txn.tx_id
     params = {
         'previous_txn': previous_txn,
         'amount': amount,
         'currency': txn.currency,
         'description': description,
+        'deadline': deadline,
     }
     if order_number is not None:
         params['reference'] = order_number
     try:
         response = gateway.authorise(**params)
     except exceptions.GatewayError as e:
-        raise oscar_exceptions.PaymentError(e.message)
+        raise _payment_error(e)
     if not response.is_ok:
         raise oscar_exceptions.PaymentError(
             response.status_detail)
     return response.tx_id
 
 
-def refund(tx_id, amount=None, description=None, order_number=None):
+def refund(tx_id, amount=None, description=None, order_number=None,
+           deadline=None):
     """
     Perform a REFUND request against a previous transaction. The passed tx_id
     should be from the AUTHORISE request that you want to refund against.
     """
     try:
         authorise_txn = models.RequestResponse.objects.get(
-            tx_id=tx_id, tx_type=gateway.TXTYPE_AUTHORISE, status='OK'
-        )
+            tx_id=tx_id, tx_type=gateway.TXTYPE_AUTHORISE,
+            status__in=wrappers.Response.OK_STATUSES)
     except models.RequestResponse.DoesNotExist:
         raise oscar_exceptions.PaymentError((
             "No successful AUTHORISE transaction found with "
             "ID %s") % tx_id)
+    return refund_txn(authorise_txn, amount, description, order_number,
+                      deadline)
+
 
+def refund_txn(authorise_txn, amount=None, description=None,
+               order_number=None, deadline=None):
+    """
+    Perform a REFUND request against a previously loaded AUTHORISE
+    transaction
+    """
     previous_txn = gateway.PreviousTxn(
         vendor_tx_code=authorise_txn.vendor_tx_code,
         tx_id=authorise_txn.tx_id,
@@ -168,33 +204,34 @@ def refund(tx_id, amount=None, description=None, order_number=None):
     if amount is None:
         amount = authorise_txn.amount
     if description is None:
-        description = "Refund TX ID %s" % tx_id
+        description = "Refund TX ID %s" % authorise_txn.tx_id
     params = {
         'previous_txn': previous_txn,
         'amount': amount,
         'currency': authorise_txn.currency,
         'description': description,
+        'deadline': deadline,
     }
     if order_number is not None:
         params['reference'] = order_number
     try:
         response = gateway.refund(**params)
     except exceptions.GatewayError as e:
-        raise oscar_exceptions.PaymentError(e.message)
+        raise _payment_error(e)
     if not response.is_ok:
         raise oscar_exceptions.PaymentError(
             response.status_detail)
     return response.tx_id
 
 
-def void(tx_id, order_number=None):
+def void(tx_id, order_number=None, deadline=None):
     """
     Cancel an existing transaction
     """
     try:
         authorise_txn = models.RequestResponse.objects.get(
-            tx_id=tx_id, tx_type=gateway.TXTYPE_AUTHORISE, status='OK'
-        )
+            tx_id=tx_id, tx_type=gateway.TXTYPE_AUTHORISE,
+            status__in=wrappers.Response.OK_STATUSES)
     except models.RequestResponse.DoesNotExist:
         raise oscar_exceptions.PaymentError((
             "No successful AUTHORISE transaction found with "
@@ -207,13 +244,14 @@ def void(tx_id, order_number=None):
         security_key=authorise_txn.security_key)
     params = {
         'previous_txn': previous_txn,
+        'deadline': deadline,
     }
     if order_number is not None:
         params['reference'] = order_number
     try:
         response = gateway.void(**params)
     except exceptions.GatewayError as e:
-        raise oscar_exceptions.PaymentError(e.message)
+        raise _payment_error(e)
     if not response.is_ok:
         raise oscar_exceptions.PaymentError(
             response.status_detail)
@@ -1,17 +1,16 @@
 import httplib
 import collections
-import random
+import datetime
+import json
 import logging
 import re
+import time
 
 import requests
-# Oscar 0.4 doesn't have the bankcards module
-try:
-    from oscar.apps.payment import bankcards
-except ImportError:
-    from . import bankcards
 
-from . import models, exceptions, config, wrappers
+from . import (
+    audit, bankcards, breaker, exceptions, config, metrics, retries, signals,
+    txcodes, wrappers, transport)
 
 logger = logging.getLogger('oscar.sagepay')
 
@@ -32,82 +31,322 @@ PreviousTxn = collections.namedtuple(
     'PreviousTxn', ('vendor_tx_code', 'tx_id', 'tx_auth_num', 'security_key'))
 
 
+# Mapping from Oscar's card types to the CardType values that Sagepay accepts
+CARD_TYPE_CODES = {
+    bankcards.VISA: 'VISA',
+    bankcards.VISA_ELECTRON: 'UKE',
+    bankcards.MASTERCARD: 'MC',
+    bankcards.MAESTRO: 'MAESTRO',
+    bankcards.AMEX: 'AMEX',
+    bankcards.DINERS_CLUB: 'DC',
+    bankcards.LASER: 'LASER',
+    bankcards.JCB: 'JCB',
+}
+
+
 def _card_type(bankcard_number):
     """
     Convert card-number into appropriate card type that Sagepay will
     recognise.
     """
-    # Oscar provides a function to do the card-type recognition but we need to
-    # map into the values that Sagepay accepts.
-    oscar_type = bankcards.bankcard_type(bankcard_number)
-    mapping = {
-        bankcards.VISA: 'VISA',
-        bankcards.VISA_ELECTRON: 'UKE',
-        bankcards.MASTERCARD: 'MC',
-        bankcards.MAESTRO: 'MAESTRO',
-        bankcards.AMEX: 'AMEX',
-        bankcards.DINERS_CLUB: 'DC',
-        bankcards.LASER: 'LASER',
-        bankcards.JCB: 'JCB',
-    }
-    return mapping.get(oscar_type, '')
+    return CARD_TYPE_CODES.get(bankcards.bankcard_type(bankcard_number), '')
+
+
+# Result of validating a bankcard number in bulk
+BankcardDetails = collections.namedtuple(
+    'BankcardDetails', ('is_valid', 'card_type', 'sagepay_card_type'))
+
+
+def bankcard_details(card_numbers):
+    """
+    Validate and classify a sequence (or NumPy array) of bankcard numbers in
+    one pass, returning a list of BankcardDetails.
+
+    Numbers should be passed as strings as some valid numbers have leading
+    zeros.
+    """
+    card_numbers = [str(number) for number in card_numbers]
+    validity = bankcards.luhn_many(card_numbers)
+    card_types = bankcards.bankcard_types(card_numbers)
+    return [BankcardDetails(is_valid, card_type,
+                            CARD_TYPE_CODES.get(card_type, ''))
+            for is_valid, card_type in zip(validity, card_types)]
 
 
 def _vendor_tx_code(reference):
-    return u'%s-%s-%0.6d' % (
-        config.VENDOR_TX_CODE_PREFIX,
-        reference, random.randint(0, 1000000))
+    return txcodes.get_generator()(reference)
 
 
-def _request(url, tx_type, params, reference):
-    vendor_tx_code = _vendor_tx_code(reference)
+def _request_params(tx_type, params, reference):
+    """
+    Return the full set of params to POST to Sagepay for a transaction
+    """
     request_params = {
         'VPSProtocol': config.VPS_PROTOCOL,
         'Vendor': config.VENDOR,
         'TxType': tx_type,
-        'VendorTxCode': vendor_tx_code,
+        'VendorTxCode': _vendor_tx_code(reference),
     }
     request_params.update(params)
+    return request_params
 
-    # Create an audit model with request info
-    rr = models.RequestResponse.new(reference, request_params)
-
-    logger.info("Vendor TX code: %s, making %s request to %s",
-                vendor_tx_code, tx_type, url)
-    try:
-        http_response = requests.post(url, request_params)
-    except requests.exceptions.RequestException as e:
-        logger.error("Vendor TX code: %s, HTTP connection error: %s",
-                     vendor_tx_code, e.message)
-        raise exceptions.GatewayError(
-            "HTTP error: %s" % e.message)
 
-    if http_response.status_code != httplib.OK:
+def _parse_response(vendor_tx_code, status_code, content):
+    """
+    Convert a raw HTTP response from Sagepay into a Response instance,
+    raising a GatewayError if the HTTP request was not successful.
+    """
+    if status_code != httplib.OK:
         # Sagepay seem to return a status 200 even for bad requests
         logger.error("Vendor TX code: %s, HTTP response error: %s - %s",
-                     vendor_tx_code, http_response.status_code,
-                     http_response.content)
+                     vendor_tx_code, status_code, content)
         raise exceptions.GatewayError(
             "Sagepay server returned a %s response with content %s" % (
-                http_response.status_code, http_response.content))
+                status_code, content))
 
-    sp_response = wrappers.Response(vendor_tx_code, http_response.content)
+    sp_response = wrappers.Response(vendor_tx_code, content)
     logger.info("Vendor TX code: %s, Response status %s - %s",
                 vendor_tx_code, sp_response.status, sp_response.status_detail)
+    return sp_response
+
+
+class _Timer(object):
+    """
+    Records the time taken by each phase of a request
+    """
+
+    def __init__(self):
+        self.timings = collections.OrderedDict()
+        self._last = time.time()
 
-    # Update audit model with response info
-    rr.record_response(sp_response)
-    rr.save()
+    def mark(self, phase):
+        now = time.time()
+        self.timings[phase] = now - self._last
+        self._last = now
+
+
+class _NullTimer(object):
+    timings = None
+
+    def mark(self, phase):
+        pass
+
+_NULL_TIMER = _NullTimer()
+
+
+def _remaining(deadline):
+    """
+    Return the number of seconds left before a deadline (a ``time.time()``
+    timestamp), or None if there isn't one
+    """
+    if deadline is None:
+        return None
+    return max(deadline - time.time(), 0)
+
+
+def _request(url, tx_type, params, reference, deadline=None):
+    circuit = None
+    if config.BREAKER_ENABLED:
+        circuit = breaker.get_breaker(url)
+        if not circuit.allow():
+            logger.warning("Not making %s request to %s: circuit open",
+                           tx_type, url)
+            raise exceptions.CircuitOpen(
+                "Sagepay requests to %s are failing, try again later" % url)
+
+    # Requests are only timed if something is interested in the timings
+    if config.STORE_TIMINGS or signals.request_timed.receivers:
+        timer = _Timer()
+    else:
+        timer = _NULL_TIMER
+    rr = vendor_tx_code = status = None
+    start = time.time()
+    metrics.registry.started(tx_type)
+    try:
+        request_params = _request_params(tx_type, params, reference)
+        vendor_tx_code = request_params['VendorTxCode']
+        timer.mark('request_params')
+
+        # Create an audit model with request info
+        audit_backend = audit.get_backend()
+        rr = audit_backend.record_request(reference, request_params)
+        timer.mark('audit_request')
+
+        logger.info("Vendor TX code: %s, making %s request to %s",
+                    vendor_tx_code, tx_type, url)
+        try:
+            http_response, http_duration = _post(
+                url, request_params, rr, circuit, deadline)
+        except exceptions.GatewayError as error:
+            # Failed attempts have already been recorded with the breaker
+            logger.error("Vendor TX code: %s, HTTP connection error: %s",
+                         vendor_tx_code, error.message)
+            timer.mark('http')
+            _store_timings(rr, timer)
+            if isinstance(error, exceptions.GatewayTimeout):
+                status = error.status
+                rr.record_timeout(error)
+                error.request_response = rr
+            audit_backend.record_error(rr, _remaining(deadline))
+            raise error
+        timer.mark('http')
+        elapsed = getattr(http_response, 'elapsed', None)
+        if timer.timings is not None and isinstance(
+                elapsed, datetime.timedelta):
+            timer.timings['server'] = elapsed.total_seconds()
+
+        try:
+            sp_response = _parse_response(
+                vendor_tx_code, http_response.status_code,
+                http_response.content)
+        except exceptions.GatewayError:
+            if circuit is not None:
+                circuit.failure()
+            timer.mark('parse')
+            _store_timings(rr, timer)
+            audit_backend.record_error(rr, _remaining(deadline))
+            raise
+        timer.mark('parse')
+        status = sp_response.status
+        if circuit is not None:
+            circuit.record(http_duration)
+
+        # Update audit model with response info (which includes the timings so
+        # far)
+        _store_timings(rr, timer)
+        audit_backend.record_response(
+            rr, sp_response, _remaining(deadline))
+        timer.mark('audit_response')
+    finally:
+        metrics.registry.finished(tx_type, status, time.time() - start)
+        if timer.timings is not None:
+            signals.request_timed.send(
+                sender=None, tx_type=tx_type, vendor_tx_code=vendor_tx_code,
+                txn=rr, timings=timer.timings)
 
     return sp_response
 
 
+def _post(url, request_params, rr, circuit, deadline=None):
+    """
+    POST a request to Sagepay, retrying transient failures according to the
+    retry policy of its TxType.  Every attempt uses the same VendorTxCode and
+    is recorded on the same RequestResponse.  The timeouts of each attempt
+    are capped at the time left before the deadline, and no attempt is made
+    once it has passed.
+
+    Each attempt that fails with a transient error is recorded as a failure
+    with the circuit breaker (if any).  Attempts that returned a response
+    are left to the caller, which knows whether it was successful.
+
+    Returns the HTTP response and the time taken by the final attempt, or
+    raises a GatewayError (a GatewayTimeout if any attempt may have reached
+    Sagepay).
+    """
+    tx_type = request_params['TxType']
+    policy = retries.get_policy(tx_type)
+    outcome_unknown = False
+    for attempt in range(1, policy.attempts + 1):
+        remaining = _remaining(deadline)
+        if remaining == 0:
+            if attempt == 1:
+                raise exceptions.GatewayError(
+                    "Deadline passed before the request was sent")
+            raise _deadline_error(attempt - 1, outcome_unknown)
+        rr.attempts = attempt
+        start = time.time()
+        try:
+            http_response = transport.post(
+                url, request_params,
+                timeout=transport.get_timeout(tx_type, remaining))
+        except requests.exceptions.RequestException as e:
+            transient = retries.is_transient(e)
+            if transient and circuit is not None:
+                circuit.failure()
+            if not (transient and _can_retry(policy, attempt, circuit)):
+                raise _http_error(e, outcome_unknown)
+            # Only a failure to connect means the request wasn't sent
+            if not isinstance(e, requests.exceptions.ConnectTimeout):
+                outcome_unknown = True
+            error = "HTTP error: %s" % e.message
+        else:
+            if not (http_response.status_code in
+                    retries.TRANSIENT_STATUS_CODES and
+                    _can_retry(policy, attempt, circuit)):
+                return http_response, time.time() - start
+            if circuit is not None:
+                circuit.failure()
+            outcome_unknown = True
+            error = "HTTP status %s" % http_response.status_code
+
+        rr.attempt_errors += "Attempt %d: %s\n" % (attempt, error)
+        wait = retries.delay(policy, attempt)
+        remaining = _remaining(deadline)
+        if remaining is not None and wait >= remaining:
+            raise _deadline_error(attempt, outcome_unknown)
+        logger.warning("Vendor TX code: %s, attempt %d failed (%s), "
+                       "retrying in %.2fs", request_params['VendorTxCode'],
+                       attempt, error, wait)
+        time.sleep(wait)
+
+
+def _http_error(error, outcome_unknown=False):
+    """
+    Return the GatewayError to raise for the error of the final attempt of
+    a request.  ``outcome_unknown`` is whether an earlier attempt may have
+    reached Sagepay.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        if outcome_unknown:
+            return exceptions.GatewayTimeout(
+                "HTTP connect timeout: %s, earlier attempts' outcome "
+                "unknown" % error.message)
+        return exceptions.GatewayError(
+            "HTTP connect timeout: %s" % error.message)
+    if isinstance(error, requests.exceptions.Timeout):
+        # The request may have reached Sagepay
+        return exceptions.GatewayTimeout(
+            "HTTP timeout: %s, outcome unknown" % error.message)
+    if outcome_unknown:
+        return exceptions.GatewayTimeout(
+            "HTTP error: %s, earlier attempts' outcome unknown" %
+            error.message)
+    return exceptions.GatewayError("HTTP error: %s" % error.message)
+
+
+def _deadline_error(attempts, outcome_unknown):
+    if outcome_unknown:
+        return exceptions.GatewayTimeout(
+            "Deadline passed after %d attempts, outcome unknown" % attempts)
+    return exceptions.GatewayError(
+        "Deadline passed after %d attempts, none of which connected" %
+        attempts)
+
+
+def _can_retry(policy, attempt, circuit):
+    if attempt >= policy.attempts:
+        return False
+    # Stop retrying if other requests have tripped the circuit breaker
+    return circuit is None or not circuit.is_open
+
+
+def _store_timings(rr, timer):
+    if config.STORE_TIMINGS:
+        rr.timings_json = json.dumps(timer.timings)
+
+
+# Characters that Sagepay's validation rules reject
+_INVALID_NAME_CHARS = re.compile(r"[^\w &-.',0-9]", re.UNICODE)
+_INVALID_ADDRESS_CHARS = _INVALID_NAME_CHARS
+_INVALID_POSTCODE_CHARS = re.compile(r"[^-\w 0-9]")
+_INVALID_PHONE_CHARS = re.compile(r"[^0-9-A-Z+ ()]")
+
+
 def clean_name(input):
     """
     Clean a name string according to Sagepay's validation rules
     """
-    invalid = re.compile(r"[^\w &-.',0-9]", re.UNICODE)
-    return re.sub(invalid, '', input)
+    return _INVALID_NAME_CHARS.sub('', input)
 
 
 def clean_address(input):
@@ -115,93 +354,181 @@ def clean_address(input):
     Clean an address string according to Sagepay's validation rules
     """
     # We strip newlines even though they are permitted
-    invalid = re.compile(r"[^\w &-.',0-9]", re.UNICODE)
-    return re.sub(invalid, '', input)
+    return _INVALID_ADDRESS_CHARS.sub('', input)
 
 
 def clean_postcode(input):
     """
     Clean an postcode string according to Sagepay's validation rules
     """
-    invalid = re.compile(r"[^-\w 0-9]")
-    return re.sub(invalid, '', input)
+    return _INVALID_POSTCODE_CHARS.sub('', input)
 
 
 def clean_phone(input):
     """
     Clean a phone string according to Sagepay's validation rules
     """
-    invalid = re.compile(r"[^0-9-A-Z+ ()]")
-    return re.sub(invalid, '', input)
+    return _INVALID_PHONE_CHARS.sub('', input)
 
 
-def authenticate(amount, currency, reference='', **kwargs):
+# A field in the request params of a transaction.  The value is read from the
+# ``source`` key of the data passed to the gateway API (falling back to
+# ``default`` if missing or None), passed through ``cleaner`` and truncated to
+# ``max_length``.  If both the value and the default are None the field is
+# omitted.  Where ``country`` is set, the value is only submitted if
+# that param is 'US'.
+Field = collections.namedtuple(
+    'Field', ('name', 'source', 'cleaner', 'max_length', 'default', 'country'))
+Field.__new__.__defaults__ = (None, None, '', None)
+
+
+def _compile(fields):
     """
-    First part of 2-stage payment processing.
+    Convert a field schema into a list of (name, source, default, transform)
+    steps and a list of (name, country) rules, so that the work of
+    interpreting the schema is done once rather than on every request.
+    """
+    steps, country_rules = [], []
+    for field in fields:
+        steps.append((field.name, field.source, field.default,
+                      _transform(field.cleaner, field.max_length)))
+        if field.country:
+            country_rules.append((field.name, field.country))
+    return steps, country_rules
 
-    Successful requests will get a status of REGISTERED
-    """
-    # Ensure no None values in kwargs
-    for k, v in kwargs.items():
-        if v is None:
-            kwargs[k] = ''
-
-    bankcard_number = kwargs.get('bankcard_number', '')
-    params = {
-        # TXN DETAILS
-        'Amount': str(amount),
-        'Currency': currency,
-        'Description': kwargs.get('description', ''),
-        # BANKCARD DETAILS
-        'CardType': _card_type(bankcard_number),
-        'CardNumber': bankcard_number,
-        'CV2': kwargs.get('bankcard_ccv', ''),
-        # Required field, that is not documented, if not set it the request
-        # returns the error: '5017 : The Security Code(CV2) is required.'
-        'ApplyAVSCV2': kwargs.get('avscv2', '2'),
-        'CardHolder': kwargs.get('bankcard_name', ''),
-        'ExpiryDate': kwargs.get('bankcard_expiry', ''),
-        # BILLING DETAILS
-        'BillingSurname': clean_name(kwargs.get('billing_surname', ''))[:20],
-        'BillingFirstnames': clean_name(kwargs.get('billing_first_names', ''))[:20],
-        'BillingAddress1': clean_address(kwargs.get('billing_address1', ''))[:100],
-        'BillingAddress2': clean_address(kwargs.get('billing_address2', ''))[:100],
-        'BillingCity': clean_address(kwargs.get('billing_city', ''))[:40],
-        'BillingPostCode': clean_postcode(kwargs.get('billing_postcode', ''))[:10],
-        'BillingCountry': kwargs.get('billing_country', '')[:2],
-        'BillingState': kwargs.get('billing_state', '')[:2],
-        'BillingPhone': clean_phone(kwargs.get('billing_phone', ''))[:20],
-        # DELIVERY DETAILS
-        'DeliverySurname': clean_name(kwargs.get('delivery_surname', ''))[:20],
-        'DeliveryFirstnames': clean_name(kwargs.get(
-            'delivery_first_names', ''))[:20],
-        'DeliveryAddress1': clean_address(kwargs.get('delivery_address1', ''))[:100],
-        'DeliveryAddress2': clean_address(kwargs.get('delivery_address2', ''))[:100],
-        'DeliveryCity': clean_address(kwargs.get('delivery_city', ''))[:40],
-        'DeliveryPostCode': clean_postcode(kwargs.get('delivery_postcode', ''))[:10],
-        'DeliveryCountry': kwargs.get('delivery_country', '')[:2],
-        'DeliveryState': kwargs.get('delivery_state', '')[:2],
-        'DeliveryPhone': clean_phone(kwargs.get('delivery_phone', ''))[:20],
-        # TOKENS
-        'CreateToken': kwargs.get('create_token', 0),
-        'StoreToken': kwargs.get('create_token', 0),
-        # Misc
-        'CustomerEMail': kwargs.get('customer_email', ''),
-        'Basket': kwargs.get('basket_html', ''),
-    }
 
+def _transform(cleaner, max_length):
+    """
+    Return a single callable that cleans and truncates a value
+    """
+    if cleaner and max_length:
+        return lambda value: cleaner(value)[:max_length]
+    if max_length:
+        return lambda value: value[:max_length]
+    return cleaner
+
+
+def _optional(fields):
+    """
+    Return the passed fields without defaults, so that they are omitted
+    rather than sent empty when they have no value
+    """
+    return tuple(field._replace(default=None) for field in fields)
+
+
+def _build_params(schema, data):
+    """
+    Build the request params for a compiled schema from the passed data
+    """
+    steps, country_rules = schema
+    params = {}
+    for name, source, default, transform in steps:
+        value = data.get(source)
+        if value is None:
+            value = default
+            if value is None:
+                continue
+        params[name] = transform(value) if transform else value
+    for name, country in country_rules:
+        if params[country].upper() != 'US':
+            params[name] = ''
+    return params
+
+
+AUTHENTICATE_FIELDS = (
+    # TXN DETAILS
+    Field('Amount', 'amount', str),
+    Field('Currency', 'currency'),
+    Field('Description', 'description'),
+    # BANKCARD DETAILS
+    Field('CardType', 'bankcard_number', _card_type),
+    Field('CardNumber', 'bankcard_number'),
+    Field('CV2', 'bankcard_ccv'),
+    # Required field, that is not documented, if not set it the request
+    # returns the error: '5017 : The Security Code(CV2) is required.'
+    Field('ApplyAVSCV2', 'avscv2', default='2'),
+    Field('CardHolder', 'bankcard_name'),
+    Field('ExpiryDate', 'bankcard_expiry'),
+    # BILLING DETAILS
+    Field('BillingSurname', 'billing_surname', clean_name, 20),
+    Field('BillingFirstnames', 'billing_first_names', clean_name, 20),
+    Field('BillingAddress1', 'billing_address1', clean_address, 100),
+    Field('BillingAddress2', 'billing_address2', clean_address, 100),
+    Field('BillingCity', 'billing_city', clean_address, 40),
+    Field('BillingPostCode', 'billing_postcode', clean_postcode, 10),
+    Field('BillingCountry', 'billing_country', max_length=2),
     # Only submit state information for US
-    if params['BillingCountry'].upper() != 'US':
-        params['BillingState'] = ''
-    if params['DeliveryCountry'].upper() != 'US':
-        params['DeliveryState'] = ''
+    Field('BillingState', 'billing_state', max_length=2,
+          country='BillingCountry'),
+    Field('BillingPhone', 'billing_phone', clean_phone, 20),
+    # DELIVERY DETAILS
+    Field('DeliverySurname', 'delivery_surname', clean_name, 20),
+    Field('DeliveryFirstnames', 'delivery_first_names', clean_name, 20),
+    Field('DeliveryAddress1', 'delivery_address1', clean_address, 100),
+    Field('DeliveryAddress2', 'delivery_address2', clean_address, 100),
+    Field('DeliveryCity', 'delivery_city', clean_address, 40),
+    Field('DeliveryPostCode', 'delivery_postcode', clean_postcode, 10),
+    Field('DeliveryCountry', 'delivery_country', max_length=2),
+    Field('DeliveryState', 'delivery_state', max_length=2,
+          country='DeliveryCountry'),
+    Field('DeliveryPhone', 'delivery_phone', clean_phone, 20),
+    # TOKENS
+    Field('CreateToken', 'create_token', default=0),
+    Field('StoreToken', 'create_token', default=0),
+    # Misc
+    Field('CustomerEMail', 'customer_email'),
+    Field('Basket', 'basket_html'),
+)
+
+# Follow-up transactions read the details of the original transaction from
+# the fields of a PreviousTxn.  Details that it doesn't have (eg the TxAuthNo
+# of an AUTHENTICATE) are omitted.
+RELATED_TXN_FIELDS = _optional((
+    Field('Amount', 'amount', str),
+    Field('Currency', 'currency'),
+    Field('Description', 'description'),
+    Field('RelatedVPSTxId', 'tx_id'),
+    Field('RelatedVendorTxCode', 'vendor_tx_code'),
+    Field('RelatedTxAuthNo', 'tx_auth_num'),
+    Field('RelatedSecurityKey', 'security_key'),
+))
+
+AUTHORISE_FIELDS = RELATED_TXN_FIELDS + _optional((
+    Field('ApplyAVSCV2', 'avscv2'),
+))
+
+REFUND_FIELDS = RELATED_TXN_FIELDS
+
+VOID_FIELDS = _optional((
+    Field('VPSTxId', 'tx_id'),
+    Field('VendorTxCode', 'vendor_tx_code'),
+    Field('TxAuthNo', 'tx_auth_num'),
+    Field('SecurityKey', 'security_key'),
+))
+
+_AUTHENTICATE_SCHEMA = _compile(AUTHENTICATE_FIELDS)
+_AUTHORISE_SCHEMA = _compile(AUTHORISE_FIELDS)
+_REFUND_SCHEMA = _compile(REFUND_FIELDS)
+_VOID_SCHEMA = _compile(VOID_FIELDS)
+
+
+def authenticate(amount, currency, reference='', deadline=None, **kwargs):
+    """
+    First part of 2-stage payment processing.
 
+    Successful requests will get a status of REGISTERED.  If a ``deadline``
+    (a ``time.time()`` timestamp) is passed, a GatewayTimeout is raised if
+    no response has been received by then.
+    """
+    kwargs['amount'] = amount
+    kwargs['currency'] = currency
+    params = _build_params(_AUTHENTICATE_SCHEMA, kwargs)
     return _request(config.VPS_REGISTER_URL, TXTYPE_AUTHENTICATE, params,
-                    reference)
+                    reference, deadline)
 
 
 def authorise(previous_txn, amount, currency, description,
-              reference='', **kwargs):
+              reference='', deadline=None, **kwargs):
     """
     Second step of 2-stage payment processing
 
@@ -210,22 +537,16 @@ def authorise(previous_txn, amount, currency, description,
         amount.
         - You have to AUTHORIZE within 90 days
     """
-    params = {
-        'Amount': str(amount),
-        'Currency': currency,
-        'Description': description,
-        'RelatedVPSTxId': previous_txn.tx_id,
-        'RelatedVendorTxCode': previous_txn.vendor_tx_code,
-        'RelatedTxAuthNo': previous_txn.tx_auth_num,
-        'RelatedSecurityKey': previous_txn.security_key,
-        'ApplyAVSCV2': config.AVSCV2,
-    }
+    data = previous_txn._asdict()
+    data.update(amount=amount, currency=currency, description=description,
+                avscv2=config.AVSCV2)
+    params = _build_params(_AUTHORISE_SCHEMA, data)
     return _request(config.VPS_AUTHORISE_URL, TXTYPE_AUTHORISE, params,
-                    reference)
+                    reference, deadline)
 
 
 def refund(previous_txn, amount, currency, description, reference='',
-           **kwargs):
+           deadline=None, **kwargs):
     """
     Refund a txn
 
@@ -233,29 +554,20 @@ def refund(previous_txn, amount, currency, description, reference='',
         - You can send multiple refunds as long as the totals don't exceed the
         original amount.
     """
-    params = {
-        'Amount': str(amount),
-        'Currency': currency,
-        'Description': description,
-        'RelatedVPSTxId': previous_txn.tx_id,
-        'RelatedVendorTxCode': previous_txn.vendor_tx_code,
-        'RelatedTxAuthNo': previous_txn.tx_auth_num,
-        'RelatedSecurityKey': previous_txn.security_key,
-    }
-    return _request(config.VPS_REFUND_URL, TXTYPE_REFUND, params, reference)
+    data = previous_txn._asdict()
+    data.update(amount=amount, currency=currency, description=description)
+    params = _build_params(_REFUND_SCHEMA, data)
+    return _request(config.VPS_REFUND_URL, TXTYPE_REFUND, params, reference,
+                    deadline)
 
 
-def void(previous_txn, reference=''):
+def void(previous_txn, reference='', deadline=None):
     """
     Cancel an AUTHORISED transaction (before it settles)
 
     This can only be done before the end of the day that the AUTHORISE request
     takes place. After that, a REFUND is required.
     """
-    params = {
-        'VPSTxId': previous_txn.tx_id,
-        'VendorTxCode': previous_txn.vendor_tx_code,
-        'TxAuthNo': previous_txn.tx_auth_num,
-        'SecurityKey': previous_txn.security_key,
-    }
-    return _request(config.VPS_VOID_URL, TXTYPE_VOID, params, reference)
+    params = _build_params(_VOID_SCHEMA, previous_txn._asdict())
+    return _request(config.VPS_VOID_URL, TXTYPE_VOID, params, reference,
+                    deadline)
@@ -0,0 +1,51 @@
+import errno
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from oscar_sagepay import archive
+
+
+class Command(BaseCommand):
+    args = '/path/to/archive.jsonl.gz'
+    help = ("Move old transactions out of the database into a gzipped JSON "
+            "lines file.  Successful AUTHENTICATE and AUTHORISE transactions "
+            "are kept while they may still be followed up.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--days', dest='days', type='int', default=None,
+                    help='Archive transactions older than this many days'),
+        make_option('--follow-up-days', dest='follow_up_days', type='int',
+                    default=None,
+                    help=('Archive successful AUTHENTICATE and AUTHORISE '
+                          'transactions older than this many days')),
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=None,
+                    help='Number of transactions to archive at a time'),
+        make_option('--dry-run', dest='dry_run', action='store_true',
+                    default=False,
+                    help='Only report how many transactions would be '
+                    'archived'))
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Please specify an archive file")
+        qs = archive.archivable(options['days'], options['follow_up_days'])
+        if options['dry_run']:
+            self.stdout.write("%d transactions to archive" % qs.count())
+            return
+
+        def progress(num_archived, elapsed):
+            self.stdout.write("Archived %d transactions (%.0f/s)" % (
+                num_archived, num_archived / max(elapsed, 0.001)))
+
+        try:
+            num_archived = archive.archive_to_file(
+                args[0], qs, options['batch_size'], progress)
+        except EnvironmentError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            raise CommandError("%s already exists: archive to a new file" % (
+                e.filename))
+        self.stdout.write("Archived %d transactions to %s" % (
+            num_archived, args[0]))
@@ -0,0 +1,41 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from oscar_sagepay import bulk
+
+
+class Command(BaseCommand):
+    args = '/path/to/tx_ids.csv'
+    help = ("AUTHORISE previously AUTHENTICATEd transactions.  Each line of "
+            "the CSV file holds a TX ID and an optional amount.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', dest='workers', type='int', default=None,
+                    help='Number of concurrent requests'),
+        make_option('--vendor-limit', dest='vendor_limit', type='int',
+                    default=None,
+                    help='Maximum concurrent requests per vendor'),
+        make_option('--checkpoint', dest='checkpoint', default=None,
+                    help=('File to record progress in, so an interrupted '
+                          'run can be resumed')))
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Please specify a CSV file of TX IDs")
+        with open(args[0]) as f:
+            items = list(bulk.read_csv(f))
+
+        results = bulk.authorise(
+            items, workers=options['workers'],
+            vendor_limit=options['vendor_limit'],
+            checkpoint=options['checkpoint'])
+        num_errors = 0
+        for result in results:
+            if result.success:
+                self.stdout.write("%s OK %s" % (result.tx_id, result.value))
+            else:
+                num_errors += 1
+                self.stdout.write("%s ERROR %s" % (result.tx_id, result.error))
+        self.stdout.write("%d transactions, %d errors" % (
+            len(items), num_errors))
@@ -0,0 +1,34 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from oscar_sagepay import compression, models
+
+
+class Command(BaseCommand):
+    help = ("Compress the raw request and response payloads of existing "
+            "transactions, or decompress them with --decompress")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--decompress', dest='decompress', action='store_true',
+                    default=False,
+                    help='Decompress payloads instead of compressing them'),
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=500,
+                    help='Number of transactions to process at a time'))
+
+    def handle(self, *args, **options):
+        fn = compression.compress
+        if options['decompress']:
+            fn = compression.decompress
+
+        def progress(num_processed, elapsed):
+            self.stdout.write("Processed %d transactions (%.0f/s)" % (
+                num_processed, num_processed / max(elapsed, 0.001)))
+
+        num_changed, size_before, size_after = compression.convert(
+            models.RequestResponse.objects.all(), fn,
+            options['batch_size'], progress)
+        self.stdout.write(
+            "Converted %d transactions: payloads went from %d to %d "
+            "bytes" % (num_changed, size_before, size_after))
@@ -0,0 +1,44 @@
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from oscar_sagepay import bulk
+
+
+class Command(BaseCommand):
+    args = '/path/to/tx_ids.csv'
+    help = ("REFUND successful AUTHORISE transactions.  Each line of the CSV "
+            "file holds an AUTHORISE TX ID and an optional amount.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', dest='workers', type='int', default=None,
+                    help='Number of concurrent requests'),
+        make_option('--vendor-limit', dest='vendor_limit', type='int',
+                    default=None,
+                    help='Maximum concurrent requests per vendor'),
+        make_option('--rate', dest='rate', type='float', default=None,
+                    help='Maximum number of refunds per second'),
+        make_option('--checkpoint', dest='checkpoint', default=None,
+                    help=('File to record progress in, so an interrupted '
+                          'run can be resumed')),
+        make_option('--output', dest='output', default=None,
+                    help='CSV file to write results to (default: stdout)'))
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Please specify a CSV file of TX IDs")
+        with open(args[0]) as f:
+            items = list(bulk.read_csv(f))
+
+        results = bulk.refund(
+            items, workers=options['workers'],
+            vendor_limit=options['vendor_limit'], rate=options['rate'],
+            checkpoint=options['checkpoint'])
+        if options['output']:
+            with open(options['output'], 'a') as output:
+                num_errors = bulk.write_results(results, output)
+        else:
+            num_errors = bulk.write_results(results, sys.stdout)
+        self.stderr.write("%d transactions, %d errors" % (
+            len(items), num_errors))
@@ -0,0 +1,30 @@
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from oscar_sagepay import rollups
+
+
+class Command(BaseCommand):
+    help = ("Bring the hourly and daily transaction rollups used by the "
+            "dashboard report up to date.  Safe to run as often as you "
+            "like, eg from cron.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--days', dest='days', type='int', default=None,
+                    help=('Rebuild the rollups of this many days, rather '
+                          'than continuing from the most recent rollup')),)
+
+    def handle(self, *args, **options):
+        def progress(day, num_txns):
+            self.stdout.write("%s: %d transactions" % (
+                day.date(), num_txns))
+
+        if options['days']:
+            start = now() - datetime.timedelta(days=options['days'] - 1)
+            num_txns = rollups.rebuild(start, progress=progress)
+        else:
+            num_txns = rollups.catch_up(progress=progress)
+        self.stdout.write("Rolled up %d transactions" % num_txns)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from oscar_sagepay.dashboard import search
+
+try:
+    from django.db.transaction import atomic
+except ImportError:
+    # Django < 1.6
+    from django.db.transaction import commit_on_success as atomic
+
+
+class Command(BaseCommand):
+    help = ("Create the trigram indexes needed by substring search in the "
+            "dashboard (OSCAR_SAGEPAY_DASHBOARD_SUBSTRING_SEARCH).  "
+            "PostgreSQL only.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Substring search needs PostgreSQL")
+        with atomic():
+            created = search.create_trigram_indexes()
+        for name in created:
+            self.stdout.write("Created %s" % name)
+        self.stdout.write("Created %d indexes" % len(created))
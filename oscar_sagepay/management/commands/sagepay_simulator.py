@@ -0,0 +1,58 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from oscar_sagepay import simulator
+
+
+class Command(BaseCommand):
+    help = ("Run a local Sagepay Direct simulator.  Set "
+            "OSCAR_SAGEPAY_SIMULATOR_URL to the URL it prints to send "
+            "requests to it.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--host', dest='host', default='127.0.0.1',
+                    help='Address to listen on'),
+        make_option('--port', dest='port', type='int', default=8001,
+                    help='Port to listen on'),
+        make_option('--profile', dest='profile', default='instant',
+                    help=('Latency and error profile, one of: %s' % ', '.join(
+                        sorted(simulator.PROFILES)))),
+        make_option('--latency', dest='latency', type='float',
+                    help='Seconds to delay each response by'),
+        make_option('--jitter', dest='jitter', type='float',
+                    help='Maximum random extra delay in seconds'),
+        make_option('--error-rate', dest='error_rate', type='float',
+                    help='Proportion of requests to return ERROR for'),
+        make_option('--unavailable-rate', dest='unavailable_rate',
+                    type='float',
+                    help='Proportion of requests to return HTTP 503 for'),
+        make_option('--hang-rate', dest='hang_rate', type='float',
+                    help=('Proportion of requests to process but delay '
+                          'the response of')),
+        make_option('--hang', dest='hang', type='float',
+                    help='Seconds to delay hanging responses by'),
+        make_option('--seed', dest='seed', type='int', default=None,
+                    help='Random seed, for repeatable runs'),)
+
+    def handle(self, *args, **options):
+        try:
+            profile = simulator.PROFILES[options['profile']]
+        except KeyError:
+            raise CommandError("Unknown profile %s" % options['profile'])
+        overrides = dict(
+            (field, options[field]) for field in profile._fields
+            if options.get(field) is not None)
+        profile = profile._replace(**overrides)
+
+        server = simulator.SimulatorServer(
+            (options['host'], options['port']),
+            simulator.Simulator(profile, seed=options['seed']))
+        self.stdout.write("Sagepay simulator running at %s with %s" % (
+            server.url, profile))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
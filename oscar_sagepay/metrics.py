@@ -0,0 +1,330 @@
+"""
+An in-process registry of metrics about requests made to Sagepay, exported in
+the Prometheus text format.
+
+The registry records:
+
+- ``sagepay_requests_total``: a counter of requests by TX type and response
+  status (``HTTP_ERROR`` where no valid response was received)
+- ``sagepay_request_duration_seconds``: a histogram of request latency by TX
+  type
+- ``sagepay_requests_in_flight``: a gauge of requests in progress by TX type
+
+Each process keeps its own metrics.  When ``OSCAR_SAGEPAY_METRICS_DIR`` is set,
+each process also writes its metrics to a file in that directory (from a
+background thread, every ``OSCAR_SAGEPAY_METRICS_FLUSH_INTERVAL`` seconds)
+and the export adds up the files of all processes, so that the metrics are
+correct for servers that run several worker processes.  Counts of processes
+that have exited are kept, by merging their files into a single file of
+exited counts; their in-flight requests are not.
+"""
+import atexit
+import contextlib
+import fcntl
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from . import config, processes
+
+# Status recorded for requests that didn't get a valid response
+HTTP_ERROR = 'HTTP_ERROR'
+
+# Name of the file each process writes its metrics to, by process token
+_FILENAME = 'sagepay-%s.json'
+_FILENAME_PATTERN = re.compile(r'^sagepay-(\d+(?:-\d+)?)\.json$')
+# Name of the file holding the counts of processes that have exited
+_EXITED_FILENAME = 'sagepay-exited.json'
+# Name of the file locked while merging the files of exited processes
+_LOCK_FILENAME = 'sagepay.lock'
+
+# Upper bounds (in seconds) of the latency histogram buckets
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Registry(object):
+
+    def __init__(self, directory=None, buckets=BUCKETS, flush_interval=None):
+        self.directory = directory
+        self.buckets = buckets
+        self.flush_interval = flush_interval or config.METRICS_FLUSH_INTERVAL
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+        self._reset()
+        if directory:
+            atexit.register(self.flush)
+
+    def _reset(self):
+        # Keyed by (tx_type, status)
+        self.requests = {}
+        # Keyed by TX type.  Each value holds the count for each bucket
+        # (non-cumulative) followed by the count for +Inf, the sum and the
+        # count.
+        self.durations = {}
+        self.in_flight = {}
+        self._pid = os.getpid()
+        self._token = None
+        self._dirty = False
+        # The flushing thread doesn't survive a fork
+        self._thread = None
+
+    def _check_pid(self):
+        # Metrics inherited from a parent process belong to the parent
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _changed(self):
+        self._dirty = True
+        if self.directory and self._thread is None:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def started(self, tx_type):
+        """
+        Record that a request has been sent
+        """
+        with self._lock:
+            self._check_pid()
+            self.in_flight[tx_type] = self.in_flight.get(tx_type, 0) + 1
+            self._changed()
+
+    def finished(self, tx_type, status, duration):
+        """
+        Record that a request has completed, with the response status and the
+        time it took in seconds
+        """
+        with self._lock:
+            self._check_pid()
+            self.in_flight[tx_type] = self.in_flight.get(tx_type, 0) - 1
+            key = (tx_type, status or HTTP_ERROR)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if tx_type not in self.durations:
+                self.durations[tx_type] = [0] * (len(self.buckets) + 3)
+            values = self.durations[tx_type]
+            index = len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    index = i
+                    break
+            values[index] += 1
+            values[-2] += duration
+            values[-1] += 1
+            self._changed()
+
+    def snapshot(self):
+        """
+        Return the metrics of this process in a form that can be serialised
+        as JSON
+        """
+        with self._lock:
+            self._check_pid()
+            return json.loads(json.dumps(self._snapshot()))
+
+    def _snapshot(self):
+        return {
+            'requests': [list(key) + [value]
+                         for key, value in self.requests.items()],
+            'durations': self.durations,
+            'in_flight': self.in_flight,
+        }
+
+    def flush(self):
+        """
+        Write the metrics of this process to its file, if they have changed
+        since they were last written
+        """
+        if not self.directory:
+            return
+        # Writes are serialised so that an older snapshot can't replace a
+        # newer one, but don't hold up requests being recorded
+        with self._flush_lock:
+            with self._lock:
+                self._check_pid()
+                if not self._dirty:
+                    return
+                content = json.dumps(self._snapshot())
+                self._dirty = False
+                if self._token is None:
+                    self._token = processes.token()
+                path = os.path.join(self.directory, _FILENAME % self._token)
+            _write(self.directory, path, content)
+
+    def collect(self):
+        """
+        Return the combined metrics of all processes
+        """
+        if not self.directory:
+            return self.snapshot()
+        self.flush()
+        self._merge_exited()
+        snapshots = []
+        for filename in os.listdir(self.directory):
+            match = _FILENAME_PATTERN.match(filename)
+            if not match and filename != _EXITED_FILENAME:
+                continue
+            snapshot = _read(os.path.join(self.directory, filename))
+            if snapshot is None:
+                continue
+            if match and not processes.is_alive(match.group(1)):
+                # Exited since the files were merged
+                snapshot['in_flight'] = {}
+            snapshots.append(snapshot)
+        return merge(snapshots)
+
+    def _merge_exited(self):
+        """
+        Add the counts in the files of processes that have exited to the
+        exited counts, and remove the files.
+
+        The tokens of the merged files are recorded with the exited counts
+        so that a file left behind by a crash before it was removed isn't
+        counted twice.
+        """
+        with _locked(os.path.join(self.directory, _LOCK_FILENAME)):
+            exited_path = os.path.join(self.directory, _EXITED_FILENAME)
+            exited = _read(exited_path) or merge([])
+            merged = set(exited.get('merged', ()))
+            dead = []
+            for filename in os.listdir(self.directory):
+                match = _FILENAME_PATTERN.match(filename)
+                if match and not processes.is_alive(match.group(1)):
+                    dead.append(
+                        (match.group(1),
+                         os.path.join(self.directory, filename)))
+            if not dead:
+                return
+            snapshots, removable = [exited], []
+            for token, path in dead:
+                if token not in merged:
+                    snapshot = _read(path)
+                    if snapshot is None:
+                        continue
+                    snapshots.append(snapshot)
+                removable.append((token, path))
+            result = merge(snapshots)
+            result['in_flight'] = {}
+            result['merged'] = [token for token, __ in removable]
+            _write(self.directory, exited_path, json.dumps(result))
+            for __, path in removable:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def export(self):
+        """
+        Return the metrics in the Prometheus text format
+        """
+        return format_metrics(self.collect(), self.buckets)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (ValueError, IOError):
+        return None
+
+
+def _write(directory, path, content):
+    # Write to a temporary file and rename it so that readers never see a
+    # partly written file
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        f.write(content)
+    os.rename(tmp_path, path)
+
+
+@contextlib.contextmanager
+def _locked(path):
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def merge(snapshots):
+    """
+    Add up the metrics of several snapshots
+    """
+    requests, durations, in_flight = {}, {}, {}
+    for snapshot in snapshots:
+        for tx_type, status, value in snapshot['requests']:
+            key = (tx_type, status)
+            requests[key] = requests.get(key, 0) + value
+        for tx_type, values in snapshot['durations'].items():
+            if tx_type in durations:
+                durations[tx_type] = [
+                    a + b for a, b in zip(durations[tx_type], values)]
+            else:
+                durations[tx_type] = list(values)
+        for tx_type, value in snapshot['in_flight'].items():
+            in_flight[tx_type] = in_flight.get(tx_type, 0) + value
+    return {
+        'requests': [list(key) + [value] for key, value in requests.items()],
+        'durations': durations,
+        'in_flight': in_flight,
+    }
+
+
+def _label(value):
+    """
+    Escape a label value for the Prometheus text format
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def _float(value):
+    return '+Inf' if value == float('inf') else repr(float(value))
+
+
+def format_metrics(snapshot, buckets=BUCKETS):
+    lines = [
+        '# HELP sagepay_requests_total Requests made to Sagepay.',
+        '# TYPE sagepay_requests_total counter',
+    ]
+    for tx_type, status, value in sorted(snapshot['requests']):
+        lines.append(
+            'sagepay_requests_total{tx_type="%s",status="%s"} %d' % (
+                _label(tx_type), _label(status), value))
+    lines.extend([
+        '# HELP sagepay_request_duration_seconds Latency of requests made '
+        'to Sagepay.',
+        '# TYPE sagepay_request_duration_seconds histogram',
+    ])
+    for tx_type, values in sorted(snapshot['durations'].items()):
+        cumulative = 0
+        for bound, value in zip(list(buckets) + [float('inf')], values):
+            cumulative += value
+            lines.append(
+                'sagepay_request_duration_seconds_bucket'
+                '{tx_type="%s",le="%s"} %d' % (
+                    _label(tx_type), _float(bound), cumulative))
+        lines.append('sagepay_request_duration_seconds_sum{tx_type="%s"} %s'
+                     % (_label(tx_type), _float(values[-2])))
+        lines.append('sagepay_request_duration_seconds_count{tx_type="%s"} %d'
+                     % (_label(tx_type), values[-1]))
+    lines.extend([
+        '# HELP sagepay_requests_in_flight Requests to Sagepay in progress.',
+        '# TYPE sagepay_requests_in_flight gauge',
+    ])
+    for tx_type, value in sorted(snapshot['in_flight'].items()):
+        lines.append('sagepay_requests_in_flight{tx_type="%s"} %d' % (
+            _label(tx_type), value))
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry(config.METRICS_DIR)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding field 'RequestResponse.outcome'
+        db.add_column(u'oscar_sagepay_requestresponse', 'outcome',
+                      self.gf('django.db.models.fields.CharField')(db_index=True, default='', max_length=16, blank=True),
+                      keep_default=False)
+
+        # Adding field 'RequestResponse.status_code'
+        db.add_column(u'oscar_sagepay_requestresponse', 'status_code',
+                      self.gf('django.db.models.fields.PositiveIntegerField')(db_index=True, null=True, blank=True),
+                      keep_default=False)
+
+
+    def backwards(self, orm):
+        # Deleting field 'RequestResponse.outcome'
+        db.delete_column(u'oscar_sagepay_requestresponse', 'outcome')
+
+        # Deleting field 'RequestResponse.status_code'
+        db.delete_column(u'oscar_sagepay_requestresponse', 'status_code')
+
+
+    models = {
+        u'oscar_sagepay.requestresponse': {
+            'Meta': {'ordering': "('-request_datetime',)", 'object_name': 'RequestResponse'},
+            'amount': ('django.db.models.fields.DecimalField', [], {'null': 'True', 'max_digits': '12', 'decimal_places': '2', 'blank': 'True'}),
+            'currency': ('django.db.models.fields.CharField', [], {'max_length': '3', 'blank': 'True'}),
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '512', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'outcome': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '16', 'blank': 'True'}),
+            'protocol': ('django.db.models.fields.CharField', [], {'max_length': '12'}),
+            'raw_request_json': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'raw_response': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'reference': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '128', 'blank': 'True'}),
+            'related_tx_id': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '128', 'blank': 'True'}),
+            'request_datetime': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'response_datetime': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'security_key': ('django.db.models.fields.CharField', [], {'max_length': '128', 'blank': 'True'}),
+            'status': ('django.db.models.fields.CharField', [], {'max_length': '128', 'blank': 'True'}),
+            'status_code': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'status_detail': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'tx_auth_num': ('django.db.models.fields.CharField', [], {'max_length': '32', 'blank': 'True'}),
+            'tx_id': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '128', 'blank': 'True'}),
+            'tx_type': ('django.db.models.fields.CharField', [], {'max_length': '64'}),
+            'vendor': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'vendor_tx_code': ('django.db.models.fields.CharField', [], {'max_length': '128', 'db_index': 'True'})
+        }
+    }
+
+    complete_apps = ['oscar_sagepay']
\ No newline at end of file
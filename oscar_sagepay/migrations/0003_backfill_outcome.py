@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import collections
+import re
+
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import DataMigration
+from django.db import models
+
+# Number of rows to read at a time
+CHUNK_SIZE = 1000
+
+# The parsing of responses is copied here rather than imported so that later
+# changes to the package don't change what this migration does.
+SUCCESS_STATUSES = ('REGISTERED', 'OK', 'OK REPEATED')
+STATUS_CODE = re.compile(r'^\s*(\d+)')
+
+
+def response_params(raw_response):
+    params = {}
+    for line in raw_response.split('\r\n'):
+        key, sep, value = line.partition('=')
+        if sep:
+            params.setdefault(key, value)
+    return params
+
+
+def response_outcome(raw_response):
+    """
+    Return the (outcome, status code) pair for a raw response.  Responses
+    without a status are errors.
+    """
+    params = response_params(raw_response)
+    if params.get('Status', '') in SUCCESS_STATUSES:
+        outcome = 'success'
+    else:
+        outcome = 'error'
+    match = STATUS_CODE.match(params.get('StatusDetail', ''))
+    return outcome, int(match.group(1)) if match else None
+
+
+class Migration(DataMigration):
+
+    def forwards(self, orm):
+        # Work through the table in primary key order, a chunk at a time,
+        # committing each chunk so that no long-running locks are held on the
+        # audit table.  Rows that already have an outcome are skipped, so the
+        # migration can be rerun if it is interrupted.
+        RequestResponse = orm['oscar_sagepay.RequestResponse']
+        last_id = 0
+        while True:
+            rows = list(RequestResponse.objects.filter(
+                id__gt=last_id, outcome='').exclude(raw_response='').order_by(
+                    'id').values_list('id', 'raw_response')[:CHUNK_SIZE])
+            if not rows:
+                break
+            # Group rows with the same values so each group is one UPDATE
+            groups = collections.defaultdict(list)
+            for pk, raw_response in rows:
+                groups[response_outcome(raw_response)].append(pk)
+            for (outcome, status_code), pks in groups.items():
+                RequestResponse.objects.filter(pk__in=pks).update(
+                    outcome=outcome, status_code=status_code)
+            last_id = rows[-1][0]
+            db.commit_transaction()
+            db.start_transaction()
+
+    def backwards(self, orm):
+        # The columns are removed by the previous migration
+        pass
+
+    models = {
+        u'oscar_sagepay.requestresponse': {
+            'Meta': {'ordering': "('-request_datetime',)", 'object_name': 'RequestResponse'},
+            'amount': ('django.db.models.fields.DecimalField', [], {'null': 'True', 'max_digits': '12', 'decimal_places': '2', 'blank': 'True'}),
+            'currency': ('django.db.models.fields.CharField', [], {'max_length': '3', 'blank': 'True'}),
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '512', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'outcome': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '16', 'blank': 'True'}),
+            'protocol': ('django.db.models.fields.CharField', [], {'max_length': '12'}),
+            'raw_request_json': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'raw_response': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'reference': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '128', 'blank': 'True'}),
+            'related_tx_id': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '128', 'blank': 'True'}),
+            'request_datetime': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'response_datetime': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'security_key': ('django.db.models.fields.CharField', [], {'max_length': '128', 'blank': 'True'}),
+            'status': ('django.db.models.fields.CharField', [], {'max_length': '128', 'blank': 'True'}),
+            'status_code': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'status_detail': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'tx_auth_num': ('django.db.models.fields.CharField', [], {'max_length': '32', 'blank': 'True'}),
+            'tx_id': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '128', 'blank': 'True'}),
+            'tx_type': ('django.db.models.fields.CharField', [], {'max_length': '64'}),
+            'vendor': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'vendor_tx_code': ('django.db.models.fields.CharField', [], {'max_length': '128', 'db_index': 'True'})
+        }
+    }
+
+    complete_apps = ['oscar_sagepay']
+    symmetrical = True
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.conf import settings
+from django.db import models
+
+
+TABLE = 'oscar_sagepay_requestresponse'
+SEARCH_COLUMNS = ('vendor_tx_code', 'tx_id', 'reference')
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # For dashboard filtering by type and status, ordered by date
+        db.create_index(TABLE, ['tx_type', 'status', 'request_datetime'])
+
+        if db.backend_name != 'postgres':
+            return
+        if not getattr(settings, 'OSCAR_SAGEPAY_DASHBOARD_SUBSTRING_SEARCH',
+                       False):
+            # The indexes slow down every insert and creating the extension
+            # may need a superuser, so they are only created for substring
+            # search.  See the sagepay_search_indexes command for enabling
+            # it later.
+            return
+        # Trigram indexes make substring (LIKE '%x%') searches fast
+        db.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for column in SEARCH_COLUMNS:
+            db.execute(
+                'CREATE INDEX %s_%s_trgm ON %s USING gin (%s gin_trgm_ops)' % (
+                    TABLE, column, TABLE, column))
+
+    def backwards(self, orm):
+        db.delete_index(TABLE, ['tx_type', 'status', 'request_datetime'])
+
+        if db.backend_name != 'postgres':
+            return
+        for column in SEARCH_COLUMNS:
+            db.execute('DROP INDEX IF EXISTS %s_%s_trgm' % (TABLE, column))
+
+    models = {
+        u'oscar_sagepay.requestresponse': {
+            'Meta': {'ordering': "('-request_datetime',)", 'object_name': 'RequestResponse'},
+            'amount': ('django.db.models.fields.DecimalField', [], {'null': 'True', 'max_digits': '12', 'decimal_places': '2', 'blank': 'True'}),
+            'currency': ('django.db.models.fields.CharField', [], {'max_length': '3', 'blank': 'True'}),
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '512', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'outcome': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '16', 'blank': 'True'}),
+            'protocol': ('django.db.models.fields.CharField', [], {'max_length': '12'}),
+            'raw_request_json': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'raw_response': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'reference': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '128', 'blank': 'True'}),
+            'related_tx_id': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '128', 'blank': 'True'}),
+            'request_datetime': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'response_datetime': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'security_key': ('django.db.models.fields.CharField', [], {'max_length': '128', 'blank': 'True'}),
+            'status': ('django.db.models.fields.CharField', [], {'max_length': '128', 'blank': 'True'}),
+            'status_code': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'status_detail': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'tx_auth_num': ('django.db.models.fields.CharField', [], {'max_length': '32', 'blank': 'True'}),
+            'tx_id': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '128', 'blank': 'True'}),
+            'tx_type': ('django.db.models.fields.CharField', [], {'max_length': '64'}),
+            'vendor': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'vendor_tx_code': ('django.db.models.fields.CharField', [], {'max_length': '128', 'db_index': 'True'})
+        }
+    }
+
+    complete_apps = ['oscar_sagepay']
\ No newline at end of file
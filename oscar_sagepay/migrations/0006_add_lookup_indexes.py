@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+TABLE = 'oscar_sagepay_requestresponse'
+AUTHORISE_OK_INDEX = '%s_authorise_ok' % TABLE
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # For looking up a transaction by TX ID, optionally restricted by type
+        # and status (eg the AUTHORISE for a REFUND or VOID)
+        db.create_index(TABLE, ['tx_id', 'tx_type', 'status'])
+
+        # REFUND and VOID only ever look up successful AUTHORISE transactions
+        # so a partial index covering just those rows is much smaller.  MySQL
+        # doesn't support partial indexes.
+        if db.backend_name in ('postgres', 'sqlite3'):
+            db.execute(
+                "CREATE INDEX %s ON %s (tx_id) "
+                "WHERE tx_type = 'AUTHORISE' AND status = 'OK'" % (
+                    AUTHORISE_OK_INDEX, TABLE))
+
+    def backwards(self, orm):
+        db.delete_index(TABLE, ['tx_id', 'tx_type', 'status'])
+        if db.backend_name in ('postgres', 'sqlite3'):
+            db.execute('DROP INDEX %s' % AUTHORISE_OK_INDEX)
+
+    models = {
+        u'oscar_sagepay.requestresponse': {
+            'Meta': {'ordering': "('-request_datetime',)", 'object_name': 'RequestResponse'},
+            'amount': ('django.db.models.fields.DecimalField', [], {'null': 'True', 'max_digits': '12', 'decimal_places': '2', 'blank': 'True'}),
+            'currency': ('django.db.models.fields.CharField', [], {'max_length': '3', 'blank': 'True'}),
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '512', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'outcome': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '16', 'blank': 'True'}),
+            'protocol': ('django.db.models.fields.CharField', [], {'max_length': '12'}),
+            'raw_request_json': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'raw_response': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'reference': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '128', 'blank': 'True'}),
+            'related_tx_id': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '128', 'blank': 'True'}),
+            'request_datetime': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'response_datetime': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'security_key': ('django.db.models.fields.CharField', [], {'max_length': '128', 'blank': 'True'}),
+            'status': ('django.db.models.fields.CharField', [], {'max_length': '128', 'blank': 'True'}),
+            'status_code': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'status_detail': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'tx_auth_num': ('django.db.models.fields.CharField', [], {'max_length': '32', 'blank': 'True'}),
+            'tx_id': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '128', 'blank': 'True'}),
+            'tx_type': ('django.db.models.fields.CharField', [], {'max_length': '64'}),
+            'vendor': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'vendor_tx_code': ('django.db.models.fields.CharField', [], {'max_length': '128', 'db_index': 'True'})
+        }
+    }
+
+    complete_apps = ['oscar_sagepay']
\ No newline at end of file
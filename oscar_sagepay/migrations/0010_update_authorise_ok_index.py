@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+TABLE = 'oscar_sagepay_requestresponse'
+AUTHORISE_OK_INDEX = '%s_authorise_ok' % TABLE
+
+
+class Migration(SchemaMigration):
+
+    # REFUND and VOID now also look up AUTHORISE transactions with an OK
+    # REPEATED status (from retried requests), so the partial index needs to
+    # cover those rows too.
+
+    def forwards(self, orm):
+        if db.backend_name in ('postgres', 'sqlite3'):
+            db.execute('DROP INDEX %s' % AUTHORISE_OK_INDEX)
+            db.execute(
+                "CREATE INDEX %s ON %s (tx_id) WHERE tx_type = 'AUTHORISE' "
+                "AND status IN ('OK', 'OK REPEATED')" % (
+                    AUTHORISE_OK_INDEX, TABLE))
+
+    def backwards(self, orm):
+        if db.backend_name in ('postgres', 'sqlite3'):
+            db.execute('DROP INDEX %s' % AUTHORISE_OK_INDEX)
+            db.execute(
+                "CREATE INDEX %s ON %s (tx_id) "
+                "WHERE tx_type = 'AUTHORISE' AND status = 'OK'" % (
+                    AUTHORISE_OK_INDEX, TABLE))
+
+    models = {
+        u'oscar_sagepay.requestresponse': {
+            'Meta': {'ordering': "('-request_datetime',)", 'object_name': 'RequestResponse'},
+            'amount': ('django.db.models.fields.DecimalField', [], {'null': 'True', 'max_digits': '12', 'decimal_places': '2', 'blank': 'True'}),
+            'attempt_errors': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'attempts': ('django.db.models.fields.PositiveIntegerField', [], {'default': '1'}),
+            'currency': ('django.db.models.fields.CharField', [], {'max_length': '3', 'blank': 'True'}),
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '512', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'outcome': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '16', 'blank': 'True'}),
+            'protocol': ('django.db.models.fields.CharField', [], {'max_length': '12'}),
+            'raw_request_json': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'raw_response': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'reference': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '128', 'blank': 'True'}),
+            'related_tx_id': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '128', 'blank': 'True'}),
+            'request_datetime': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'response_datetime': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'security_key': ('django.db.models.fields.CharField', [], {'max_length': '128', 'blank': 'True'}),
+            'status': ('django.db.models.fields.CharField', [], {'max_length': '128', 'blank': 'True'}),
+            'status_code': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'status_detail': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'timings_json': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'tx_auth_num': ('django.db.models.fields.CharField', [], {'max_length': '32', 'blank': 'True'}),
+            'tx_id': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '128', 'blank': 'True'}),
+            'tx_type': ('django.db.models.fields.CharField', [], {'max_length': '64'}),
+            'vendor': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'vendor_tx_code': ('django.db.models.fields.CharField', [], {'max_length': '128', 'db_index': 'True'})
+        },
+        u'oscar_sagepay.requestrollup': {
+            'Meta': {'ordering': "('-period_start', 'tx_type', 'currency', 'status')", 'unique_together': "(('period', 'period_start', 'tx_type', 'currency', 'status'),)", 'object_name': 'RequestRollup'},
+            'amount': ('django.db.models.fields.DecimalField', [], {'default': '0', 'max_digits': '16', 'decimal_places': '2'}),
+            'currency': ('django.db.models.fields.CharField', [], {'max_length': '3', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'max_response_ms': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'mean_response_ms': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'num_requests': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'num_responses': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'p50_response_ms': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'p95_response_ms': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'period': ('django.db.models.fields.CharField', [], {'max_length': '8'}),
+            'period_start': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True'}),
+            'status': ('django.db.models.fields.CharField', [], {'max_length': '128', 'blank': 'True'}),
+            'tx_type': ('django.db.models.fields.CharField', [], {'max_length': '64'})
+        }
+    }
+
+    complete_apps = ['oscar_sagepay']
\ No newline at end of file
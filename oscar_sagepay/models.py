@@ -1,9 +1,41 @@
+import collections
 import json
+import re
 
 from django.db import models
 from django.utils.timezone import now
+from django.utils.translation import ugettext_lazy as _
 
-from . import wrappers
+from . import compression, wrappers
+
+# Outcomes of a transaction, stored so that they can be filtered on without
+# parsing the raw response.
+OUTCOME_NONE, OUTCOME_SUCCESS, OUTCOME_ERROR = '', 'success', 'error'
+# The request timed out so Sagepay may or may not have processed it
+OUTCOME_UNKNOWN = 'unknown'
+OUTCOME_CHOICES = (
+    (OUTCOME_NONE, _("No response")),
+    (OUTCOME_SUCCESS, _("Success")),
+    (OUTCOME_ERROR, _("Error")),
+    (OUTCOME_UNKNOWN, _("Timed out, outcome unknown")),
+)
+
+# Status details start with a numeric code, eg "3009 : The VendorTxCode is
+# missing."
+_STATUS_CODE = re.compile(r'^\s*(\d+)')
+
+
+def response_outcome(response):
+    """
+    Return the (outcome, status code) pair to store for a Response instance.
+    Responses without a status are errors.
+    """
+    if response.is_successful:
+        outcome = OUTCOME_SUCCESS
+    else:
+        outcome = OUTCOME_ERROR
+    match = _STATUS_CODE.match(response.status_detail)
+    return outcome, int(match.group(1)) if match else None
 
 
 class RequestResponse(models.Model):
@@ -39,6 +71,27 @@ class RequestResponse(models.Model):
     related_tx_id = models.CharField(max_length=128, blank=True,
                                      db_index=True)
 
+    # Denormalised from the response
+    outcome = models.CharField(max_length=16, choices=OUTCOME_CHOICES,
+                               blank=True, db_index=True)
+    status_code = models.PositiveIntegerField(null=True, blank=True,
+                                              db_index=True)
+
+    # Number of times the request was sent, and the errors of the attempts
+    # that were retried
+    attempts = models.PositiveIntegerField(default=1)
+    attempt_errors = models.TextField(blank=True)
+
+    # Time taken by each phase of the request, if OSCAR_SAGEPAY_STORE_TIMINGS
+    # is enabled
+    timings_json = models.TextField(blank=True)
+
+    # Fields populated by record_response
+    RESPONSE_FIELDS = (
+        'status', 'status_detail', 'tx_id', 'tx_auth_num', 'security_key',
+        'raw_response', 'response_datetime', 'outcome', 'status_code',
+        'timings_json', 'attempts', 'attempt_errors')
+
     class Meta:
         ordering = ('-request_datetime',)
 
@@ -54,7 +107,24 @@ class RequestResponse(models.Model):
 
     @property
     def raw_request(self):
-        return json.loads(self.raw_request_json)
+        return json.loads(compression.decompress(self.raw_request_json))
+
+    @property
+    def timings(self):
+        """
+        The time in seconds taken by each phase of the request, keyed by phase
+        """
+        if not self.timings_json:
+            return {}
+        return json.loads(self.timings_json,
+                          object_pairs_hook=collections.OrderedDict)
+
+    @property
+    def raw_response_text(self):
+        """
+        The raw response, decompressed if necessary
+        """
+        return compression.decompress(self.raw_response)
 
     def request_as_html(self):
         rows = []
@@ -90,7 +160,7 @@ class RequestResponse(models.Model):
                 safe_params[key] = '<removed>'
         if 'Amount' in safe_params:
             safe_params['Amount'] = str(safe_params['Amount'])
-        self.raw_request_json = json.dumps(safe_params)
+        self.raw_request_json = compression.store(json.dumps(safe_params))
         self.request_datetime = now()
 
     def record_response(self, response):
@@ -102,27 +172,101 @@ class RequestResponse(models.Model):
         self.tx_id = response.tx_id
         self.tx_auth_num = response.tx_auth_num
         self.security_key = response.security_key
-        self.raw_response = response.raw
+        self.raw_response = compression.store(response.raw)
+        self.response_datetime = now()
+        self.outcome, self.status_code = response_outcome(response)
+
+    def record_timeout(self, error):
+        """
+        Update fields based on a GatewayTimeout, leaving the transaction to be
+        reconciled
+        """
+        self.status = error.status
+        self.status_detail = error.message
         self.response_datetime = now()
+        self.outcome = OUTCOME_UNKNOWN
+
+    def save_response(self):
+        """
+        Write the response fields of an existing instance to the database.
+
+        Only the response columns are written, in a single UPDATE statement.
+        """
+        fields = dict(
+            (name, getattr(self, name)) for name in self.RESPONSE_FIELDS)
+        type(self)._default_manager.filter(pk=self.pk).update(**fields)
 
     @property
     def response(self):
         try:
             response = wrappers.Response(
-                self.vendor_tx_code, self.raw_response)
+                self.vendor_tx_code, self.raw_response_text)
         except Exception:
             response = wrappers.EmptyResponse
         return response
 
     @property
     def is_error(self):
+        if self.outcome or not self.raw_response:
+            return self.outcome != OUTCOME_SUCCESS
+        # Rows recorded before the outcome was stored
         return self.response.is_error
 
     @property
     def is_successful(self):
+        if self.outcome or not self.raw_response:
+            return self.outcome == OUTCOME_SUCCESS
         return self.response.is_successful
 
     @property
     def response_time_as_ms(self):
         delta = self.response_datetime - self.request_datetime
         return 1000 * delta.seconds + delta.microseconds / 1000
+
+
+class RequestRollup(models.Model):
+    """
+    Aggregated figures for the transactions of each TX type, currency and
+    status requested within an hour or a day.
+
+    Rollups are maintained by the sagepay_rollup command and let reports
+    cover long periods without reading individual transactions.
+    """
+    HOUR, DAY = 'hour', 'day'
+    PERIOD_CHOICES = (
+        (HOUR, _("Hour")),
+        (DAY, _("Day")),
+    )
+    period = models.CharField(max_length=8, choices=PERIOD_CHOICES)
+    period_start = models.DateTimeField(db_index=True)
+
+    tx_type = models.CharField(max_length=64)
+    currency = models.CharField(max_length=3, blank=True)
+    status = models.CharField(max_length=128, blank=True)
+
+    num_requests = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(decimal_places=2, max_digits=16, default=0)
+
+    # Response times of the transactions that received a response
+    num_responses = models.PositiveIntegerField(default=0)
+    mean_response_ms = models.PositiveIntegerField(null=True, blank=True)
+    p50_response_ms = models.PositiveIntegerField(null=True, blank=True)
+    p95_response_ms = models.PositiveIntegerField(null=True, blank=True)
+    max_response_ms = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ('-period_start', 'tx_type', 'currency', 'status')
+        unique_together = (
+            'period', 'period_start', 'tx_type', 'currency', 'status')
+
+    def __unicode__(self):
+        return u"%s %s %s %s" % (
+            self.period_start, self.tx_type, self.currency, self.status)
+
+
+class VendorTxCodeBlock(models.Model):
+    """
+    A block of VendorTxCode numbers reserved by a process using the
+    DatabaseSequenceGenerator.  Only the ID matters.
+    """
+    created_datetime = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,74 @@
+"""
+Identify processes for state that is kept in files shared between them.
+
+A process is identified by a token made of its ID and its start time, so that
+a process which is given the ID of one that has died isn't mistaken for it.
+Start times are read from ``/proc``; where that isn't available the token is
+just the process ID.
+"""
+import errno
+import os
+
+
+def start_time(pid):
+    """
+    Return the start time of a process in clock ticks since boot, or None if
+    it can't be found
+    """
+    try:
+        with open('/proc/%d/stat' % pid) as f:
+            stat = f.read()
+    except (IOError, OSError):
+        return None
+    # The command name may contain spaces, so skip past it
+    fields = stat[stat.rfind(')') + 2:].split()
+    try:
+        return int(fields[19])
+    except (IndexError, ValueError):
+        return None
+
+
+def token(pid=None):
+    """
+    Return the token identifying a process (default: the current one)
+    """
+    if pid is None:
+        pid = os.getpid()
+    started = start_time(pid)
+    if started is None:
+        return str(pid)
+    return '%d-%d' % (pid, started)
+
+
+def parse(value):
+    """
+    Return the (pid, start time) pair of a token, or None if it isn't one.
+    The start time is None for tokens without one.
+    """
+    pid, __, started = value.partition('-')
+    try:
+        return int(pid), int(started) if started else None
+    except ValueError:
+        return None
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def is_alive(value):
+    """
+    Return whether the process identified by a token is still running
+    """
+    pid, started = parse(value)
+    if not is_running(pid):
+        return False
+    if started is not None:
+        current = start_time(pid)
+        if current is not None and current != started:
+            return False
+    return True
@@ -0,0 +1,62 @@
+"""
+Retry policies for requests to Sagepay.
+
+Requests that fail with a transient error (a connection error, a timeout or
+a 5xx gateway response) are retried with the same VendorTxCode, so that
+Sagepay's duplicate detection stops a transaction from being processed twice:
+a retry of a transaction that was in fact processed gets an ``OK REPEATED``
+response.
+
+Policies are configured per TxType with the ``OSCAR_SAGEPAY_RETRY_POLICIES``
+setting, eg::
+
+    OSCAR_SAGEPAY_RETRY_POLICIES = {
+        'AUTHORISE': {'attempts': 3, 'backoff': 0.5, 'max_backoff': 5.0},
+    }
+
+TxTypes without a policy are not retried.
+"""
+import collections
+import random
+
+import requests
+
+from . import config
+
+RetryPolicy = collections.namedtuple(
+    'RetryPolicy', ('attempts', 'backoff', 'max_backoff'))
+
+NO_RETRIES = RetryPolicy(1, 0, 0)
+
+# Errors after which the request may not have reached Sagepay, or Sagepay may
+# not have finished processing it
+TRANSIENT_ERRORS = (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout)
+
+# HTTP statuses returned when Sagepay (or something in front of it) is
+# temporarily unavailable
+TRANSIENT_STATUS_CODES = (502, 503, 504)
+
+
+def get_policy(tx_type):
+    options = config.RETRY_POLICIES.get(tx_type)
+    if not options:
+        return NO_RETRIES
+    # Every request is sent at least once
+    return RetryPolicy(
+        attempts=max(options.get('attempts', 1), 1),
+        backoff=options.get('backoff', config.RETRY_BACKOFF),
+        max_backoff=options.get('max_backoff', config.RETRY_MAX_BACKOFF))
+
+
+def is_transient(error):
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def delay(policy, attempt):
+    """
+    Return the number of seconds to wait before the attempt following
+    ``attempt``, using exponential backoff with full jitter
+    """
+    return random.uniform(
+        0, min(policy.max_backoff, policy.backoff * 2 ** (attempt - 1)))
@@ -0,0 +1,158 @@
+"""
+Hourly and daily rollups of transactions for reporting.
+
+Each rollup is recomputed from scratch from the transactions requested in its
+period, so rebuilding any range of periods is idempotent.  ``catch_up``
+rebuilds everything from the start of the most recent stored period (which
+may have been incomplete when it was computed) up to now.
+
+Once transactions have been archived they can't be counted again, so the
+rollups of a day are never rebuilt from fewer transactions than they were
+computed from, and ``rebuild`` doesn't go back further than the oldest
+remaining transaction.
+"""
+import collections
+import datetime
+import logging
+import math
+from decimal import Decimal as D
+
+from django.db.models import Sum
+from django.utils.timezone import now
+
+from . import models
+
+try:
+    from django.db.transaction import atomic
+except ImportError:
+    # Django < 1.6
+    from django.db.transaction import commit_on_success as atomic
+
+logger = logging.getLogger('oscar.sagepay')
+
+_Key = collections.namedtuple('_Key', ('tx_type', 'currency', 'status'))
+
+
+def day_start(value):
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def response_ms(request_datetime, response_datetime):
+    delta = response_datetime - request_datetime
+    return (delta.days * 86400 + delta.seconds) * 1000 + \
+        delta.microseconds // 1000
+
+
+def percentile(values, fraction):
+    """
+    Return the nearest-rank percentile of a sorted list of values
+    """
+    rank = int(math.ceil(fraction * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+def _aggregate(rows, period, period_start):
+    groups = collections.defaultdict(list)
+    for row in rows:
+        groups[_Key(*row[:3])].append(row[3:])
+    rollups = []
+    for key, values in sorted(groups.items()):
+        rollup = models.RequestRollup(
+            period=period, period_start=period_start,
+            num_requests=len(values), **key._asdict())
+        rollup.amount = sum((amount or D('0.00') for amount, __, __ in values),
+                            D('0.00'))
+        times = sorted(
+            response_ms(requested, responded)
+            for __, requested, responded in values if responded)
+        if times:
+            rollup.num_responses = len(times)
+            rollup.mean_response_ms = sum(times) // len(times)
+            rollup.p50_response_ms = percentile(times, 0.5)
+            rollup.p95_response_ms = percentile(times, 0.95)
+            rollup.max_response_ms = times[-1]
+        rollups.append(rollup)
+    return rollups
+
+
+def rebuild_day(start):
+    """
+    Recompute the hourly and daily rollups of the day starting at ``start``.
+
+    The day is skipped, leaving its rollups as they are, if they count more
+    transactions than remain (ie some have been archived).  Returns the
+    number of transactions read, or 0 if the day was skipped.
+    """
+    end = start + datetime.timedelta(days=1)
+    rows = models.RequestResponse.objects.filter(
+        request_datetime__gte=start, request_datetime__lt=end).values_list(
+            'tx_type', 'currency', 'status', 'amount', 'request_datetime',
+            'response_datetime')
+    rows = list(rows)
+    num_rolled_up = models.RequestRollup.objects.filter(
+        period=models.RequestRollup.DAY, period_start=start).aggregate(
+            total=Sum('num_requests'))['total'] or 0
+    if num_rolled_up > len(rows):
+        logger.warning(
+            "Not rebuilding the rollups for %s: they count %d transactions "
+            "but only %d remain", start, num_rolled_up, len(rows))
+        return 0
+    hours = collections.defaultdict(list)
+    for row in rows:
+        hours[row[4].replace(minute=0, second=0, microsecond=0)].append(row)
+    rollups = _aggregate(rows, models.RequestRollup.DAY, start)
+    for hour, hour_rows in hours.items():
+        rollups.extend(_aggregate(hour_rows, models.RequestRollup.HOUR, hour))
+    with atomic():
+        models.RequestRollup.objects.filter(
+            period_start__gte=start, period_start__lt=end).delete()
+        models.RequestRollup.objects.bulk_create(rollups)
+    return len(rows)
+
+
+def rebuild(start, end=None, progress=None):
+    """
+    Recompute the rollups of each day from the one containing ``start`` up
+    to the one containing ``end`` (default: now).  Days before the oldest
+    remaining transaction are skipped.  Returns the number of transactions
+    read.
+
+    ``progress`` is called after each day with the start of the day and the
+    number of transactions read.
+    """
+    oldest = _oldest_request_datetime()
+    if oldest is None:
+        return 0
+    day = day_start(max(start, oldest))
+    end = end or now()
+    num_txns = 0
+    while day <= end:
+        num = rebuild_day(day)
+        num_txns += num
+        if progress is not None:
+            progress(day, num)
+        day += datetime.timedelta(days=1)
+    return num_txns
+
+
+def catch_up(progress=None):
+    """
+    Bring the rollups up to date, starting from the most recent stored
+    rollup (or the first transaction if there are none)
+    """
+    latest = models.RequestRollup.objects.filter(
+        period=models.RequestRollup.DAY).order_by('-period_start')[:1]
+    if latest:
+        start = latest[0].period_start
+    else:
+        start = _oldest_request_datetime()
+        if start is None:
+            return 0
+    return rebuild(start, progress=progress)
+
+
+def _oldest_request_datetime():
+    first = models.RequestResponse.objects.filter(
+        request_datetime__isnull=False).order_by(
+            'request_datetime').values_list('request_datetime', flat=True)[:1]
+    return first[0] if first else None
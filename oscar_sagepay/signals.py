@@ -0,0 +1,19 @@
+from django.dispatch import Signal
+
+# Sent once a request to Sagepay has completed (or failed) with the time in
+# seconds spent in each phase of the request.  ``timings`` is an ordered dict
+# with some or all of these keys, in this order:
+#
+# - ``request_params``: adding the protocol, vendor and VendorTxCode to the
+#   request params (the params for each TxType are built before timing starts)
+# - ``audit_request``: recording the request
+# - ``http``: sending the request and reading the response, including any
+#   connection setup
+# - ``server``: the part of ``http`` spent waiting for the response headers
+#   (not included in the total)
+# - ``parse``: parsing the response
+# - ``audit_response``: recording the response
+#
+# ``txn`` is the RequestResponse instance recording the request.
+request_timed = Signal(
+    providing_args=['tx_type', 'vendor_tx_code', 'txn', 'timings'])
@@ -0,0 +1,417 @@
+"""
+A local simulator of the Sagepay Direct protocol 3.00 endpoints, for testing
+and load testing without network access to Sagepay.
+
+The simulator validates requests much like Sagepay does and keeps the
+transactions it has registered in memory, so that AUTHORISE, REFUND and VOID
+requests can follow on from earlier ones.  It is started with the
+``sagepay_simulator`` command; set ``OSCAR_SAGEPAY_SIMULATOR_URL`` to the URL
+it prints to send the gateway's requests to it.
+
+Latency and failures are controlled by a Profile:
+
+- ``latency`` and ``jitter``: each response is delayed by ``latency`` plus a
+  random amount of up to ``jitter`` seconds.
+- ``error_rate``: the proportion of requests that get a ``Status=ERROR``
+  response.
+- ``unavailable_rate``: the proportion of requests that get an HTTP 503
+  response without being processed.
+- ``hang_rate`` and ``hang``: the proportion of requests that are processed
+  but whose response is delayed by ``hang`` seconds, so that the client times
+  out without knowing the outcome.
+"""
+import collections
+import logging
+import random
+import re
+import socket
+import string
+import sys
+import threading
+import time
+import uuid
+from decimal import Decimal as D, InvalidOperation
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import parse_qsl
+
+from . import bankcards
+
+logger = logging.getLogger('oscar.sagepay.simulator')
+
+Profile = collections.namedtuple(
+    'Profile', ('latency', 'jitter', 'error_rate', 'unavailable_rate',
+                'hang_rate', 'hang'))
+Profile.__new__.__defaults__ = (0, 0, 0, 0, 0, 60)
+
+PROFILES = {
+    'instant': Profile(),
+    'realistic': Profile(0.3, 0.4),
+    'flaky': Profile(0.3, 0.4, error_rate=0.02, unavailable_rate=0.05,
+                     hang_rate=0.01),
+    'outage': Profile(unavailable_rate=1),
+}
+
+# Paths of the endpoints, relative to the URL of the simulator
+REGISTER_PATH = '/register'
+AUTHORISE_PATH = '/authorise'
+REFUND_PATH = '/refund'
+VOID_PATH = '/void'
+
+# TxTypes accepted by each endpoint
+TX_TYPES = {
+    REGISTER_PATH: ('PAYMENT', 'DEFERRED', 'AUTHENTICATE'),
+    AUTHORISE_PATH: ('AUTHORISE',),
+    REFUND_PATH: ('REFUND',),
+    VOID_PATH: ('VOID',),
+}
+
+
+def path_for(tx_type):
+    """
+    Return the path of the endpoint for a TxType
+    """
+    for path, tx_types in TX_TYPES.items():
+        if tx_type in tx_types:
+            return path
+    return REGISTER_PATH
+
+COMMON_FIELDS = ('VPSProtocol', 'TxType', 'Vendor', 'VendorTxCode')
+REQUIRED_FIELDS = {
+    'PAYMENT': (
+        'Amount', 'Currency', 'Description', 'CardHolder', 'CardNumber',
+        'ExpiryDate', 'CardType', 'BillingSurname', 'BillingFirstnames',
+        'BillingAddress1', 'BillingCity', 'BillingPostCode', 'BillingCountry',
+        'DeliverySurname', 'DeliveryFirstnames', 'DeliveryAddress1',
+        'DeliveryCity', 'DeliveryPostCode', 'DeliveryCountry'),
+    'AUTHORISE': (
+        'Amount', 'Description', 'RelatedVPSTxId', 'RelatedVendorTxCode',
+        'RelatedSecurityKey'),
+    'REFUND': (
+        'Amount', 'Currency', 'Description', 'RelatedVPSTxId',
+        'RelatedVendorTxCode', 'RelatedSecurityKey', 'RelatedTxAuthNo'),
+    'VOID': ('VPSTxId', 'SecurityKey', 'TxAuthNo'),
+}
+REQUIRED_FIELDS['DEFERRED'] = REQUIRED_FIELDS['PAYMENT']
+REQUIRED_FIELDS['AUTHENTICATE'] = REQUIRED_FIELDS['PAYMENT']
+
+CARD_TYPES = ('VISA', 'UKE', 'MC', 'MCDEBIT', 'DELTA', 'MAESTRO', 'AMEX',
+              'DC', 'JCB', 'LASER')
+
+# Up to 115% of an AUTHENTICATE amount can be authorised
+MAX_AUTHORISE_RATIO = D('1.15')
+
+_AMOUNT = re.compile(r'^\d{1,6}(\.\d{1,2})?$')
+_CURRENCY = re.compile(r'^[A-Z]{3}$')
+_EXPIRY_DATE = re.compile(r'^(0[1-9]|1[0-2])\d\d$')
+
+OK = 'OK'
+OK_REPEATED = 'OK REPEATED'
+REGISTERED = 'REGISTERED'
+MALFORMED = 'MALFORMED'
+INVALID = 'INVALID'
+ERROR = 'ERROR'
+
+
+class Rejected(Exception):
+    """
+    Raised while processing a request that Sagepay would reject
+    """
+
+    def __init__(self, status, detail):
+        super(Rejected, self).__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def format_response(params):
+    return ''.join('%s=%s\r\n' % (key, value) for key, value in params)
+
+
+class Simulator(object):
+    """
+    The state and logic of the simulated gateway.  ``handle`` is thread-safe.
+    """
+
+    def __init__(self, profile=PROFILES['instant'], seed=None):
+        self.profile = profile
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # Transactions by VPSTxId
+        self._txns = {}
+        # Responses by (VendorTxCode, TxType), for detecting repeats
+        self._responses = {}
+
+    def handle(self, path, params):
+        """
+        Process a request and return the HTTP status code and body to send
+        """
+        profile = self.profile
+        with self._lock:
+            roll = self._random.random()
+            delay = profile.latency + self._random.uniform(0, profile.jitter)
+        if roll < profile.unavailable_rate:
+            time.sleep(delay)
+            return 503, 'Service Unavailable'
+        roll -= profile.unavailable_rate
+        if roll < profile.error_rate:
+            time.sleep(delay)
+            return 200, format_response(self._status(
+                ERROR, '5000 : An internal error occurred.'))
+        roll -= profile.error_rate
+        if roll < profile.hang_rate:
+            delay += profile.hang
+        body = format_response(self.process(path, params))
+        time.sleep(delay)
+        return 200, body
+
+    def process(self, path, params):
+        """
+        Return the response params for a request
+        """
+        try:
+            self._validate(path, params)
+            key = (params['VendorTxCode'], params['TxType'])
+            with self._lock:
+                previous = self._responses.get(key)
+                if previous is not None:
+                    return self._repeat(previous)
+                response = self._process(params)
+                self._responses[key] = response
+                return response
+        except Rejected as e:
+            return self._status(e.status, e.detail)
+
+    def transaction(self, tx_id):
+        """
+        Return the stored details of a transaction
+        """
+        return self._txns.get(tx_id)
+
+    def _status(self, status, detail):
+        return [('VPSProtocol', '3.00'), ('Status', status),
+                ('StatusDetail', detail)]
+
+    def _repeat(self, response):
+        # Successful requests that are retried get the original response, so
+        # that the retry is recognised as the same transaction
+        status = dict(response)['Status']
+        if status == REGISTERED:
+            return response
+        if status != OK:
+            raise Rejected(
+                INVALID, '4042 : The VendorTxCode has been used before.')
+        return [(key, OK_REPEATED if key == 'Status' else value)
+                for key, value in response]
+
+    def _validate(self, path, params):
+        for field in COMMON_FIELDS:
+            _require(params, field)
+        try:
+            protocol = D(params['VPSProtocol'])
+        except InvalidOperation:
+            protocol = None
+        if protocol != D('3.00'):
+            raise Rejected(
+                INVALID,
+                '3227 : The VPSProtocol value is not supported by the system '
+                'in use.')
+        tx_type = params['TxType']
+        if path not in TX_TYPES:
+            raise Rejected(INVALID, '3046 : The service is not supported.')
+        if tx_type not in TX_TYPES[path]:
+            raise Rejected(INVALID, '3014 : The TxType or PaymentType is '
+                           'invalid.')
+        if len(params['VendorTxCode']) > 40:
+            raise Rejected(INVALID, '3009 : The VendorTxCode is too long.')
+        for field in REQUIRED_FIELDS[tx_type]:
+            _require(params, field)
+        if 'Amount' in params:
+            _validate_amount(params['Amount'])
+        if 'Currency' in params and not _CURRENCY.match(params['Currency']):
+            raise Rejected(INVALID, '3005 : The Currency is invalid.')
+        if 'CardNumber' in params:
+            _validate_card(params)
+
+    def _process(self, params):
+        tx_type = params['TxType']
+        if tx_type in TX_TYPES[REGISTER_PATH]:
+            return self._register(params)
+        if tx_type == 'AUTHORISE':
+            return self._authorise(params)
+        if tx_type == 'REFUND':
+            return self._refund(params)
+        return self._void(params)
+
+    def _new_txn(self, params, status, amount, related=None):
+        txn = {
+            'tx_id': '{%s}' % str(uuid.uuid4()).upper(),
+            'tx_type': params['TxType'],
+            'vendor_tx_code': params['VendorTxCode'],
+            'security_key': ''.join(self._random.choice(
+                string.ascii_uppercase + string.digits) for __ in range(10)),
+            'tx_auth_num': str(self._random.randint(1000, 999999)),
+            'status': status,
+            'amount': amount,
+            # Amount authorised or refunded against this transaction
+            'used': D('0.00'),
+            'voided': False,
+            'related': related,
+        }
+        self._txns[txn['tx_id']] = txn
+        return txn
+
+    def _register(self, params):
+        if params['TxType'] == 'AUTHENTICATE':
+            txn = self._new_txn(params, REGISTERED, D(params['Amount']))
+            return self._status(
+                REGISTERED, 'Direct transaction from Simulator.') + [
+                    ('VPSTxId', txn['tx_id']),
+                    ('SecurityKey', txn['security_key'])]
+        txn = self._new_txn(params, OK, D(params['Amount']))
+        return self._authorised(txn, 'Direct transaction from Simulator.')
+
+    def _authorise(self, params):
+        related = self._related(params, ('AUTHENTICATE',), REGISTERED)
+        amount = D(params['Amount'])
+        if related['used'] + amount > related['amount'] * MAX_AUTHORISE_RATIO:
+            raise Rejected(
+                INVALID, '4009 : The Amount including surcharge is outside '
+                'the allowed range.')
+        related['used'] += amount
+        txn = self._new_txn(params, OK, amount, related['tx_id'])
+        return self._authorised(txn, 'AUTHORISE transaction from Simulator.')
+
+    def _refund(self, params):
+        related = self._related(params, ('PAYMENT', 'AUTHORISE'), OK)
+        if params['RelatedTxAuthNo'] != related['tx_auth_num']:
+            raise Rejected(
+                INVALID, '4028 : The RelatedTxAuthNo does not match.')
+        amount = D(params['Amount'])
+        if related['used'] + amount > related['amount']:
+            raise Rejected(
+                INVALID, '4035 : This Refund would exceed the amount of the '
+                'original transaction.')
+        related['used'] += amount
+        txn = self._new_txn(params, OK, amount, related['tx_id'])
+        return self._status(OK, 'REFUND transaction from Simulator.') + [
+            ('VPSTxId', txn['tx_id']), ('TxAuthNo', txn['tx_auth_num'])]
+
+    def _void(self, params):
+        txn = self._txns.get(params['VPSTxId'])
+        if (txn is None or txn['vendor_tx_code'] != params['VendorTxCode']
+                or txn['status'] != OK):
+            raise Rejected(INVALID, '4004 : The VPSTxId cannot be found.')
+        if (params['SecurityKey'] != txn['security_key'] or
+                params['TxAuthNo'] != txn['tx_auth_num']):
+            raise Rejected(INVALID, '4026 : The SecurityKey or TxAuthNo '
+                           'does not match.')
+        if txn['voided']:
+            raise Rejected(INVALID, '4040 : The transaction has already '
+                           'been voided.')
+        txn['voided'] = True
+        return self._status(OK, 'VOID transaction from Simulator.')
+
+    def _related(self, params, tx_types, status):
+        txn = self._txns.get(params['RelatedVPSTxId'])
+        if (txn is None or txn['tx_type'] not in tx_types or
+                txn['status'] != status or txn['voided'] or
+                txn['vendor_tx_code'] != params['RelatedVendorTxCode']):
+            raise Rejected(
+                INVALID, '4004 : The RelatedVPSTxId cannot be found.')
+        if params['RelatedSecurityKey'] != txn['security_key']:
+            raise Rejected(
+                INVALID, '4026 : The RelatedSecurityKey does not match.')
+        return txn
+
+    def _authorised(self, txn, detail):
+        return self._status(OK, detail) + [
+            ('VPSTxId', txn['tx_id']),
+            ('SecurityKey', txn['security_key']),
+            ('TxAuthNo', txn['tx_auth_num']),
+            ('AVSCV2', 'DATA NOT CHECKED'),
+            ('AddressResult', 'NOTCHECKED'),
+            ('PostCodeResult', 'NOTCHECKED'),
+            ('CV2Result', 'NOTCHECKED')]
+
+
+def _require(params, field):
+    if not params.get(field):
+        raise Rejected(MALFORMED, '3000 : The %s field is missing.' % field)
+
+
+def _validate_amount(amount):
+    if not _AMOUNT.match(amount) or not (
+            D('0.01') <= D(amount) <= D('100000')):
+        raise Rejected(INVALID, '3018 : The Amount value is invalid.')
+
+
+def _validate_card(params):
+    if params['CardType'] not in CARD_TYPES:
+        raise Rejected(INVALID, '3001 : The CardType is invalid.')
+    number = params['CardNumber']
+    if not (number.isdigit() and bankcards.luhn(number)):
+        raise Rejected(INVALID, '4021 : The Card Range not supported by the '
+                       'system.')
+    if not _EXPIRY_DATE.match(params['ExpiryDate']):
+        raise Rejected(INVALID, '3021 : The ExpiryDate is invalid.')
+
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        params = dict(parse_qsl(self.rfile.read(length),
+                                keep_blank_values=True))
+        path = self.path.split('?', 1)[0]
+        status_code, body = self.server.simulator.handle(path, params)
+        body = body.encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class SimulatorServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    A threaded HTTP server for a Simulator
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, simulator):
+        BaseHTTPServer.HTTPServer.__init__(self, address, RequestHandler)
+        self.simulator = simulator
+
+    def handle_error(self, request, client_address):
+        error = sys.exc_info()[1]
+        if isinstance(error, socket.error):
+            # Clients close the connection when they time out waiting for a
+            # slow response
+            logger.debug("Connection from %s closed: %s",
+                         client_address[0], error)
+            return
+        BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+
+def start(host='127.0.0.1', port=0, simulator=None):
+    """
+    Start a simulator server in a background thread and return it.  Use
+    port 0 to pick a free port; the server's ``url`` attribute gives the URL
+    to use.  Stop the server with its ``shutdown`` method.
+    """
+    server = SimulatorServer((host, port), simulator or Simulator())
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
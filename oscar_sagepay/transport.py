@@ -0,0 +1,250 @@
+"""
+HTTP transports used to talk to Sagepay.
+
+The transport is selected with the ``OSCAR_SAGEPAY_TRANSPORT`` setting:
+
+- ``oscar_sagepay.transport.RequestsTransport`` (the default) sends requests
+  through a ``requests.Session`` so that connections to the Sagepay servers
+  are pooled and kept alive between transactions rather than paying for a
+  new TCP+TLS handshake on every request.
+- ``oscar_sagepay.transport.Urllib3Transport`` sends requests through a
+  urllib3 ``PoolManager``, which avoids the per-request overhead of
+  requests.
+- ``oscar_sagepay.transport.FakeTransport`` doesn't open any sockets: it
+  returns scripted responses, or answers requests with an in-process
+  simulator.  It is for tests and benchmarks.
+
+A transport has a ``post(url, data, timeout=None)`` method which returns an
+object with ``status_code`` and ``content`` attributes (and optionally
+``elapsed``), and raises ``requests.exceptions.RequestException`` subclasses
+for errors so that the gateway can handle them the same way whichever
+transport is used.
+"""
+import collections
+import datetime
+import importlib
+import os
+import threading
+import time
+
+import requests
+import six
+from requests.adapters import HTTPAdapter
+from six.moves.urllib.parse import urlencode
+
+try:
+    import urllib3
+except ImportError:
+    from requests.packages import urllib3
+
+from . import config
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+_transport = None
+
+
+def get_transport():
+    """
+    Return the configured transport
+    """
+    global _transport
+    if _transport is None:
+        module_path, class_name = config.TRANSPORT.rsplit('.', 1)
+        module = importlib.import_module(module_path)
+        _transport = getattr(module, class_name)()
+    return _transport
+
+
+def _new_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_CONNECTIONS,
+                          pool_maxsize=config.HTTP_POOL_MAXSIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not config.HTTP_KEEP_ALIVE:
+        session.headers['Connection'] = 'close'
+    return session
+
+
+def get_session():
+    """
+    Return the pooled session for the current process.
+
+    The session is recreated if the process ID has changed since it was
+    created, so that pooled sockets are never shared between the parent and
+    child processes of a pre-forking server such as gunicorn or uWSGI.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _lock:
+            if _session is None or _session_pid != pid:
+                _session = _new_session()
+                _session_pid = pid
+    return _session
+
+
+def reset():
+    """
+    Close the current session and its pooled connections
+    """
+    global _session, _session_pid
+    with _lock:
+        if _session is not None and _session_pid == os.getpid():
+            _session.close()
+        _session = None
+        _session_pid = None
+
+
+def get_timeout(tx_type, remaining=None):
+    """
+    Return the (connect, read) timeout for requests of a TxType, capped at
+    ``remaining`` seconds if passed
+    """
+    options = config.HTTP_TIMEOUTS.get(tx_type, {})
+    connect = options.get('connect', config.HTTP_CONNECT_TIMEOUT)
+    read = options.get('read', config.HTTP_READ_TIMEOUT)
+    if remaining is not None:
+        connect, read = min(connect, remaining), min(read, remaining)
+    return connect, read
+
+
+def post(url, data, timeout=None):
+    """
+    POST the passed data to the given URL and return the HTTP response
+    """
+    return get_transport().post(url, data, timeout=timeout)
+
+
+class Response(object):
+    """
+    A response returned by transports other than RequestsTransport
+    """
+
+    def __init__(self, status_code, content, elapsed=None):
+        self.status_code = status_code
+        self.content = content
+        self.elapsed = elapsed
+
+
+class RequestsTransport(object):
+    """
+    Send requests with requests, through a pooled session unless
+    ``OSCAR_SAGEPAY_HTTP_POOL`` is disabled
+    """
+
+    def post(self, url, data, timeout=None):
+        if not config.HTTP_POOL:
+            return requests.post(url, data, timeout=timeout)
+        return get_session().post(url, data, timeout=timeout)
+
+
+class Urllib3Transport(object):
+    """
+    Send requests with a urllib3 PoolManager.  Like the requests session, the
+    pool manager is recreated after a fork.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._manager = None
+        self._pid = None
+
+    def _get_manager(self):
+        pid = os.getpid()
+        if self._manager is None or self._pid != pid:
+            with self._lock:
+                if self._manager is None or self._pid != pid:
+                    self._manager = urllib3.PoolManager(
+                        num_pools=config.HTTP_POOL_CONNECTIONS,
+                        maxsize=config.HTTP_POOL_MAXSIZE)
+                    self._pid = pid
+        return self._manager
+
+    def close(self):
+        with self._lock:
+            if self._manager is not None and self._pid == os.getpid():
+                self._manager.clear()
+            self._manager = None
+            self._pid = None
+
+    def post(self, url, data, timeout=None):
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        if not config.HTTP_KEEP_ALIVE:
+            headers['Connection'] = 'close'
+        if timeout is not None:
+            timeout = urllib3.Timeout(connect=timeout[0], read=timeout[1])
+        start = time.time()
+        try:
+            response = self._get_manager().urlopen(
+                'POST', url, body=_encode(data), headers=headers,
+                timeout=timeout, retries=False, redirect=False)
+        except urllib3.exceptions.HTTPError as e:
+            raise _requests_error(e)
+        return Response(response.status, response.data,
+                        datetime.timedelta(seconds=time.time() - start))
+
+
+def _encode(data):
+    return urlencode(dict(
+        (key, value.encode('utf-8') if isinstance(value, six.text_type)
+         else value) for key, value in data.items()))
+
+
+def _requests_error(error):
+    """
+    Return the requests exception corresponding to a urllib3 one
+    """
+    if isinstance(error, urllib3.exceptions.MaxRetryError):
+        error = error.reason or error
+    if isinstance(error, urllib3.exceptions.ConnectTimeoutError):
+        return requests.exceptions.ConnectTimeout(error)
+    if isinstance(error, urllib3.exceptions.ReadTimeoutError):
+        return requests.exceptions.ReadTimeout(error)
+    return requests.exceptions.ConnectionError(error)
+
+
+class FakeTransport(object):
+    """
+    Answer requests without opening any sockets.
+
+    Responses queued with ``script`` are returned first, in order.  Each is
+    either the content of a response, a (status code, content) pair or an
+    exception to raise.  Once the script runs out, requests are answered by
+    an in-process ``oscar_sagepay.simulator.Simulator``.
+
+    The most recent requests are kept in ``requests`` as (url, data) pairs.
+    """
+
+    def __init__(self, simulator=None, history=1000):
+        if simulator is None:
+            from . import simulator as simulator_module
+            simulator = simulator_module.Simulator()
+        self.simulator = simulator
+        self.scripted = collections.deque()
+        self.requests = collections.deque(maxlen=history)
+
+    def script(self, *responses):
+        self.scripted.extend(responses)
+
+    def post(self, url, data, timeout=None):
+        self.requests.append((url, data))
+        try:
+            response = self.scripted.popleft()
+        except IndexError:
+            return self._simulate(data)
+        if isinstance(response, Exception):
+            raise response
+        if isinstance(response, tuple):
+            return Response(*response)
+        return Response(200, response)
+
+    def _simulate(self, data):
+        from . import simulator
+        params = dict(
+            (key, six.text_type(value)) for key, value in data.items())
+        path = simulator.path_for(params.get('TxType'))
+        return Response(200, simulator.format_response(
+            self.simulator.process(path, params)))
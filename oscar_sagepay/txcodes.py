@@ -0,0 +1,186 @@
+"""
+Generators of VendorTxCodes.
+
+A VendorTxCode is made up of the ``OSCAR_SAGEPAY_TX_CODE_PREFIX``, the
+reference (normally the order number) and a suffix which makes the code
+unique, eg ``oscar-100001-kq3d9x0a1b2``.  Sagepay limits codes to 40
+characters, so the reference is shortened where necessary; the suffix is
+never shortened.
+
+The generator is selected with the ``OSCAR_SAGEPAY_TX_CODE_GENERATOR``
+setting:
+
+- ``oscar_sagepay.txcodes.SequenceGenerator`` (the default) uses a counter
+  combined with the host, process ID and process start time.
+- ``oscar_sagepay.txcodes.ULIDGenerator`` uses a time-ordered ULID, so codes
+  sort in the order they were generated.
+- ``oscar_sagepay.txcodes.DatabaseSequenceGenerator`` allocates blocks of
+  numbers from the database, so codes are short and sequential within each
+  process; the database is only queried once per block.  It is only safe on
+  PostgreSQL (see the class).
+
+None of them query the database per code or rely on chance to avoid
+collisions.
+"""
+import hashlib
+import importlib
+import itertools
+import os
+import random
+import socket
+import threading
+import time
+
+from . import config
+
+MAX_LENGTH = 40
+
+_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+# Crockford's base32, as used by ULIDs
+_CROCKFORD = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+
+def encode(number, alphabet=_ALPHABET, length=None):
+    """
+    Encode a non-negative integer using the passed alphabet, padded to
+    ``length`` characters if given
+    """
+    base = len(alphabet)
+    chars = []
+    while number:
+        number, remainder = divmod(number, base)
+        chars.append(alphabet[remainder])
+    value = ''.join(reversed(chars)) or alphabet[0]
+    if length is not None:
+        value = value.rjust(length, alphabet[0])
+    return value
+
+
+def join(reference, suffix):
+    """
+    Return the VendorTxCode for a reference and unique suffix, shortening the
+    prefix and reference if necessary so it fits Sagepay's length limit
+    """
+    head = config.VENDOR_TX_CODE_PREFIX
+    if reference:
+        head = u'%s-%s' % (head, reference)
+    head = head[:MAX_LENGTH - len(suffix) - 1]
+    if not head:
+        return suffix
+    return u'%s-%s' % (head, suffix)
+
+
+class _PerProcess(object):
+    """
+    Base class for generators that hold per-process state, which is reset
+    after a fork so that parent and child never share it
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _check_pid(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._reset(pid)
+                    self._pid = pid
+
+    def _reset(self, pid):
+        raise NotImplementedError
+
+    def __call__(self, reference):
+        self._check_pid()
+        return join(reference, self.suffix())
+
+
+class SequenceGenerator(_PerProcess):
+    """
+    Codes made from the host, process ID, process start time and a per-process
+    counter
+    """
+
+    def _reset(self, pid):
+        host = hashlib.md5(socket.gethostname().encode('utf8')).hexdigest()
+        # The start time distinguishes processes that reuse a process ID
+        self._node = '%s%s%s' % (
+            encode(int(host, 16) % 36 ** 4, length=4),
+            encode(pid, length=4),
+            encode(int(time.time()), length=6))
+        self._counter = itertools.count()
+
+    def suffix(self):
+        # next() on an itertools.count is atomic
+        return '%s%s' % (self._node, encode(next(self._counter)))
+
+
+class ULIDGenerator(_PerProcess):
+    """
+    Codes ending with a ULID: a 48 bit millisecond timestamp followed by 80
+    random bits.  Within each millisecond, the random part is incremented
+    rather than regenerated so that codes from the same process are ordered
+    and can't collide.
+    """
+
+    def _reset(self, pid):
+        self._random = random.SystemRandom()
+        self._last_ms = None
+        self._last_random = None
+
+    def suffix(self):
+        with self._lock:
+            ms = int(time.time() * 1000)
+            if ms == self._last_ms:
+                self._last_random += 1
+            else:
+                self._last_ms = ms
+                self._last_random = self._random.getrandbits(80)
+            value = (ms << 80) | (self._last_random & (2 ** 80 - 1))
+        return encode(value, _CROCKFORD, 26)
+
+
+class DatabaseSequenceGenerator(_PerProcess):
+    """
+    Codes made from numbers allocated in blocks from the database.  Each block
+    is reserved by inserting a row into the VendorTxCodeBlock table, whose ID
+    identifies the block.
+
+    The row is inserted in the caller's transaction, if there is one, so
+    this generator must only be used with PostgreSQL, where IDs come from a
+    sequence and are never handed out twice even if that transaction is
+    rolled back.  Other databases (eg SQLite and MySQL) can give a rolled
+    back ID to the next insert, so two processes could be allocated the same
+    block.
+    """
+    block_size = 1000
+
+    def _reset(self, pid):
+        self._block = None
+        self._index = self.block_size
+
+    def suffix(self):
+        with self._lock:
+            if self._index >= self.block_size:
+                from . import models
+                self._block = models.VendorTxCodeBlock.objects.create().pk
+                self._index = 0
+            index = self._index
+            self._index += 1
+        return encode(self._block * self.block_size + index)
+
+
+_generator = None
+
+
+def get_generator():
+    """
+    Return the configured generator
+    """
+    global _generator
+    if _generator is None:
+        module_path, class_name = config.TX_CODE_GENERATOR.rsplit('.', 1)
+        module = importlib.import_module(module_path)
+        _generator = getattr(module, class_name)()
+    return _generator
@@ -1,10 +1,20 @@
-import collections
+import six
+
+_MISSING = object()
 
 
 class Response(object):
     """
     Response object wrapping providing easy access to the returned parameters
+
+    The response body isn't split up front: each parameter is found by
+    scanning the raw content when it is requested, and only the status and TX
+    ID (which are read repeatedly) are cached.  This keeps the cost of
+    wrapping large numbers of stored responses low.  The content may be text
+    or bytes.
     """
+    __slots__ = ('vendor_tx_code', 'raw', '_status', '_tx_id')
+
     # Statuses
     OK = 'OK'
     OK_REPEATED = 'OK REPEATED'
@@ -12,6 +22,10 @@ class Response(object):
     INVALID = 'INVALID'
     ERROR = 'ERROR'
     REGISTERED = 'REGISTERED'
+    # A retried request for a transaction that Sagepay has already processed
+    # gets an OK REPEATED response
+    OK_STATUSES = (OK, OK_REPEATED)
+    SUCCESS_STATUSES = (REGISTERED, OK, OK_REPEATED)
 
     def __init__(self, vendor_tx_code, response_content):
         # We pass in the vendor tx code as it's required in several places as a
@@ -19,9 +33,8 @@ class Response(object):
         # response params.
         self.vendor_tx_code = vendor_tx_code
         self.raw = response_content
-        self._params = dict(
-            line.split('=', 1) for line in
-            response_content.strip().split("\r\n"))
+        self._status = _MISSING
+        self._tx_id = _MISSING
 
     def __str__(self):
         return '<Response status="%s" msg="%s">' % (
@@ -33,13 +46,22 @@ class Response(object):
         """
         Extract a parameter from the response
         """
-        return self._params.get(key, default)
+        raw = self.raw
+        if six.PY3 and isinstance(raw, bytes):
+            value = _scan(raw, key.encode('ascii') + b'=', b'\r\n')
+            if value is not None:
+                value = value.decode('utf-8')
+        else:
+            value = _scan(raw, key + '=', '\r\n')
+        return default if value is None else value
 
     # Syntactic sugar
 
     @property
     def status(self):
-        return self.param('Status', '')
+        if self._status is _MISSING:
+            self._status = self.param('Status', '')
+        return self._status
 
     @property
     def status_detail(self):
@@ -47,7 +69,9 @@ class Response(object):
 
     @property
     def tx_id(self):
-        return self.param('VPSTxId', '')
+        if self._tx_id is _MISSING:
+            self._tx_id = self.param('VPSTxId', '')
+        return self._tx_id
 
     @property
     def tx_auth_num(self):
@@ -61,11 +85,11 @@ class Response(object):
 
     @property
     def is_ok(self):
-        return self.status == self.OK
+        return self.status in self.OK_STATUSES
 
     @property
     def is_successful(self):
-        return self.status in (self.REGISTERED, self.OK, self.OK_REPEATED)
+        return self.status in self.SUCCESS_STATUSES
 
     @property
     def is_registered(self):
@@ -76,6 +100,27 @@ class Response(object):
         return not self.is_successful and not self.is_registered
 
 
+def _scan(raw, needle, separator):
+    """
+    Return the value of the line of ``raw`` that starts with ``needle``, or
+    None if there isn't one.
+    """
+    start = 0
+    while True:
+        pos = raw.find(needle, start)
+        if pos == -1:
+            return None
+        if (pos == 0 or raw[pos - 1:pos] == separator[-1:] or
+                not raw[:pos].strip()):
+            break
+        start = pos + 1
+    value_start = pos + len(needle)
+    end = raw.find(separator, value_start)
+    if end == -1:
+        return raw[value_start:].rstrip()
+    return raw[value_start:end]
+
+
 class EmptyResponse:
     is_error = True
     is_successful = False
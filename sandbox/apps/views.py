@@ -5,7 +5,7 @@ from django.contrib import messages
 from oscar.apps.order import models as order_models
 from oscar.apps.payment import exceptions
 
-from oscar_sagepay import facade, models, gateway
+from oscar_sagepay import facade, models, gateway, wrappers
 
 
 class AuthorisePayment(generic.View):
@@ -46,7 +46,7 @@ class RefundPayment(generic.View):
         # Grab first AUTHORISE txn to refund
         txns = models.RequestResponse.objects.filter(
             reference=order.number, tx_type=gateway.TXTYPE_AUTHORISE,
-            status='OK')
+            status__in=wrappers.Response.OK_STATUSES)
         txn = txns[0]
 
         url = reverse('dashboard:order-detail', kwargs={
@@ -77,7 +77,7 @@ class VoidPayment(generic.View):
 
         txns = models.RequestResponse.objects.filter(
             reference=order.number, tx_type=gateway.TXTYPE_AUTHORISE,
-            status='OK')
+            status__in=wrappers.Response.OK_STATUSES)
         txn = txns[0]
 
         url = reverse('dashboard:order-detail', kwargs={
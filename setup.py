@@ -18,8 +18,9 @@ setup(
     include_package_data=True,
     test_suite="tests",
     install_requires=[
-        'requests>=1.0',
+        'requests>=2.4',
         'django-oscar>=0.4',
+        'six>=1.4',
     ],
     # See http://pypi.python.org/pypi?%3Aaction=list_classifiers
     classifiers=[
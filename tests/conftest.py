@@ -1,3 +1,29 @@
+import mock
+import pytest
+
+from tests import responses
+
+URL = 'https://test.sagepay.com/gateway'
+POLICIES = {'AUTHORISE': {'attempts': 3, 'backoff': 0.1}}
+
+
 def pytest_addoption(parser):
     parser.addoption("--external", action="store_true",
                      help="Run external tests")
+
+
+@pytest.fixture
+def policies(request):
+    """
+    Retry AUTHORISE requests without sleeping between attempts
+    """
+    patchers = [
+        mock.patch('oscar_sagepay.config.RETRY_POLICIES', POLICIES),
+        mock.patch('time.sleep')]
+    for patcher in patchers:
+        patcher.start()
+        request.addfinalizer(patcher.stop)
+
+
+def http_response(content=responses.OK, status_code=200):
+    return mock.Mock(content=content, status_code=status_code)
@@ -0,0 +1,86 @@
+import datetime
+import gzip
+import json
+
+import pytest
+from django.utils.timezone import now
+
+from oscar_sagepay import archive, models
+
+
+def create(tx_type, status, days_old):
+    return models.RequestResponse.objects.create(
+        vendor_tx_code='%s-%s-%d' % (tx_type, status, days_old),
+        tx_type=tx_type, status=status,
+        request_datetime=now() - datetime.timedelta(days=days_old))
+
+
+@pytest.mark.django_db
+def test_only_old_transactions_are_archivable():
+    old = create('REFUND', 'OK', 400)
+    create('REFUND', 'OK', 10)
+    assert list(archive.archivable(days=365)) == [old]
+
+
+@pytest.mark.django_db
+def test_successful_authorise_transactions_are_kept():
+    failed = create('AUTHORISE', 'INVALID', 400)
+    create('AUTHORISE', 'OK', 400)
+    create('AUTHENTICATE', 'REGISTERED', 400)
+    assert list(archive.archivable(days=365)) == [failed]
+
+
+@pytest.mark.django_db
+def test_follow_ups_are_archived_after_follow_up_period():
+    old = create('AUTHORISE', 'OK', 800)
+    create('AUTHORISE', 'OK', 400)
+    assert list(archive.archivable(days=365, follow_up_days=730)) == [old]
+
+
+@pytest.mark.django_db
+def test_archiving_writes_and_deletes_in_batches(tmpdir):
+    for days_old in range(400, 405):
+        create('REFUND', 'OK', days_old)
+    path = str(tmpdir.join('archive.jsonl.gz'))
+    progress = []
+    num_archived = archive.archive_to_file(
+        path, archive.archivable(days=365), batch_size=2,
+        progress=lambda n, elapsed: progress.append(n))
+    assert num_archived == 5
+    assert progress == [2, 4, 5]
+    assert models.RequestResponse.objects.count() == 0
+    with gzip.open(path) as f:
+        records = [json.loads(line)[0] for line in f]
+    assert len(records) == 5
+    assert records[0]['fields']['tx_type'] == 'REFUND'
+
+
+@pytest.mark.django_db
+def test_archiving_refuses_to_overwrite_an_existing_file(tmpdir):
+    create('REFUND', 'OK', 400)
+    archive_file = tmpdir.join('archive.jsonl.gz')
+    archive_file.write('')
+    with pytest.raises(IOError):
+        archive.archive_to_file(str(archive_file), archive.archivable(days=365))
+    assert models.RequestResponse.objects.count() == 1
+    assert not tmpdir.join('archive.jsonl.gz.part').check()
+
+
+@pytest.mark.django_db
+def test_interrupted_archive_is_left_as_part_file(tmpdir):
+    for days_old in range(400, 405):
+        create('REFUND', 'OK', days_old)
+    path = str(tmpdir.join('archive.jsonl.gz'))
+
+    def progress(num_archived, elapsed):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        archive.archive_to_file(path, archive.archivable(days=365),
+                                batch_size=2, progress=progress)
+    assert not tmpdir.join('archive.jsonl.gz').check()
+    assert models.RequestResponse.objects.count() == 3
+    with gzip.open(path + '.part') as f:
+        assert len(f.readlines()) == 2
+    with pytest.raises(IOError):
+        archive.archive_to_file(path, archive.archivable(days=365))
@@ -0,0 +1,153 @@
+import glob
+import os
+
+import mock
+import pytest
+
+from oscar_sagepay import audit, models, processes, wrappers
+from tests import responses
+
+PARAMS = {
+    'VPSProtocol': '3.0',
+    'TxType': 'PAYMENT',
+    'Vendor': 'oscar',
+    'VendorTxCode': 'req_1',
+    'Amount': '10.99',
+    'Currency': 'GBP',
+}
+
+
+@pytest.fixture
+def backend(request, tmpdir):
+    backend = audit.BufferedBackend(
+        spill_path=str(tmpdir.join('audit')), flush_interval=0.01)
+    request.addfinalizer(backend.stop)
+    return backend
+
+
+def test_database_backend_is_the_default():
+    assert isinstance(audit.get_backend(), audit.DatabaseBackend)
+
+
+def test_buffered_backend_does_not_write_request(backend):
+    with mock.patch('oscar_sagepay.models.RequestResponse.save') as save:
+        rr = backend.record_request('100001', PARAMS)
+    assert not save.called
+    assert rr.vendor_tx_code == 'req_1'
+
+
+def test_buffered_backend_writes_responses_in_batches(backend):
+    bulk_create = 'oscar_sagepay.models.RequestResponse.objects.bulk_create'
+    with mock.patch(bulk_create) as bulk_create:
+        for i in range(3):
+            rr = backend.record_request('100001', PARAMS)
+            backend.record_response(
+                rr, wrappers.Response('req_1', responses.OK))
+        backend.flush()
+    written = sum(len(args[0]) for args, __ in bulk_create.call_args_list)
+    assert written == 3
+    # Spill file is emptied once everything is written
+    assert os.path.getsize(backend._spill_file) == 0
+
+
+def failed_files(backend):
+    return glob.glob('%s.%s.failed-*' % (
+        backend.spill_path, processes.token()))
+
+
+def test_buffered_backend_keeps_spill_file_if_write_fails(backend):
+    bulk_create = 'oscar_sagepay.models.RequestResponse.objects.bulk_create'
+    with mock.patch(bulk_create, side_effect=Exception), \
+            mock.patch('oscar_sagepay.models.RequestResponse.save',
+                       side_effect=Exception):
+        rr = backend.record_request('100001', PARAMS)
+        backend.record_response(rr, wrappers.Response('req_1', responses.OK))
+        backend.flush()
+    paths = failed_files(backend)
+    assert len(paths) == 1
+    assert os.path.getsize(paths[0]) > 0
+
+
+@pytest.mark.django_db
+def test_buffered_backend_writes_records_of_a_failed_batch_singly(backend):
+    bulk_create = 'oscar_sagepay.models.RequestResponse.objects.bulk_create'
+    save = models.RequestResponse.save
+
+    def fake_save(rr, *args, **kwargs):
+        if rr.vendor_tx_code == 'bad':
+            raise Exception
+        return save(rr, *args, **kwargs)
+
+    records = []
+    for vendor_tx_code in ('req_1', 'bad', 'req_2'):
+        records.append(backend.record_request(
+            '100001', dict(PARAMS, VendorTxCode=vendor_tx_code)))
+    with mock.patch(bulk_create, side_effect=Exception), \
+            mock.patch.object(models.RequestResponse, 'save', fake_save):
+        failed = backend._save(records)
+    assert failed == [records[1]]
+    assert sorted(models.RequestResponse.objects.values_list(
+        'vendor_tx_code', flat=True)) == ['req_1', 'req_2']
+
+
+@pytest.mark.django_db
+def test_buffered_backend_replays_failed_records_after_a_write(backend):
+    bulk_create = 'oscar_sagepay.models.RequestResponse.objects.bulk_create'
+    with mock.patch(bulk_create, side_effect=Exception):
+        rr = backend.record_request('100001', PARAMS)
+        backend.record_response(rr, wrappers.Response('req_1', responses.OK))
+        backend.flush()
+    with mock.patch(bulk_create), \
+            mock.patch.object(backend, '_replay_failed') as replay:
+        params = dict(PARAMS, VendorTxCode='req_2')
+        rr = backend.record_request('100002', params)
+        backend.record_response(rr, wrappers.Response('req_2', responses.OK))
+        backend.flush()
+    assert replay.called
+    backend._replay_failed()
+    assert not backend._failed
+    assert not failed_files(backend)
+    assert models.RequestResponse.objects.filter(
+        vendor_tx_code='req_1').count() == 1
+
+
+@pytest.mark.django_db
+def test_buffered_backend_recovers_spill_files_of_dead_processes(tmpdir):
+    spill_path = str(tmpdir.join('audit'))
+    rr = models.RequestResponse(reference='100001')
+    rr.record_request(PARAMS)
+    with mock.patch('oscar_sagepay.processes.is_alive', return_value=False):
+        backend = audit.BufferedBackend(spill_path=spill_path)
+        backend._spill_file = spill_path + '.1-100'
+        backend._spill([rr])
+        backend.recover()
+    assert models.RequestResponse.objects.filter(
+        vendor_tx_code='req_1').count() == 1
+    assert not glob.glob(spill_path + '.*')
+
+
+def test_spill_files_of_processes_that_reused_a_pid_are_recovered():
+    dead = '%d-%d' % (os.getpid(), processes.start_time(os.getpid()) - 1)
+    assert not processes.is_alive(dead)
+    assert processes.is_alive(processes.token())
+
+
+@pytest.mark.django_db
+def test_spill_files_claimed_by_another_process_are_skipped(tmpdir):
+    spill_path = str(tmpdir.join('audit'))
+    open(spill_path + '.1-100', 'w').close()
+    with mock.patch('oscar_sagepay.processes.is_alive', return_value=False), \
+            mock.patch('os.rename', side_effect=OSError):
+        with mock.patch.object(
+                audit.BufferedBackend, '_recover_file') as recover_file:
+            audit.BufferedBackend(spill_path=spill_path).recover()
+    assert not recover_file.called
+
+
+def test_buffered_backend_recovers_in_the_writer_thread(tmpdir):
+    with mock.patch.object(audit.BufferedBackend, 'recover') as recover:
+        backend = audit.BufferedBackend(spill_path=str(tmpdir.join('audit')))
+        assert not recover.called
+        backend._ensure_started()
+        backend.stop()
+    assert recover.called
@@ -0,0 +1,83 @@
+import itertools
+
+import mock
+import pytest
+
+from oscar_sagepay import bankcards, gateway
+
+
+def linear_bankcard_type(card_number):
+    # Reference implementation: first matching rule wins
+    for card_type, lengths, prefixes in bankcards.CARD_TYPES:
+        if len(card_number) in lengths:
+            for prefix in prefixes:
+                if card_number.startswith(prefix):
+                    return card_type
+
+
+def candidate_numbers():
+    prefixes = set(itertools.chain.from_iterable(
+        prefixes for __, __, prefixes in bankcards.CARD_TYPES))
+    for prefix in prefixes:
+        for length in range(len(prefix), 21):
+            for pad in '0', '5', '9':
+                yield (prefix + pad * length)[:length]
+    for length in range(12, 20):
+        for digit in '0123456789':
+            yield digit * length
+
+
+def test_index_matches_linear_scan_for_all_rules():
+    for number in candidate_numbers():
+        assert bankcards.bankcard_type(number) == linear_bankcard_type(number)
+
+
+@pytest.mark.parametrize("number, card_type", [
+    ('4111111111111111', bankcards.VISA),
+    ('5411111111111111', bankcards.MASTERCARD),
+    ('36000000000000', bankcards.DINERS_CLUB),
+    ('3530111333300000', bankcards.JCB),
+    ('6221260000000000', bankcards.CHINA_UNIONPAY),
+    ('6011000000000000', bankcards.DISCOVER),
+    ('378282246310005', bankcards.AMEX),
+    ('1234', None),
+])
+def test_bankcard_type(number, card_type):
+    assert bankcards.bankcard_type(number) == card_type
+
+
+def test_jcb_is_recognised_repeatedly():
+    for __ in range(2):
+        assert bankcards.bankcard_type('3530111333300000') == bankcards.JCB
+
+
+def test_gateway_maps_card_types_to_sagepay_codes():
+    assert gateway._card_type('4111111111111111') == 'VISA'
+    assert gateway._card_type('5411111111111111') == 'MC'
+    assert gateway._card_type('1234') == ''
+
+
+NUMBERS = ['4111111111111111', '4111111111111112', '5500000000000004',
+           '378282246310005', '41111111111x1111', '',
+           # Arabic-Indic and fullwidth digits
+           u'\u0664111111111111111', u'\uff14111111111111111']
+EXPECTED = [True, False, True, True, False, True, False, False]
+
+
+def test_luhn_many_matches_luhn():
+    assert bankcards.luhn_many(NUMBERS) == EXPECTED
+    for i in (0, 1, 2, 3, 5):
+        assert bankcards.luhn(NUMBERS[i]) == EXPECTED[i]
+
+
+def test_luhn_many_without_numpy():
+    with mock.patch('oscar_sagepay.bankcards.numpy', None):
+        assert bankcards.luhn_many(NUMBERS) == EXPECTED
+
+
+def test_bankcard_details_classifies_numbers():
+    details = gateway.bankcard_details(NUMBERS[:4])
+    assert [d.is_valid for d in details] == [True, False, True, True]
+    assert [d.sagepay_card_type for d in details] == [
+        'VISA', 'VISA', 'MC', 'AMEX']
+    assert details[3].card_type == bankcards.AMEX
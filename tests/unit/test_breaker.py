@@ -0,0 +1,127 @@
+import time
+
+import mock
+import pytest
+import requests
+from django.core.cache import cache
+
+from oscar_sagepay import breaker, exceptions, gateway
+from tests import responses
+
+URL = 'https://test.sagepay.com/gateway'
+
+
+@pytest.fixture
+def circuit(request):
+    request.addfinalizer(cache.clear)
+    return breaker.CircuitBreaker(
+        URL, cache=cache, failure_threshold=3, slow_threshold=1.0)
+
+
+def test_breaker_opens_after_repeated_failures(circuit):
+    for __ in range(2):
+        circuit.failure()
+        assert circuit.allow()
+    circuit.failure()
+    assert circuit.is_open
+    assert not circuit.allow()
+
+
+def test_successes_reset_the_failure_count(circuit):
+    circuit.failure()
+    circuit.failure()
+    circuit.success()
+    circuit.failure()
+    assert circuit.allow()
+
+
+def test_slow_responses_count_as_failures(circuit):
+    for __ in range(3):
+        circuit.record(5.0)
+    assert not circuit.allow()
+
+
+def test_half_open_breaker_allows_a_single_probe(circuit):
+    for __ in range(3):
+        circuit.failure()
+    cache.delete(circuit._open_key)  # The reset timeout has passed
+    assert circuit.allow()
+    assert not circuit.allow()
+
+
+def test_successful_probe_closes_breaker(circuit):
+    for __ in range(3):
+        circuit.failure()
+    cache.delete(circuit._open_key)
+    assert circuit.allow()
+    circuit.success()
+    assert circuit.allow()
+    assert circuit.allow()
+
+
+def test_failed_probe_reopens_breaker(circuit):
+    for __ in range(3):
+        circuit.failure()
+    cache.delete(circuit._open_key)
+    assert circuit.allow()
+    circuit.failure()
+    assert circuit.is_open
+
+
+@pytest.fixture
+def enabled(request):
+    patcher = mock.patch('oscar_sagepay.config.BREAKER_ENABLED', True)
+    patcher.start()
+    request.addfinalizer(patcher.stop)
+
+
+def test_gateway_fails_fast_when_breaker_is_open(enabled, circuit):
+    for __ in range(3):
+        circuit.failure()
+    with mock.patch('oscar_sagepay.breaker.get_breaker',
+                    return_value=circuit):
+        with mock.patch('oscar_sagepay.transport.post') as post:
+            with pytest.raises(exceptions.CircuitOpen):
+                gateway._request(URL, 'PAYMENT', {}, '100001')
+    assert not post.called
+
+
+@pytest.mark.django_db
+def test_gateway_records_failures(enabled, circuit):
+    with mock.patch('oscar_sagepay.breaker.get_breaker',
+                    return_value=circuit):
+        with mock.patch('oscar_sagepay.transport.post') as post:
+            post.side_effect = requests.exceptions.ConnectionError
+            with pytest.raises(exceptions.GatewayError):
+                gateway._request(URL, 'PAYMENT', {}, '100001')
+            post.side_effect = None
+            post.return_value = mock.Mock(status_code=200,
+                                          content=responses.OK)
+            gateway._request(URL, 'PAYMENT', {}, '100001')
+    assert cache.get(circuit._failures_key) is None
+
+
+@pytest.mark.django_db
+def test_each_failed_attempt_is_recorded_once(enabled, circuit):
+    policies = {'PAYMENT': {'attempts': 2, 'backoff': 0}}
+    with mock.patch('oscar_sagepay.breaker.get_breaker',
+                    return_value=circuit), \
+            mock.patch('oscar_sagepay.config.RETRY_POLICIES', policies), \
+            mock.patch.object(circuit, 'failure') as failure, \
+            mock.patch('oscar_sagepay.transport.post') as post:
+        post.side_effect = requests.exceptions.ReadTimeout
+        with pytest.raises(exceptions.GatewayTimeout):
+            gateway._request(URL, 'PAYMENT', {}, '100001')
+    assert failure.call_count == 2
+
+
+@pytest.mark.django_db
+def test_passed_deadlines_are_not_failures(enabled, circuit):
+    with mock.patch('oscar_sagepay.breaker.get_breaker',
+                    return_value=circuit), \
+            mock.patch.object(circuit, 'failure') as failure, \
+            mock.patch('oscar_sagepay.transport.post'):
+        with pytest.raises(exceptions.GatewayError):
+            gateway._request(URL, 'PAYMENT', {}, '100001',
+                             deadline=time.time() - 1)
+    assert not failure.called
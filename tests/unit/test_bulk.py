@@ -0,0 +1,233 @@
+import datetime
+import threading
+from decimal import Decimal as D
+from StringIO import StringIO
+
+import mock
+from django.utils import timezone
+from oscar.apps.payment import exceptions as payment_exceptions
+
+from oscar_sagepay import bulk
+
+
+def stub_txns(*tx_ids, **kwargs):
+    """
+    Stub the lookups of the passed transactions, and of the follow-up
+    transactions (a list of (related TX ID, amount, TX ID, request datetime)
+    rows) already recorded against them
+    """
+    txns = [mock.MagicMock(tx_id=tx_id, vendor='oscar', amount=D('10.00'),
+                           tx_type='AUTHORISE', status='OK')
+            for tx_id in tx_ids]
+    existing = mock.MagicMock(**{
+        'order_by.return_value.values_list.return_value':
+        kwargs.get('existing', [])})
+
+    def fake_filter(**filters):
+        if 'related_tx_id__in' in filters:
+            return existing
+        return txns
+
+    return mock.patch(
+        'oscar_sagepay.models.RequestResponse.objects.filter',
+        side_effect=fake_filter)
+
+
+@stub_txns('1', '2', '3')
+def test_authorise_returns_results_in_input_order(filter):
+    with mock.patch('oscar_sagepay.facade.authorise_txn') as authorise_txn:
+        authorise_txn.side_effect = lambda txn, amount: 'auth-' + txn.tx_id
+        results = list(bulk.authorise(['3', '1', '2'], workers=3))
+    assert [r.tx_id for r in results] == ['3', '1', '2']
+    assert [r.value for r in results] == ['auth-3', 'auth-1', 'auth-2']
+
+
+@stub_txns('1')
+def test_authorise_passes_amounts(filter):
+    with mock.patch('oscar_sagepay.facade.authorise_txn') as authorise_txn:
+        list(bulk.authorise([('1', D('5.00'))]))
+    assert authorise_txn.call_args[0][1] == D('5.00')
+
+
+@stub_txns('1')
+def test_authorise_reports_errors_per_item(filter):
+    with mock.patch('oscar_sagepay.facade.authorise_txn') as authorise_txn:
+        authorise_txn.side_effect = payment_exceptions.PaymentError('Nope')
+        results = list(bulk.authorise(['1', '2']))
+    assert not results[0].success
+    assert results[0].error == 'Nope'
+    assert not results[1].success
+
+
+@stub_txns('1', '2')
+def test_authorise_skips_checkpointed_items(filter, tmpdir):
+    path = str(tmpdir.join('checkpoint'))
+    bulk.Checkpoint(path).mark('1', 'auth-1')
+    with mock.patch('oscar_sagepay.facade.authorise_txn') as authorise_txn:
+        authorise_txn.return_value = 'auth-2'
+        results = list(bulk.authorise(['1', '2'], checkpoint=path))
+    assert authorise_txn.call_count == 1
+    assert [r.value for r in results] == ['auth-1', 'auth-2']
+    assert '2' in bulk.Checkpoint(path)
+
+
+@stub_txns('1', '2', existing=[('1', D('10.00'), 'auth-1', None)])
+def test_authorise_skips_txns_already_authorised(filter):
+    with mock.patch('oscar_sagepay.facade.authorise_txn') as authorise_txn:
+        authorise_txn.return_value = 'auth-2'
+        results = list(bulk.authorise(['1', '2']))
+    assert authorise_txn.call_count == 1
+    assert [r.value for r in results] == ['auth-1', 'auth-2']
+
+
+@stub_txns('1')
+def test_authorise_rejects_duplicate_tx_ids(filter):
+    with mock.patch('oscar_sagepay.facade.authorise_txn') as authorise_txn:
+        results = list(bulk.authorise(['1', '1']))
+    assert authorise_txn.call_count == 1
+    assert results[0].success
+    assert not results[1].success
+
+
+@stub_txns('1', '2')
+def test_authorise_does_not_resend_items_in_flight(filter, tmpdir):
+    path = str(tmpdir.join('checkpoint'))
+    bulk.Checkpoint(path).start('1')
+    with mock.patch('oscar_sagepay.facade.authorise_txn') as authorise_txn:
+        authorise_txn.return_value = 'auth-2'
+        results = list(bulk.authorise(['1', '2'], checkpoint=path))
+    assert authorise_txn.call_count == 1
+    assert results[0].error == bulk.IN_FLIGHT_ERROR
+    assert bulk.Checkpoint(path).in_flight('1')
+
+
+@stub_txns('1', existing=[('1', D('10.00'), 'auth-1', None)])
+def test_authorise_reconciles_items_in_flight(filter, tmpdir):
+    path = str(tmpdir.join('checkpoint'))
+    bulk.Checkpoint(path).start('1')
+    with mock.patch('oscar_sagepay.facade.authorise_txn') as authorise_txn:
+        results = list(bulk.authorise(['1'], checkpoint=path))
+    assert not authorise_txn.called
+    assert results[0].value == 'auth-1'
+    assert bulk.Checkpoint(path).get('1') == 'auth-1'
+
+
+def test_workers_close_their_db_connections():
+    with mock.patch('oscar_sagepay.bulk.connection') as connection:
+        assert list(bulk._imap(lambda x: x * 2, [1, 2, 3], 2)) == [2, 4, 6]
+    assert connection.close.call_count == 2
+
+
+def test_csv_amounts_are_optional():
+    rows = list(bulk.read_csv(['1,10.00', '2', '', '# comment']))
+    assert rows == [('1', D('10.00')), ('2', None)]
+
+
+@stub_txns('1', '2')
+def test_refund_prefetches_authorise_txns_in_one_query(filter):
+    with mock.patch('oscar_sagepay.facade.refund_txn') as refund_txn:
+        refund_txn.return_value = 'refund'
+        results = list(bulk.refund(['1', '2']))
+    lookups = [kwargs for __, kwargs in filter.call_args_list
+               if 'tx_id__in' in kwargs]
+    assert len(lookups) == 1
+    kwargs = lookups[0]
+    assert kwargs['tx_type'] == 'AUTHORISE'
+    assert kwargs['status__in'] == ('OK', 'OK REPEATED')
+    assert all(r.success for r in results)
+
+
+@stub_txns('1', existing=[('1', D('5.00'), 'refund-1', timezone.now())])
+def test_refund_reports_refunds_not_sent_by_the_run(filter):
+    with mock.patch('oscar_sagepay.facade.refund_txn') as refund_txn:
+        refund_txn.return_value = 'refund-2'
+        results = list(bulk.refund([('1', D('5.00')), ('1', D('5.00'))]))
+    assert refund_txn.call_count == 1
+    assert not results[0].success
+    assert results[0].error == bulk.ALREADY_REFUNDED_ERROR % 'refund-1'
+    assert results[1].value == 'refund-2'
+
+
+@stub_txns('1', existing=[
+    ('1', D('5.00'), 'manual', timezone.now() - datetime.timedelta(days=1)),
+    ('1', D('5.00'), 'refund-1', timezone.now() + datetime.timedelta(
+        seconds=5))])
+def test_refund_reconciles_items_in_flight(filter, tmpdir):
+    path = str(tmpdir.join('checkpoint'))
+    bulk.Checkpoint(path).start('1|5.00|0')
+    with mock.patch('oscar_sagepay.facade.refund_txn') as refund_txn:
+        results = list(bulk.refund([('1', D('5.00'))], checkpoint=path))
+    assert not refund_txn.called
+    assert results[0].success
+    assert results[0].value == 'refund-1'
+    assert bulk.Checkpoint(path).get('1|5.00|0') == 'refund-1'
+
+
+@stub_txns('1', existing=[
+    ('1', D('5.00'), 'manual', timezone.now() - datetime.timedelta(days=1))])
+def test_refunds_before_an_item_was_started_are_not_its_own(filter, tmpdir):
+    path = str(tmpdir.join('checkpoint'))
+    bulk.Checkpoint(path).start('1|5.00|0')
+    with mock.patch('oscar_sagepay.facade.refund_txn') as refund_txn:
+        results = list(bulk.refund([('1', D('5.00'))], checkpoint=path))
+    assert not refund_txn.called
+    assert results[0].error == bulk.ALREADY_REFUNDED_ERROR % 'manual'
+
+
+@stub_txns('1', '2')
+def test_refund_reports_unexpected_errors_per_item(filter):
+    with mock.patch('oscar_sagepay.facade.refund_txn') as refund_txn:
+        refund_txn.side_effect = [ValueError('Boom'), 'refund-2']
+        results = list(bulk.refund(['1', '2'], workers=1))
+    assert not results[0].success
+    assert 'Boom' in results[0].error
+    assert results[1].value == 'refund-2'
+
+
+def test_workers_stop_when_the_caller_stops_iterating():
+    calls = []
+    cancelled = threading.Event()
+
+    def fn(item):
+        calls.append(item)
+        if item == 1:
+            cancelled.wait()
+        return item
+
+    results = bulk._imap(fn, [0, 1, 2, 3], 1, cancelled)
+    assert next(results) == 0
+    results.close()
+    assert cancelled.is_set()
+    assert calls in ([0], [0, 1])
+
+
+@stub_txns('1')
+def test_partial_refunds_are_checkpointed_separately(filter, tmpdir):
+    path = str(tmpdir.join('checkpoint'))
+    with mock.patch('oscar_sagepay.facade.refund_txn') as refund_txn:
+        refund_txn.side_effect = ['refund-1', 'refund-2']
+        list(bulk.refund([('1', D('5.00')), ('1', D('5.00'))], workers=1,
+                         checkpoint=path))
+    assert refund_txn.call_count == 2
+    checkpoint = bulk.Checkpoint(path)
+    assert checkpoint.get('1|5.00|0') == 'refund-1'
+    assert checkpoint.get('1|5.00|1') == 'refund-2'
+
+
+@stub_txns()
+def test_refund_rejects_txns_that_are_not_authorised(filter):
+    txn = mock.MagicMock(spec=bulk.models.RequestResponse, tx_id='1',
+                         tx_type='AUTHENTICATE', status='REGISTERED')
+    with mock.patch('oscar_sagepay.facade.refund_txn') as refund_txn:
+        results = list(bulk.refund([txn]))
+    assert not refund_txn.called
+    assert not results[0].success
+
+
+def test_results_are_written_as_csv():
+    output = StringIO()
+    num_errors = bulk.write_results([
+        bulk.Result('1', True, 'r1', None),
+        bulk.Result('2', False, None, 'Nope')], output)
+    assert num_errors == 1
+    assert output.getvalue().splitlines() == ['1,OK,r1,', '2,ERROR,,Nope']
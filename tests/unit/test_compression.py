@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import json
+
+import mock
+import pytest
+
+from oscar_sagepay import compression, models, wrappers
+from tests import responses
+
+PARAMS = {
+    'VPSProtocol': '3.0',
+    'TxType': 'PAYMENT',
+    'Vendor': 'oscar',
+    'VendorTxCode': 'req_1',
+    'Description': u'Caf\xe9',
+    'BillingAddress1': '1 Acacia Avenue',
+    'DeliveryAddress1': '1 Acacia Avenue',
+    'BillingCity': 'London',
+    'DeliveryCity': 'London',
+    'BillingPostCode': 'N12 9RT',
+    'DeliveryPostCode': 'N12 9RT',
+    'BillingCountry': 'GB',
+    'DeliveryCountry': 'GB',
+}
+
+
+@pytest.fixture
+def compressed(request):
+    patcher = mock.patch('oscar_sagepay.config.COMPRESS_PAYLOADS', True)
+    patcher.start()
+    request.addfinalizer(patcher.stop)
+
+
+def test_compression_round_trips():
+    text = u'Caf\xe9 ' * 20
+    value = compression.compress(text)
+    assert value.startswith(compression.PREFIX)
+    assert len(value) < len(text)
+    assert compression.decompress(value) == text
+
+
+def test_short_values_are_not_compressed():
+    assert compression.compress('Status=OK') == 'Status=OK'
+
+
+def test_uncompressed_values_are_returned_as_they_are():
+    assert compression.decompress(responses.OK) == responses.OK
+    assert compression.decompress('') == ''
+
+
+@pytest.mark.django_db
+def test_payloads_are_compressed_when_enabled(compressed):
+    rr = models.RequestResponse.new('100001', PARAMS)
+    rr.record_response(wrappers.Response('req_1', responses.OK))
+    rr.save_response()
+
+    rr = models.RequestResponse.objects.get(pk=rr.pk)
+    assert rr.raw_request_json.startswith(compression.PREFIX)
+    assert rr.raw_request == json.loads(json.dumps(PARAMS))
+    assert rr.response.status == 'OK'
+
+
+@pytest.mark.django_db
+def test_existing_payloads_can_be_compressed():
+    rr = models.RequestResponse.new('100001', PARAMS)
+    rr.record_response(wrappers.Response('req_1', responses.OK))
+    rr.save_response()
+
+    num_changed, size_before, size_after = compression.convert(
+        models.RequestResponse.objects.all(), compression.compress)
+    assert num_changed == 1
+    assert size_after < size_before
+    rr = models.RequestResponse.objects.get(pk=rr.pk)
+    assert rr.raw_request_json.startswith(compression.PREFIX)
+    assert rr.raw_request['Description'] == u'Caf\xe9'
+    assert rr.response.status == 'OK'
@@ -7,7 +7,7 @@ import mock
 import oscar
 from oscar.apps.payment import models as payment_models
 
-from oscar_sagepay import gateway, models, wrappers
+from oscar_sagepay import gateway, models, signals, wrappers
 from tests import responses
 
 # Fixtures
@@ -25,7 +25,7 @@ AMT, CURRENCY = D('10.00'), 'GBP'
 
 def stub_sagepay_response(content=responses.MALFORMED, status_code=200):
     return mock.patch(
-        'requests.post', new=mock.MagicMock(
+        'oscar_sagepay.transport.post', new=mock.MagicMock(
             **{
                 'return_value.content': content,
                 'return_value.status_code': status_code
@@ -55,7 +55,7 @@ def test_exception_raised_for_non_200_response():
 
 @stub_orm_create()
 def test_fields_are_truncated_to_fit_sagepay():
-    with mock.patch('requests.post') as post:
+    with mock.patch('oscar_sagepay.transport.post') as post:
         post.return_value = mock.MagicMock(
             content=responses.MALFORMED,
             status_code=200)
@@ -69,8 +69,9 @@ def test_fields_are_truncated_to_fit_sagepay():
 
 @stub_orm_create()
 def test_fields_are_cleaned_to_match_sagepay_formats():
-    with mock.patch('requests.post') as post:
-        post.return_value = mock.MagicMock(status_code=200)
+    with mock.patch('oscar_sagepay.transport.post') as post:
+        post.return_value = mock.MagicMock(
+            content=responses.MALFORMED, status_code=200)
         gateway.authenticate(
             AMT, CURRENCY, delivery_surname="Name?"
         )
@@ -80,8 +81,9 @@ def test_fields_are_cleaned_to_match_sagepay_formats():
 
 @stub_orm_create()
 def test_state_is_not_submitted_for_non_us_country():
-    with mock.patch('requests.post') as post:
-        post.return_value = mock.MagicMock(status_code=200)
+    with mock.patch('oscar_sagepay.transport.post') as post:
+        post.return_value = mock.MagicMock(
+            content=responses.MALFORMED, status_code=200)
         gateway.authenticate(
             AMT, CURRENCY, delivery_state="Somerset", delivery_country='GB'
         )
@@ -127,3 +129,84 @@ def test_clean_address_strips_invalid_chars(raw, clean):
 ])
 def test_clean_postcode_strips_invalid_chars(raw, clean):
     assert gateway.clean_postcode(raw) == clean
+
+
+def test_schema_only_submits_state_for_us():
+    schema = gateway._compile((
+        gateway.Field('Country', 'country', max_length=2),
+        gateway.Field('State', 'state', max_length=2, country='Country'),
+    ))
+    assert gateway._build_params(
+        schema, {'country': 'US', 'state': 'NYC'})['State'] == 'NY'
+    assert gateway._build_params(
+        schema, {'country': 'GB', 'state': 'NY'})['State'] == ''
+
+
+def test_schema_replaces_none_with_default():
+    schema = gateway._compile((
+        gateway.Field('Surname', 'surname', gateway.clean_name, 20),
+        gateway.Field('CreateToken', 'create_token', default=0),
+    ))
+    params = gateway._build_params(schema, {'surname': None})
+    assert params == {'Surname': '', 'CreateToken': 0}
+
+
+@stub_orm_create()
+def test_void_submits_previous_txn_details():
+    previous_txn = gateway.PreviousTxn('v1', '{TX-1}', '123', 'key')
+    with mock.patch('oscar_sagepay.transport.post') as post:
+        post.return_value = mock.MagicMock(
+            content=responses.OK, status_code=200)
+        gateway.void(previous_txn)
+        args, __ = post.call_args
+    assert args[1]['VPSTxId'] == '{TX-1}'
+    assert args[1]['VendorTxCode'] == 'v1'
+    assert args[1]['TxAuthNo'] == '123'
+    assert args[1]['SecurityKey'] == 'key'
+
+
+@stub_orm_create()
+def test_follow_ups_omit_missing_previous_txn_details():
+    previous_txn = gateway.PreviousTxn('v1', '{TX-1}', None, 'key')
+    with mock.patch('oscar_sagepay.transport.post') as post:
+        post.return_value = mock.MagicMock(
+            content=responses.OK, status_code=200)
+        gateway.refund(previous_txn, AMT, CURRENCY, 'Refund')
+        args, __ = post.call_args
+    assert 'RelatedTxAuthNo' not in args[1]
+    assert args[1]['RelatedSecurityKey'] == 'key'
+
+
+@pytest.mark.django_db
+@stub_sagepay_response(content=responses.OK)
+def test_request_timings_are_sent_to_signal_receivers():
+    timings = []
+
+    def receiver(sender, **kwargs):
+        timings.append(kwargs['timings'])
+
+    signals.request_timed.connect(receiver)
+    try:
+        gateway.authenticate(AMT, CURRENCY)
+    finally:
+        signals.request_timed.disconnect(receiver)
+    assert list(timings[0]) == [
+        'request_params', 'audit_request', 'http', 'parse', 'audit_response']
+
+
+@pytest.mark.django_db
+@stub_sagepay_response(content=responses.OK)
+def test_request_timings_are_stored_when_enabled():
+    with mock.patch('oscar_sagepay.config.STORE_TIMINGS', True):
+        gateway.authenticate(AMT, CURRENCY)
+    rr = models.RequestResponse.objects.get()
+    assert list(rr.timings) == ['request_params', 'audit_request', 'http', 'parse']
+
+
+@pytest.mark.django_db
+@stub_sagepay_response(content=responses.OK)
+def test_requests_are_not_timed_without_receivers():
+    with mock.patch('oscar_sagepay.gateway._Timer') as timer:
+        gateway.authenticate(AMT, CURRENCY)
+    assert not timer.called
+    assert models.RequestResponse.objects.get().timings == {}
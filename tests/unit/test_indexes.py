@@ -0,0 +1,116 @@
+"""
+Check that the common queries are served by the indexes created by the
+migrations.  The test database is created with syncdb, so the migrations
+that add indexes are applied to it first (which needs South, see
+requirements.txt).
+"""
+import importlib
+
+import pytest
+from django.db import connection
+
+from oscar_sagepay import gateway, models, wrappers
+from oscar_sagepay.dashboard import pagination
+
+TABLE = models.RequestResponse._meta.db_table
+
+INDEX_MIGRATIONS = (
+    '0004_add_search_indexes',
+    '0005_add_pagination_index',
+    '0006_add_lookup_indexes',
+    '0010_update_authorise_ok_index',
+)
+
+
+def index_names():
+    cursor = connection.cursor()
+    if connection.vendor == 'postgresql':
+        cursor.execute("SELECT indexname FROM pg_indexes "
+                       "WHERE tablename = %s", [TABLE])
+    else:
+        cursor.execute("SELECT name FROM sqlite_master "
+                       "WHERE type = 'index' AND tbl_name = %s", [TABLE])
+    return set(row[0] for row in cursor.fetchall())
+
+
+@pytest.fixture
+def indexes(request, db):
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        pytest.skip("Query plans not supported for %s" % connection.vendor)
+    existing = index_names()
+    for name in INDEX_MIGRATIONS:
+        module = importlib.import_module('oscar_sagepay.migrations.%s' % name)
+        module.Migration().forwards(None)
+
+    def drop_indexes():
+        # SQLite commits before DDL statements, so the indexes outlive the
+        # test's transaction
+        cursor = connection.cursor()
+        for name in index_names() - existing:
+            cursor.execute('DROP INDEX IF EXISTS %s' % name)
+    request.addfinalizer(drop_indexes)
+
+
+def query_plan(qs):
+    sql, params = qs.query.sql_with_params()
+    cursor = connection.cursor()
+    if connection.vendor == 'postgresql':
+        # The test tables are tiny so a sequential scan would always win
+        cursor.execute('SET enable_seqscan = off')
+        cursor.execute('EXPLAIN %s' % sql, params)
+    elif connection.vendor == 'sqlite':
+        cursor.execute('EXPLAIN QUERY PLAN %s' % sql, params)
+    return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+
+def assert_uses_index(qs, ordered=True):
+    plan = query_plan(qs)
+    assert 'INDEX' in plan.upper()
+    for line in plan.split('\n'):
+        # A full table scan
+        assert not (line.startswith('SCAN') and 'USING' not in line)
+        assert 'Seq Scan' not in line
+    if ordered:
+        # Sorting in a separate step means all matching rows are read
+        assert 'TEMP B-TREE' not in plan
+        assert 'Sort' not in plan.split('\n')[0]
+
+
+def test_authorise_lookup_uses_index(indexes):
+    # Only a handful of rows share a TX ID so sorting them is cheap
+    assert_uses_index(models.RequestResponse.objects.filter(tx_id='{A}'),
+                      ordered=False)
+
+
+def test_refund_and_void_lookup_uses_index(indexes):
+    assert_uses_index(models.RequestResponse.objects.filter(
+        tx_id='{A}', tx_type=gateway.TXTYPE_AUTHORISE,
+        status__in=wrappers.Response.OK_STATUSES),
+        ordered=False)
+
+
+def test_dashboard_list_uses_index(indexes):
+    assert_uses_index(models.RequestResponse.objects.all()[:20])
+
+
+def test_dashboard_filter_uses_index(indexes):
+    assert_uses_index(models.RequestResponse.objects.filter(
+        tx_type=gateway.TXTYPE_REFUND, status='OK')[:20])
+
+
+def test_dashboard_next_page_uses_index(indexes):
+    txn = models.RequestResponse.objects.create(
+        vendor_tx_code='tx-1', request_datetime=models.now())
+    paginator = pagination.KeysetPaginator(
+        models.RequestResponse.objects.all(), 20)
+    value, pk = pagination.decode_cursor(pagination.encode_cursor(txn))
+    assert_uses_index(paginator._after(value, pk))
+
+
+def test_dashboard_previous_page_uses_index(indexes):
+    txn = models.RequestResponse.objects.create(
+        vendor_tx_code='tx-1', request_datetime=models.now())
+    paginator = pagination.KeysetPaginator(
+        models.RequestResponse.objects.all(), 20)
+    value, pk = pagination.decode_cursor(pagination.encode_cursor(txn))
+    assert_uses_index(paginator._before(value, pk))
@@ -0,0 +1,124 @@
+import datetime
+from decimal import Decimal as D
+
+import mock
+import oscar
+import pytest
+from oscar.apps.payment import (
+    models as payment_models, exceptions as payment_exceptions)
+
+from oscar_sagepay import exceptions, facade, gateway, models, simulator
+from tests import factories
+
+bankcard_kwargs = {
+    'name': 'Barry Chuckle',
+    'number': '4111111111111111',
+    'expiry_date': datetime.date.today(),
+}
+if oscar.VERSION[1] >= 6:
+    bankcard_kwargs['ccv'] = '123'
+
+BANKCARD = payment_models.Bankcard(**bankcard_kwargs)
+AMT = D('10.00')
+CURRENCY = 'GBP'
+SHIPPING_ADDRESS = factories.ShippingAddress()
+BILLING_ADDRESS = factories.BillingAddress()
+
+
+@pytest.fixture
+def server(request):
+    server = simulator.start()
+    request.addfinalizer(server.server_close)
+    request.addfinalizer(server.shutdown)
+    for name, path in (('VPS_REGISTER_URL', simulator.REGISTER_PATH),
+                       ('VPS_AUTHORISE_URL', simulator.AUTHORISE_PATH),
+                       ('VPS_REFUND_URL', simulator.REFUND_PATH),
+                       ('VPS_VOID_URL', simulator.VOID_PATH)):
+        patcher = mock.patch('oscar_sagepay.config.%s' % name,
+                             server.url + path)
+        patcher.start()
+        request.addfinalizer(patcher.stop)
+    return server
+
+
+def authenticate():
+    return facade.authenticate(
+        AMT, CURRENCY, BANKCARD, SHIPPING_ADDRESS, BILLING_ADDRESS)
+
+
+@pytest.mark.django_db
+def test_multiple_transactions(server):
+    authenticate_tx_id = authenticate()
+    facade.authorise(tx_id=authenticate_tx_id, amount=D('8.00'))
+    auth_tx_id = facade.authorise(tx_id=authenticate_tx_id, amount=D('2.00'))
+    refund_tx_id = facade.refund(auth_tx_id)
+
+    refund = server.simulator.transaction(refund_tx_id)
+    assert refund['related'] == auth_tx_id
+    assert refund['amount'] == D('2.00')
+    assert models.RequestResponse.objects.filter(
+        outcome=models.OUTCOME_SUCCESS).count() == 4
+
+
+@pytest.mark.django_db
+def test_void(server):
+    auth_tx_id = facade.authorise(tx_id=authenticate())
+    facade.void(auth_tx_id)
+    assert server.simulator.transaction(auth_tx_id)['voided']
+    with pytest.raises(payment_exceptions.PaymentError):
+        facade.refund(auth_tx_id)
+
+
+@pytest.mark.django_db
+def test_authorising_too_much_is_rejected(server):
+    with pytest.raises(payment_exceptions.PaymentError) as excinfo:
+        facade.authorise(tx_id=authenticate(), amount=D('11.51'))
+    assert 'Amount' in str(excinfo.value)
+
+
+@pytest.mark.django_db
+def test_missing_fields_are_malformed(server):
+    response = gateway.authenticate(AMT, CURRENCY)
+    assert response.status == 'MALFORMED'
+    assert 'Description' in response.status_detail
+
+
+def test_retried_requests_are_repeated():
+    sim = simulator.Simulator()
+    params = {'VPSProtocol': '3.00', 'TxType': 'AUTHENTICATE',
+              'Vendor': 'dummy', 'VendorTxCode': 'oscar-1'}
+    for field in simulator.REQUIRED_FIELDS['AUTHENTICATE']:
+        params[field] = 'GB'
+    params.update(Amount='10.00', Currency='GBP', CardNumber=BANKCARD.number,
+                  CardType='VISA', ExpiryDate='0120')
+    first = dict(sim.process(simulator.REGISTER_PATH, params))
+    assert first['Status'] == 'REGISTERED'
+    repeated = dict(sim.process(simulator.REGISTER_PATH, params))
+    assert repeated['Status'] == 'REGISTERED'
+    assert repeated['VPSTxId'] == first['VPSTxId']
+
+    params.update(TxType='AUTHORISE', VendorTxCode='oscar-2',
+                  RelatedVPSTxId=first['VPSTxId'],
+                  RelatedVendorTxCode='oscar-1',
+                  RelatedSecurityKey=first['SecurityKey'])
+    authorised = dict(sim.process(simulator.AUTHORISE_PATH, params))
+    assert authorised['Status'] == 'OK'
+    repeated = dict(sim.process(simulator.AUTHORISE_PATH, params))
+    assert repeated['Status'] == 'OK REPEATED'
+    assert repeated['VPSTxId'] == authorised['VPSTxId']
+
+
+@pytest.mark.django_db
+def test_unavailable_profile_returns_503(server):
+    server.simulator.profile = simulator.PROFILES['outage']
+    with pytest.raises(exceptions.GatewayError) as excinfo:
+        gateway.authenticate(AMT, CURRENCY)
+    assert '503' in str(excinfo.value)
+
+
+@pytest.mark.django_db
+def test_hanging_responses_time_out(server):
+    server.simulator.profile = simulator.Profile(hang_rate=1, hang=1)
+    with mock.patch('oscar_sagepay.config.HTTP_READ_TIMEOUT', 0.1):
+        with pytest.raises(exceptions.GatewayTimeout):
+            gateway.authenticate(AMT, CURRENCY)
@@ -0,0 +1,111 @@
+import os
+
+import mock
+
+from oscar_sagepay import metrics
+
+
+def test_requests_are_counted_by_tx_type_and_status():
+    registry = metrics.Registry()
+    registry.started('AUTHORISE')
+    registry.finished('AUTHORISE', 'OK', 0.2)
+    registry.started('AUTHORISE')
+    registry.finished('AUTHORISE', None, 40)
+    output = registry.export()
+    assert ('sagepay_requests_total{tx_type="AUTHORISE",status="OK"} 1'
+            in output)
+    assert ('sagepay_requests_total{tx_type="AUTHORISE",status="HTTP_ERROR"} 1'
+            in output)
+
+
+def test_latency_histogram_is_cumulative():
+    registry = metrics.Registry(buckets=(0.1, 1.0))
+    for duration in (0.05, 0.5, 5):
+        registry.started('REFUND')
+        registry.finished('REFUND', 'OK', duration)
+    lines = registry.export().splitlines()
+    assert 'sagepay_request_duration_seconds_bucket{tx_type="REFUND",' \
+        'le="0.1"} 1' in lines
+    assert 'sagepay_request_duration_seconds_bucket{tx_type="REFUND",' \
+        'le="1.0"} 2' in lines
+    assert 'sagepay_request_duration_seconds_bucket{tx_type="REFUND",' \
+        'le="+Inf"} 3' in lines
+    assert 'sagepay_request_duration_seconds_count{tx_type="REFUND"} 3' \
+        in lines
+
+
+def test_requests_in_flight_are_tracked():
+    registry = metrics.Registry()
+    registry.started('VOID')
+    assert 'sagepay_requests_in_flight{tx_type="VOID"} 1' in registry.export()
+
+
+def test_label_values_are_escaped():
+    registry = metrics.Registry()
+    registry.started('PAY"MENT')
+    registry.finished('PAY"MENT', 'a\\b\nc', 0.2)
+    assert ('sagepay_requests_total{tx_type="PAY\\"MENT",status="a\\\\b\\nc"} 1'
+            in registry.export())
+
+
+def test_metrics_are_written_when_flushed(tmpdir):
+    registry = metrics.Registry(str(tmpdir), flush_interval=60)
+    registry.started('AUTHORISE')
+    registry.finished('AUTHORISE', 'OK', 0.2)
+    assert not tmpdir.listdir()
+    registry.flush()
+    assert len(tmpdir.listdir()) == 1
+
+
+def record_dead_process(directory, token='1-100'):
+    """
+    Write the metrics of another process, which has since exited
+    """
+    other = metrics.Registry(directory, flush_interval=60)
+    with mock.patch('oscar_sagepay.processes.token', return_value=token):
+        other.started('AUTHORISE')
+        other.started('AUTHORISE')
+        other.finished('AUTHORISE', 'OK', 0.2)
+        other.flush()
+
+
+def is_alive(token):
+    return token not in ('1-100', '2-100')
+
+
+def test_metrics_of_all_processes_are_combined(tmpdir):
+    directory = str(tmpdir)
+    registry = metrics.Registry(directory, flush_interval=60)
+    registry.started('AUTHORISE')
+    registry.finished('AUTHORISE', 'OK', 0.2)
+    record_dead_process(directory)
+    with mock.patch('oscar_sagepay.processes.is_alive', side_effect=is_alive):
+        output = registry.export()
+    assert ('sagepay_requests_total{tx_type="AUTHORISE",status="OK"} 2'
+            in output)
+    assert 'sagepay_requests_in_flight{tx_type="AUTHORISE"} 0' in output
+
+
+def test_files_of_exited_processes_are_merged(tmpdir):
+    directory = str(tmpdir)
+    registry = metrics.Registry(directory, flush_interval=60)
+    record_dead_process(directory)
+    with mock.patch('oscar_sagepay.processes.is_alive', side_effect=is_alive):
+        registry.export()
+        assert not tmpdir.join('sagepay-1-100.json').check()
+        record_dead_process(directory, '2-100')
+        output = registry.export()
+    assert ('sagepay_requests_total{tx_type="AUTHORISE",status="OK"} 2'
+            in output)
+
+
+def test_files_merged_before_a_crash_are_not_counted_twice(tmpdir):
+    directory = str(tmpdir)
+    registry = metrics.Registry(directory, flush_interval=60)
+    record_dead_process(directory)
+    with mock.patch('oscar_sagepay.processes.is_alive', side_effect=is_alive):
+        with mock.patch('os.remove'):
+            registry.export()
+        output = registry.export()
+    assert ('sagepay_requests_total{tx_type="AUTHORISE",status="OK"} 1'
+            in output)
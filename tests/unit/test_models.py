@@ -1,4 +1,9 @@
-from oscar_sagepay import models
+from django.db import connection
+import mock
+import pytest
+
+from oscar_sagepay import models, wrappers
+from tests import responses
 
 
 def test_audit_model_records_key_request_params_as_fields():
@@ -55,3 +60,63 @@ def test_audit_model_obscures_cardholder_data():
     assert instance.raw_request['ExpiryDate'] == '<removed>'
     assert instance.raw_request['CV2'] == '<removed>'
     assert instance.raw_request['CardType'] == '<removed>'
+
+
+@pytest.mark.django_db
+def test_audit_model_response_is_saved_in_one_update(settings):
+    instance = models.RequestResponse.new('100001', {
+        'VPSProtocol': '3.0',
+        'TxType': 'PAYMENT',
+        'Vendor': 'oscar',
+        'VendorTxCode': 'req_1',
+    })
+    instance.record_response(wrappers.Response('req_1', responses.OK))
+    # Queries are only logged in debug mode
+    settings.DEBUG = True
+    num_queries = len(connection.queries)
+    instance.save_response()
+    queries = connection.queries[num_queries:]
+    assert len(queries) == 1
+    assert 'UPDATE' in queries[0]['sql']
+    assert 'raw_request_json' not in queries[0]['sql']
+
+    instance = models.RequestResponse.objects.get(pk=instance.pk)
+    assert instance.status == 'OK'
+    assert instance.vendor_tx_code == 'req_1'
+
+
+def test_audit_model_stores_outcome_of_response():
+    instance = models.RequestResponse()
+    instance.record_response(wrappers.Response('req_1', responses.MALFORMED))
+    assert instance.outcome == models.OUTCOME_ERROR
+    assert instance.status_code == 3009
+
+
+def test_responses_without_a_status_are_stored_as_errors():
+    instance = models.RequestResponse()
+    instance.record_response(wrappers.Response('req_1', 'Garbage'))
+    assert instance.outcome == models.OUTCOME_ERROR
+    with mock.patch('oscar_sagepay.wrappers.Response') as response:
+        assert instance.is_error
+    assert not response.called
+
+
+def test_audit_model_outcome_is_read_without_parsing_response():
+    instance = models.RequestResponse(
+        outcome=models.OUTCOME_SUCCESS, raw_response=responses.OK)
+    with mock.patch('oscar_sagepay.wrappers.Response') as response:
+        assert instance.is_successful
+        assert not instance.is_error
+    assert not response.called
+
+
+def test_audit_model_without_outcome_falls_back_to_response():
+    instance = models.RequestResponse(raw_response=responses.REGISTERED)
+    assert instance.is_successful
+    assert not instance.is_error
+
+
+def test_audit_model_without_response_is_error():
+    instance = models.RequestResponse()
+    assert instance.is_error
+    assert not instance.is_successful
@@ -0,0 +1,82 @@
+import datetime
+
+import pytest
+
+from oscar_sagepay import models
+from oscar_sagepay.dashboard import pagination
+
+
+@pytest.fixture
+def txns():
+    # Pairs of transactions share a request datetime so the ID is needed to
+    # order them.
+    start = datetime.datetime(2014, 1, 1, 12, 0)
+    for i in range(7):
+        models.RequestResponse.objects.create(
+            vendor_tx_code='tx-%d' % i,
+            request_datetime=start + datetime.timedelta(seconds=i // 2))
+    return models.RequestResponse.objects.all()
+
+
+def codes(page):
+    return [txn.vendor_tx_code for txn in page.object_list]
+
+
+@pytest.mark.django_db
+def test_pages_forwards_through_all_transactions(txns):
+    paginator = pagination.KeysetPaginator(txns, 3)
+    page = paginator.page()
+    assert codes(page) == ['tx-6', 'tx-5', 'tx-4']
+    assert not page.has_previous
+    page = paginator.page(after=page.next_cursor)
+    assert codes(page) == ['tx-3', 'tx-2', 'tx-1']
+    page = paginator.page(after=page.next_cursor)
+    assert codes(page) == ['tx-0']
+    assert not page.has_next
+    assert page.has_previous
+
+
+@pytest.mark.django_db
+def test_pages_backwards(txns):
+    paginator = pagination.KeysetPaginator(txns, 3)
+    page = paginator.page(after=paginator.page().next_cursor)
+    page = paginator.page(after=page.next_cursor)
+    page = paginator.page(before=page.previous_cursor)
+    assert codes(page) == ['tx-3', 'tx-2', 'tx-1']
+    page = paginator.page(before=page.previous_cursor)
+    assert codes(page) == ['tx-6', 'tx-5', 'tx-4']
+    assert not page.has_previous
+
+
+@pytest.mark.django_db
+def test_transactions_without_a_request_datetime_are_listed_last(txns):
+    for code in ('undated-1', 'undated-2'):
+        models.RequestResponse.objects.create(vendor_tx_code=code)
+    paginator = pagination.KeysetPaginator(
+        models.RequestResponse.objects.all(), 3)
+    pages = [paginator.page()]
+    while pages[-1].has_next:
+        pages.append(paginator.page(after=pages[-1].next_cursor))
+    assert [codes(page) for page in pages] == [
+        ['tx-6', 'tx-5', 'tx-4'], ['tx-3', 'tx-2', 'tx-1'],
+        ['tx-0', 'undated-2', 'undated-1']]
+    page = paginator.page(after=pages[1].previous_cursor)
+    assert codes(page) == ['tx-2', 'tx-1', 'tx-0']
+    page = paginator.page(after=page.next_cursor)
+    assert codes(page) == ['undated-2', 'undated-1']
+    page = paginator.page(before=page.previous_cursor)
+    assert codes(page) == ['tx-2', 'tx-1', 'tx-0']
+    page = paginator.page(before=pagination.encode_cursor(
+        pages[-1].object_list[-1]))
+    assert codes(page) == ['tx-1', 'tx-0', 'undated-2']
+
+
+@pytest.mark.django_db
+def test_invalid_cursors_return_the_first_page(txns):
+    paginator = pagination.KeysetPaginator(txns, 3)
+    assert codes(paginator.page(after='rubbish')) == [
+        'tx-6', 'tx-5', 'tx-4']
+
+
+def test_estimated_count_needs_postgres():
+    assert pagination.estimated_count(models.RequestResponse) is None
@@ -42,3 +42,31 @@ def test_registered_response_is_not_successful(registered_response):
 
 def test_registered_response_is_registered(registered_response):
     assert registered_response.is_registered
+
+
+def test_response_returns_default_for_missing_params(response):
+    assert response.param('VPSTxId') is None
+    assert response.tx_id == ''
+
+
+def test_response_does_not_match_keys_inside_other_keys():
+    response = Response('test_1', responses.OK)
+    assert response.tx_id == '{0E86E19A-4B7B-476A-ADEB-60E8A13F75A9}'
+    assert response.param('TxId') is None
+
+
+def test_response_strips_trailing_whitespace_from_last_param():
+    response = Response('test_1', responses.OK)
+    assert response.param('CV2Result') == 'NOTCHECKED'
+
+
+def test_response_accepts_bytes():
+    response = Response('test_1', responses.OK.encode('utf-8'))
+    assert response.is_ok
+    assert response.security_key == 'LPGESWTU38'
+
+
+def test_empty_response_is_error():
+    response = Response('test_1', '')
+    assert response.is_error
+    assert not response.is_successful
@@ -0,0 +1,74 @@
+import mock
+import pytest
+import requests
+
+from oscar_sagepay import exceptions, gateway, models, retries, wrappers
+from tests import responses
+from tests.conftest import URL, http_response
+
+REPEATED = responses.OK.replace('Status=OK', 'Status=OK REPEATED')
+
+
+@pytest.mark.django_db
+def test_transient_errors_are_retried_with_the_same_vendor_tx_code(policies):
+    with mock.patch('oscar_sagepay.transport.post') as post:
+        post.side_effect = [requests.exceptions.ConnectionError('Reset'),
+                            http_response(REPEATED)]
+        response = gateway._request(URL, 'AUTHORISE', {}, '100001')
+    assert response.is_ok
+    codes = set(args[1]['VendorTxCode'] for args, __ in post.call_args_list)
+    assert len(codes) == 1
+    rr = models.RequestResponse.objects.get()
+    assert rr.attempts == 2
+    assert 'Attempt 1: HTTP error: Reset' in rr.attempt_errors
+
+
+@pytest.mark.django_db
+def test_unavailable_responses_are_retried(policies):
+    with mock.patch('oscar_sagepay.transport.post') as post:
+        post.side_effect = [http_response('', 503), http_response()]
+        gateway._request(URL, 'AUTHORISE', {}, '100001')
+    assert post.call_count == 2
+
+
+@pytest.mark.django_db
+def test_attempts_are_limited(policies):
+    with mock.patch('oscar_sagepay.transport.post') as post:
+        post.side_effect = requests.exceptions.Timeout('Timed out')
+        with pytest.raises(exceptions.GatewayError):
+            gateway._request(URL, 'AUTHORISE', {}, '100001')
+    assert post.call_count == 3
+    assert models.RequestResponse.objects.get().attempts == 3
+
+
+@pytest.mark.django_db
+def test_other_errors_are_not_retried(policies):
+    with mock.patch('oscar_sagepay.transport.post') as post:
+        post.side_effect = requests.exceptions.InvalidURL('Bad URL')
+        with pytest.raises(exceptions.GatewayError):
+            gateway._request(URL, 'AUTHORISE', {}, '100001')
+    assert post.call_count == 1
+
+
+@pytest.mark.django_db
+def test_tx_types_without_a_policy_are_not_retried(policies):
+    with mock.patch('oscar_sagepay.transport.post') as post:
+        post.side_effect = requests.exceptions.ConnectionError('Reset')
+        with pytest.raises(exceptions.GatewayError):
+            gateway._request(URL, 'REFUND', {}, '100001')
+    assert post.call_count == 1
+
+
+def test_backoff_is_capped():
+    policy = retries.RetryPolicy(attempts=10, backoff=1.0, max_backoff=4.0)
+    assert all(0 <= retries.delay(policy, 8) <= 4.0 for __ in range(20))
+
+
+def test_ok_repeated_responses_are_ok():
+    assert wrappers.Response('tx', REPEATED).is_ok
+
+
+def test_requests_are_sent_at_least_once():
+    with mock.patch('oscar_sagepay.config.RETRY_POLICIES',
+                    {'AUTHORISE': {'attempts': 0}}):
+        assert retries.get_policy('AUTHORISE').attempts == 1
@@ -0,0 +1,108 @@
+import datetime
+from decimal import Decimal as D
+
+import mock
+import pytest
+
+from oscar_sagepay import models, rollups
+from oscar_sagepay.dashboard import views
+
+DAY = datetime.datetime(2014, 3, 1)
+
+
+def create(status, hour, response_ms, amount=D('10.00')):
+    requested = DAY + datetime.timedelta(hours=hour)
+    models.RequestResponse.objects.create(
+        tx_type='PAYMENT', currency='GBP', status=status, amount=amount,
+        request_datetime=requested,
+        response_datetime=requested + datetime.timedelta(
+            milliseconds=response_ms))
+
+
+@pytest.fixture
+def txns():
+    for response_ms in range(100, 1100, 100):
+        create('OK', 10, response_ms)
+    create('OK', 11, 2000)
+    create('INVALID', 11, 50, amount=None)
+
+
+def test_percentiles_use_nearest_rank():
+    values = range(1, 101)
+    assert rollups.percentile(values, 0.5) == 50
+    assert rollups.percentile(values, 0.95) == 95
+    assert rollups.percentile([7], 0.95) == 7
+
+
+@pytest.mark.django_db
+def test_daily_rollups_aggregate_each_status(txns):
+    rollups.rebuild_day(DAY)
+    ok = models.RequestRollup.objects.get(
+        period=models.RequestRollup.DAY, status='OK')
+    assert ok.period_start == DAY
+    assert ok.num_requests == 11
+    assert ok.amount == D('110.00')
+    assert ok.p50_response_ms == 600
+    assert ok.p95_response_ms == 2000
+    assert ok.max_response_ms == 2000
+    invalid = models.RequestRollup.objects.get(
+        period=models.RequestRollup.DAY, status='INVALID')
+    assert invalid.amount == D('0.00')
+
+
+@pytest.mark.django_db
+def test_hourly_rollups_are_created(txns):
+    rollups.rebuild_day(DAY)
+    hours = models.RequestRollup.objects.filter(
+        period=models.RequestRollup.HOUR, status='OK')
+    assert sorted((r.period_start.hour, r.num_requests) for r in hours) == [
+        (10, 10), (11, 1)]
+
+
+@pytest.mark.django_db
+def test_rebuilding_is_idempotent(txns):
+    rollups.rebuild_day(DAY)
+    rollups.rebuild_day(DAY)
+    assert models.RequestRollup.objects.filter(
+        period=models.RequestRollup.DAY).count() == 2
+
+
+@pytest.mark.django_db
+@mock.patch('oscar_sagepay.rollups.now',
+            return_value=DAY + datetime.timedelta(hours=13))
+def test_catch_up_continues_from_latest_rollup(now, txns):
+    assert rollups.catch_up() == 12
+    create('OK', 12, 100)
+    rollups.catch_up()
+    ok = models.RequestRollup.objects.get(
+        period=models.RequestRollup.DAY, status='OK')
+    assert ok.num_requests == 12
+
+
+@pytest.mark.django_db
+def test_report_summarises_success_rates(txns):
+    rollups.rebuild_day(DAY)
+    summary = views._summarise(models.RequestRollup.objects.filter(
+        period=models.RequestRollup.DAY))
+    assert summary == [{'tx_type': 'PAYMENT', 'num_requests': 12,
+                        'num_successful': 11,
+                        'success_rate': 100.0 * 11 / 12}]
+
+
+@pytest.mark.django_db
+def test_archived_days_are_not_rebuilt(txns):
+    rollups.rebuild_day(DAY)
+    models.RequestResponse.objects.filter(status='INVALID').delete()
+    assert rollups.rebuild_day(DAY) == 0
+    invalid = models.RequestRollup.objects.filter(
+        period=models.RequestRollup.DAY, status='INVALID')
+    assert invalid.count() == 1
+
+
+@pytest.mark.django_db
+def test_rebuild_starts_from_oldest_transaction(txns):
+    days = []
+    rollups.rebuild(DAY - datetime.timedelta(days=30),
+                    DAY + datetime.timedelta(hours=1),
+                    progress=lambda day, num: days.append(day))
+    assert days == [DAY]
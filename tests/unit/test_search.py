@@ -0,0 +1,67 @@
+import mock
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from oscar_sagepay import models
+from oscar_sagepay.dashboard import forms, search, views
+
+
+@pytest.fixture
+def txns():
+    for vendor_tx_code, tx_id, reference in (
+            ('oscar-100001-000001', '{0E86E19A-4B7B}', '100001'),
+            ('oscar-100002-000002', '{F4CC513C-9436}', '100002')):
+        models.RequestResponse.objects.create(
+            vendor_tx_code=vendor_tx_code, tx_id=tx_id, reference=reference)
+    return models.RequestResponse.objects.all()
+
+
+def matches(qs, query):
+    return sorted(txn.reference for txn in search.search(qs, query))
+
+
+@pytest.mark.django_db
+def test_search_matches_prefixes(txns):
+    assert matches(txns, 'oscar-100001') == ['100001']
+    assert matches(txns, '10000') == ['100001', '100002']
+    assert matches(txns, '{F4CC') == ['100002']
+
+
+@pytest.mark.django_db
+def test_search_matches_tx_ids_without_braces(txns):
+    assert matches(txns, 'f4cc513c') == ['100002']
+
+
+@pytest.mark.django_db
+def test_search_does_not_match_substrings_by_default(txns):
+    assert matches(txns, '000002') == []
+
+
+def test_search_uses_substring_matching_when_enabled():
+    qs = mock.Mock()
+    with mock.patch.object(search, 'substring_search_enabled',
+                           return_value=True):
+        search.search(qs, 'abc')
+    filters = str(qs.filter.call_args[0][0])
+    assert 'vendor_tx_code__contains' in filters
+    assert 'startswith' not in filters
+
+
+def test_search_index_command_needs_postgres():
+    with pytest.raises(CommandError):
+        call_command('sagepay_search_indexes')
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('params,is_filtered', [
+    ({}, False),
+    ({'outcome': ''}, False),
+    ({'outcome': forms.NO_RESPONSE}, True),
+    ({'tx_type': 'REFUND'}, True),
+])
+def test_transaction_list_knows_when_it_is_filtered(params, is_filtered):
+    view = views.Transactions()
+    view.form = forms.TransactionSearch(params)
+    view.get_queryset()
+    assert view.is_filtered == is_filtered
@@ -0,0 +1,123 @@
+import time
+from decimal import Decimal as D
+
+import mock
+import pytest
+import requests
+
+from oscar_sagepay import exceptions, facade, gateway, models
+from tests.conftest import URL, http_response
+
+
+@pytest.mark.django_db
+def test_requests_use_configured_timeouts():
+    timeouts = {'AUTHORISE': {'connect': 2, 'read': 10}}
+    with mock.patch('oscar_sagepay.config.HTTP_TIMEOUTS', timeouts), \
+            mock.patch('oscar_sagepay.transport.post') as post:
+        post.return_value = http_response()
+        gateway._request(URL, 'AUTHORISE', {}, '100001')
+    assert post.call_args[1]['timeout'] == (2, 10)
+
+
+@pytest.mark.django_db
+def test_timeouts_are_capped_by_the_deadline():
+    with mock.patch('oscar_sagepay.transport.post') as post:
+        post.return_value = http_response()
+        gateway._request(URL, 'AUTHORISE', {}, '100001',
+                         deadline=time.time() + 1)
+    connect, read = post.call_args[1]['timeout']
+    assert 0 < connect <= 1 and 0 < read <= 1
+
+
+@pytest.mark.django_db
+def test_read_timeout_leaves_outcome_unknown():
+    with mock.patch('oscar_sagepay.transport.post') as post:
+        post.side_effect = requests.exceptions.ReadTimeout('Too slow')
+        with pytest.raises(exceptions.GatewayTimeout) as excinfo:
+            gateway._request(URL, 'AUTHORISE', {}, '100001')
+    assert excinfo.value.status == exceptions.GatewayTimeout.status
+    rr = models.RequestResponse.objects.get()
+    assert rr.outcome == models.OUTCOME_UNKNOWN
+    assert rr.status == 'TIMEOUT'
+    assert 'outcome unknown' in rr.status_detail
+
+
+@pytest.mark.django_db
+def test_no_request_is_sent_after_the_deadline():
+    with mock.patch('oscar_sagepay.transport.post') as post:
+        with pytest.raises(exceptions.GatewayError) as excinfo:
+            gateway._request(URL, 'AUTHORISE', {}, '100001',
+                             deadline=time.time() - 1)
+    assert not post.called
+    assert not isinstance(excinfo.value, exceptions.GatewayTimeout)
+
+
+@pytest.mark.django_db
+def test_retries_stop_at_the_deadline(policies):
+    with mock.patch('oscar_sagepay.transport.post') as post, \
+            mock.patch('oscar_sagepay.retries.delay', return_value=5):
+        post.side_effect = requests.exceptions.ConnectionError('Reset')
+        with pytest.raises(exceptions.GatewayTimeout):
+            gateway._request(URL, 'AUTHORISE', {}, '100001',
+                             deadline=time.time() + 1)
+    assert post.call_count == 1
+    rr = models.RequestResponse.objects.get()
+    assert rr.attempts == 1
+    assert rr.outcome == models.OUTCOME_UNKNOWN
+
+
+@pytest.mark.django_db
+def test_retries_use_the_time_left(policies):
+    with mock.patch('oscar_sagepay.transport.post') as post:
+        post.side_effect = [requests.exceptions.ConnectionError('Reset'),
+                            http_response()]
+        response = gateway._request(URL, 'AUTHORISE', {}, '100001',
+                                    deadline=time.time() + 10)
+    assert response.is_ok
+    first, second = [kwargs['timeout'] for __, kwargs in post.call_args_list]
+    assert second[1] <= first[1] <= 10
+
+
+@pytest.mark.django_db
+def test_facade_passes_deadline_to_gateway():
+    models.RequestResponse.objects.create(
+        vendor_tx_code='tx-1', tx_id='{A}', tx_type='AUTHORISE', status='OK')
+    deadline = time.time() + 10
+    with mock.patch('oscar_sagepay.gateway.void') as void:
+        facade.void('{A}', deadline=deadline)
+    assert void.call_args[1]['deadline'] == deadline
+
+
+@pytest.mark.django_db
+def test_connect_timeouts_have_a_known_outcome(policies):
+    with mock.patch('oscar_sagepay.transport.post') as post:
+        post.side_effect = requests.exceptions.ConnectTimeout('Unreachable')
+        with pytest.raises(exceptions.GatewayError) as excinfo:
+            gateway._request(URL, 'AUTHORISE', {}, '100001')
+    assert post.call_count == 3
+    assert not isinstance(excinfo.value, exceptions.GatewayTimeout)
+
+
+@pytest.mark.django_db
+def test_connect_timeout_after_read_timeout_leaves_outcome_unknown(policies):
+    with mock.patch('oscar_sagepay.transport.post') as post:
+        post.side_effect = [requests.exceptions.ReadTimeout('Too slow'),
+                            requests.exceptions.ConnectTimeout('Unreachable'),
+                            requests.exceptions.ConnectTimeout('Unreachable')]
+        with pytest.raises(exceptions.GatewayTimeout):
+            gateway._request(URL, 'AUTHORISE', {}, '100001')
+
+
+@pytest.mark.django_db
+def test_facade_raises_payment_timeout_with_the_transaction():
+    models.RequestResponse.objects.create(
+        vendor_tx_code='tx-1', tx_id='{A}', tx_type='AUTHORISE', status='OK',
+        amount=D('10.00'), currency='GBP')
+    with mock.patch('oscar_sagepay.transport.post') as post:
+        post.side_effect = requests.exceptions.ReadTimeout('Too slow')
+        with pytest.raises(exceptions.PaymentTimeout) as excinfo:
+            facade.refund('{A}')
+    assert excinfo.value.status == 'TIMEOUT'
+    rr = excinfo.value.request_response
+    assert rr.tx_type == 'REFUND'
+    assert rr.outcome == models.OUTCOME_UNKNOWN
@@ -0,0 +1,122 @@
+import datetime
+from decimal import Decimal as D
+
+import mock
+import pytest
+import requests
+from oscar.apps.payment import models as payment_models
+
+from oscar_sagepay import (
+    exceptions, facade, gateway, simulator, transport)
+from tests import factories, responses
+
+BANKCARD = payment_models.Bankcard(
+    name='Barry Chuckle', number='4111111111111111',
+    expiry_date=datetime.date.today())
+
+
+def setup_function(function):
+    transport.reset()
+
+
+def test_session_is_reused_within_a_process():
+    assert transport.get_session() is transport.get_session()
+
+
+def test_session_is_recreated_after_fork():
+    session = transport.get_session()
+    with mock.patch('os.getpid', return_value=-1):
+        assert transport.get_session() is not session
+
+
+def test_pooled_post_uses_session():
+    with mock.patch('oscar_sagepay.transport.get_session') as get_session:
+        transport.post('https://example.com', {'a': 1})
+    get_session.return_value.post.assert_called_with(
+        'https://example.com', {'a': 1}, timeout=None)
+
+
+def test_unpooled_post_uses_requests():
+    with mock.patch('oscar_sagepay.config.HTTP_POOL', False):
+        with mock.patch('requests.post') as post:
+            transport.post('https://example.com', {'a': 1})
+    post.assert_called_with('https://example.com', {'a': 1}, timeout=None)
+
+
+def test_timeouts_can_be_set_per_tx_type():
+    timeouts = {'AUTHORISE': {'read': 20}}
+    with mock.patch('oscar_sagepay.config.HTTP_TIMEOUTS', timeouts):
+        assert transport.get_timeout('AUTHORISE') == (5.0, 20)
+        assert transport.get_timeout('REFUND') == (5.0, 30.0)
+
+
+def test_timeouts_are_capped_by_remaining_time():
+    assert transport.get_timeout('AUTHORISE', 2.5) == (2.5, 2.5)
+
+
+@pytest.fixture
+def fake(request):
+    patchers = [
+        mock.patch('oscar_sagepay.config.TRANSPORT',
+                   'oscar_sagepay.transport.FakeTransport'),
+        mock.patch('oscar_sagepay.transport._transport', None)]
+    for patcher in patchers:
+        patcher.start()
+        request.addfinalizer(patcher.stop)
+    return transport.get_transport()
+
+
+def test_requests_transport_is_the_default():
+    assert isinstance(transport.get_transport(), transport.RequestsTransport)
+
+
+@pytest.mark.django_db
+def test_fake_transport_returns_scripted_responses(fake):
+    fake.script(responses.MALFORMED, (503, 'Unavailable'))
+    assert gateway.authenticate(D('10.00'), 'GBP').status == 'MALFORMED'
+    with pytest.raises(exceptions.GatewayError):
+        gateway.authenticate(D('10.00'), 'GBP')
+    assert len(fake.requests) == 2
+
+
+@pytest.mark.django_db
+def test_fake_transport_raises_scripted_errors(fake):
+    fake.script(requests.exceptions.ReadTimeout('Too slow'))
+    with pytest.raises(exceptions.GatewayTimeout):
+        gateway.authenticate(D('10.00'), 'GBP')
+
+
+@pytest.mark.django_db
+def test_fake_transport_simulates_full_payments(fake):
+    tx_id = facade.authenticate(
+        D('10.00'), 'GBP', BANKCARD, factories.ShippingAddress(),
+        factories.BillingAddress())
+    auth_tx_id = facade.authorise(tx_id)
+    assert facade.refund(auth_tx_id)
+    assert fake.simulator.transaction(auth_tx_id)['used'] == D('10.00')
+
+
+@pytest.fixture
+def server(request):
+    server = simulator.start()
+    request.addfinalizer(server.server_close)
+    request.addfinalizer(server.shutdown)
+    return server
+
+
+def test_urllib3_transport_posts_form(server):
+    urllib3_transport = transport.Urllib3Transport()
+    response = urllib3_transport.post(
+        server.url + simulator.REGISTER_PATH,
+        {'VPSProtocol': '3.00', 'TxType': 'AUTHENTICATE',
+         'Vendor': 'dummy', 'VendorTxCode': u'oscar-\xe9'})
+    assert response.status_code == 200
+    assert 'Status=MALFORMED' in response.content
+    assert response.elapsed is not None
+
+
+def test_urllib3_transport_raises_requests_errors():
+    urllib3_transport = transport.Urllib3Transport()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        # Nothing listens on port 1
+        urllib3_transport.post('http://127.0.0.1:1/', {}, timeout=(1, 1))
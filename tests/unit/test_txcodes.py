@@ -0,0 +1,96 @@
+import importlib
+
+import mock
+import pytest
+from django.db import IntegrityError, connection
+
+from oscar_sagepay import gateway, models, txcodes
+
+try:
+    from django.db.transaction import atomic
+except ImportError:
+    # Django < 1.6
+    from django.db.transaction import commit_on_success as atomic
+
+GENERATORS = (txcodes.SequenceGenerator, txcodes.ULIDGenerator,
+              txcodes.DatabaseSequenceGenerator)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('generator_class', GENERATORS)
+def test_codes_are_unique_and_fit_sagepays_limit(generator_class):
+    generator = generator_class()
+    codes = [generator('100001') for __ in range(2000)]
+    assert len(set(codes)) == len(codes)
+    for code in codes:
+        assert code.startswith('oscar-100001-')
+        assert len(code) <= txcodes.MAX_LENGTH
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('generator_class', GENERATORS)
+def test_long_references_are_shortened(generator_class):
+    generator = generator_class()
+    first, second = generator('x' * 50), generator('x' * 50)
+    assert len(first) == txcodes.MAX_LENGTH
+    assert first != second
+
+
+def test_codes_change_after_a_fork():
+    generator = txcodes.SequenceGenerator()
+    parent = generator('100001')
+    with mock.patch('os.getpid', return_value=99999):
+        child = generator('100001')
+    assert child != parent
+    assert txcodes.encode(99999, length=4) in child
+
+
+def test_ulids_are_ordered():
+    generator = txcodes.ULIDGenerator()
+    codes = [generator('100001').rsplit('-', 1)[1] for __ in range(1000)]
+    assert codes == sorted(codes)
+    assert all(len(code) == 26 for code in codes)
+
+
+@pytest.mark.django_db
+def test_database_sequence_only_queries_once_per_block():
+    generator = txcodes.DatabaseSequenceGenerator()
+    for __ in range(generator.block_size + 1):
+        generator('100001')
+    assert models.VendorTxCodeBlock.objects.count() == 2
+
+
+def test_gateway_uses_configured_generator():
+    path = 'oscar_sagepay.txcodes.ULIDGenerator'
+    with mock.patch('oscar_sagepay.config.TX_CODE_GENERATOR', path), \
+            mock.patch('oscar_sagepay.txcodes._generator', None):
+        code = gateway._vendor_tx_code('100001')
+    assert len(code.rsplit('-', 1)[1]) == 26
+
+
+@pytest.mark.django_db
+def test_duplicate_codes_are_rejected_by_index(request):
+    south_db = pytest.importorskip('south.db')
+    module = importlib.import_module(
+        'oscar_sagepay.migrations.0012_add_unique_vendor_tx_code_index')
+    if south_db.db.backend_name not in ('postgres', 'sqlite3'):
+        pytest.skip("No unique index for %s" % south_db.db.backend_name)
+    module.Migration().forwards(None)
+
+    def drop_index():
+        # SQLite commits before DDL statements, so the index outlives the
+        # test's transaction
+        connection.cursor().execute(
+            'DROP INDEX IF EXISTS %s' % module.UNIQUE_INDEX)
+    request.addfinalizer(drop_index)
+    models.RequestResponse.objects.create(
+        vendor_tx_code='tx-1', tx_type=gateway.TXTYPE_VOID)
+    models.RequestResponse.objects.create(
+        vendor_tx_code='tx-1', tx_type=gateway.TXTYPE_VOID)
+    models.RequestResponse.objects.create(
+        vendor_tx_code='tx-1', tx_type=gateway.TXTYPE_AUTHORISE)
+    with pytest.raises(IntegrityError):
+        # In a savepoint so that the index can be dropped afterwards
+        with atomic():
+            models.RequestResponse.objects.create(
+                vendor_tx_code='tx-1', tx_type=gateway.TXTYPE_AUTHORISE)